@@ -3,10 +3,31 @@
 # Exit immediately if a command exits with a non-zero status.
 set -e
 
+# SERVER_MODE selects how the app is served:
+#   wsgi (default) - sync Gunicorn workers, one request per worker at a time
+#   asgi           - Uvicorn workers; async views (lists, analytics, export) share each worker's event loop
+SERVER_MODE="${SERVER_MODE:-wsgi}"
+case "$SERVER_MODE" in
+    wsgi) SERVER_ARGS="shoptrack.wsgi:application" ;;
+    asgi) SERVER_ARGS="--worker-class uvicorn_worker.UvicornWorker shoptrack.asgi:application" ;;
+    *)
+        echo "Unknown SERVER_MODE '$SERVER_MODE' (expected 'wsgi' or 'asgi')." >&2
+        exit 1
+        ;;
+esac
+
 # Apply database migrations
 echo "Applying database migrations..."
 python manage.py migrate --noinput
 
-# Start Gunicorn server
-echo "Starting Gunicorn..."
-exec gunicorn --bind 0.0.0.0:8000 --workers 2 shoptrack.wsgi:application
\ No newline at end of file
+# Keep future partitions of the shopping record table in place (no-op unless it was partitioned)
+python manage.py partition_records create
+
+# Workers write their metrics to files in this directory so /api/metrics/ reports all of them
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/shoptrack-metrics}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+
+# Start Gunicorn server (gunicorn.conf.py is read from the working directory)
+echo "Starting Gunicorn ($SERVER_MODE)..."
+exec gunicorn --bind 0.0.0.0:8000 --workers 2 $SERVER_ARGS
@@ -0,0 +1,6 @@
+from prometheus_client import multiprocess
+
+
+def child_exit(server, worker):
+    # 終了したワーカーのプールのゲージを合計から外す (カウンターはそのまま残る)
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,243 @@
+import calendar
+from collections import deque
+from decimal import Decimal
+from itertools import groupby
+from operator import itemgetter
+
+from django.db.models import Avg, Count, ExpressionWrapper, F, FloatField, Max, Min, RowRange, Sum, Value, Window
+from django.db.models.functions import Cast, TruncMonth, TruncWeek
+
+from .models import DailySpend, MonthlySpend, ShoppingRecord
+
+# group_by key -> (id lookup, name lookup) on ShoppingRecord
+GROUP_BY_FIELDS = {
+    "month": ("month", None),
+    "category": ("product__category_id", "product__category__name"),
+    "store": ("store_id", "store__name"),
+    "manufacturer": ("product__manufacturer_id", "product__manufacturer__name"),
+}
+
+# group_by key -> (id lookup, name lookup) on the rollup tables
+ROLLUP_GROUP_BY_FIELDS = {
+    "month": ("month", None),
+    "category": ("category_id", "category__name"),
+    "store": ("store_id", "store__name"),
+}
+
+# Engines selectable with the analytics API's `engine` parameter (see records.columnar)
+ANALYTICS_ENGINES = ("sql", "columnar")
+
+QUANTITY_PLACES = Decimal("0.001")
+UNIT_PRICE_PLACES = Decimal("0.01")
+# Floating point keeps price / quantity from becoming integer division on SQLite;
+# results are rounded to UNIT_PRICE_PLACES anyway.
+UNIT_PRICE_FIELD = FloatField()
+
+
+def unit_price(total_price, total_quantity):
+    """
+    Returns the quantity-weighted average unit price, or None for zero quantity.
+    """
+    if not total_quantity:
+        return None
+    return (Decimal(total_price) / total_quantity).quantize(UNIT_PRICE_PLACES)
+
+
+def is_month_range(start_date, end_date):
+    """
+    Returns True if the range starts and ends on month boundaries.
+    """
+    starts_on_month = start_date is None or start_date.day == 1
+    ends_on_month = end_date is None or end_date.day == calendar.monthrange(end_date.year, end_date.month)[1]
+    return starts_on_month and ends_on_month
+
+
+def summary_rows(queryset, fields, group_by, aggregates):
+    """
+    Returns the GROUP BY `.values()` queryset for the given group keys.
+
+    Without keys, a single row totals the whole queryset; its `count` is
+    zero (or None) when nothing matched.
+    """
+    lookups = []
+    for key in group_by:
+        lookups.extend(lookup for lookup in fields[key] if lookup)
+    if not lookups:
+        # .values() を空で呼ぶと全列でグループ化されるため、定数列だけを選んで全体を1行に集計する
+        return queryset.annotate(grand_total=Value(1)).values("grand_total").annotate(**aggregates).order_by()
+    return queryset.values(*lookups).annotate(**aggregates).order_by(*lookups)
+
+
+def summary_result(row, fields, group_by):
+    """
+    Converts a `summary_rows` row into a summary dict.
+    """
+    result = {}
+    for key in group_by:
+        id_lookup, name_lookup = fields[key]
+        if name_lookup:
+            result[f"{key}_id"] = row[id_lookup]
+            result[key] = row[name_lookup]
+        else:
+            result[key] = row[id_lookup]
+    result.update(
+        total_price=row["total_price"],
+        total_quantity=Decimal(row["total_quantity"]).quantize(QUANTITY_PLACES),
+        count=row["count"],
+        avg_unit_price=unit_price(row["total_price"], row["total_quantity"]),
+    )
+    return result
+
+
+def spend_summary_rows(group_by, start_date=None, end_date=None):
+    """
+    Returns the GROUP BY queryset for `spend_summary` and the fields it groups on.
+
+    Groupings covered by the rollup tables read MonthlySpend when the range is
+    whole months and DailySpend otherwise; only `manufacturer` needs a scan of
+    ShoppingRecord.
+    """
+    if set(group_by) <= ROLLUP_GROUP_BY_FIELDS.keys():
+        aggregates = {
+            "total_price": Sum("total_price"),
+            "total_quantity": Sum("total_quantity"),
+            "count": Sum("count"),
+        }
+        if is_month_range(start_date, end_date):
+            queryset = MonthlySpend.objects.all()
+            if start_date:
+                queryset = queryset.filter(month__gte=start_date)
+            if end_date:
+                queryset = queryset.filter(month__lte=end_date)
+        else:
+            queryset = DailySpend.objects.all()
+            if start_date:
+                queryset = queryset.filter(date__gte=start_date)
+            if end_date:
+                queryset = queryset.filter(date__lte=end_date)
+            if "month" in group_by:
+                queryset = queryset.annotate(month=TruncMonth("date"))
+        return summary_rows(queryset, ROLLUP_GROUP_BY_FIELDS, group_by, aggregates), ROLLUP_GROUP_BY_FIELDS
+
+    queryset = ShoppingRecord.objects.all()
+    if start_date:
+        queryset = queryset.filter(purchase_date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(purchase_date__lte=end_date)
+    if "month" in group_by:
+        queryset = queryset.annotate(month=TruncMonth("purchase_date"))
+    aggregates = {"total_price": Sum("price"), "total_quantity": Sum("quantity"), "count": Count("id")}
+    return summary_rows(queryset, GROUP_BY_FIELDS, group_by, aggregates), GROUP_BY_FIELDS
+
+
+def spend_summary(group_by, start_date=None, end_date=None):
+    """
+    Aggregates spending grouped by the given GROUP_BY_FIELDS keys in one query.
+
+    Returns a list of dicts with the group keys (`<key>_id` and `<key>` name
+    for relations, `month` as a date) plus `total_price`, `total_quantity`,
+    `count` and `avg_unit_price`, ordered by the group keys.
+    """
+    rows, fields = spend_summary_rows(group_by, start_date, end_date)
+    return [summary_result(row, fields, group_by) for row in rows if row["count"]]
+
+
+async def aspend_summary(group_by, start_date=None, end_date=None):
+    """
+    Async version of `spend_summary`.
+    """
+    rows, fields = spend_summary_rows(group_by, start_date, end_date)
+    return [summary_result(row, fields, group_by) async for row in rows if row["count"]]
+
+
+PRICE_HISTORY_BUCKETS = {"week": TruncWeek, "month": TruncMonth}
+
+
+def unit_price_expression(price="price", quantity="quantity"):
+    """
+    Returns a `price / quantity` expression evaluated in floating point.
+    """
+    return ExpressionWrapper(
+        Cast(price, UNIT_PRICE_FIELD) / Cast(quantity, UNIT_PRICE_FIELD),
+        output_field=UNIT_PRICE_FIELD,
+    )
+
+
+def rolling(values, window):
+    """
+    Yields (average, minimum, maximum) over the last `window` values.
+    """
+    recent = deque(maxlen=window)
+    for value in values:
+        recent.append(value)
+        yield sum(recent) / len(recent), min(recent), max(recent)
+
+
+def product_price_history(product_id, bucket=None, window=5, start_date=None, end_date=None):
+    """
+    Returns the unit price time series of a product, ordered by store and date.
+
+    Without `bucket`, every purchase is a point and the rolling average, minimum
+    and maximum over the last `window` purchases of the same store are computed
+    with window functions in the database. With `bucket` (`week` or `month`),
+    purchases are grouped in the database into a quantity-weighted unit price
+    per store and bucket, and the rolling values are computed over the buckets
+    (SQL cannot apply a window to an aggregate in the same query, and the
+    bucketed series is small).
+    """
+    queryset = ShoppingRecord.objects.filter(product_id=product_id, quantity__gt=0)
+    if start_date:
+        queryset = queryset.filter(purchase_date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(purchase_date__lte=end_date)
+
+    if bucket:
+        rows = list(
+            queryset.annotate(date=PRICE_HISTORY_BUCKETS[bucket]("purchase_date"))
+            .values("store_id", "store__name", "date")
+            .annotate(
+                unit_price=unit_price_expression(Sum("price"), Sum("quantity")),
+                min_unit_price=Min(unit_price_expression()),
+                max_unit_price=Max(unit_price_expression()),
+                count=Count("id"),
+            )
+            .order_by("store_id", "date")
+        )
+        for _, store_rows in groupby(rows, key=itemgetter("store_id")):
+            store_rows = list(store_rows)
+            stats = rolling([row["unit_price"] for row in store_rows], window)
+            for row, (rolling_avg, rolling_min, rolling_max) in zip(store_rows, stats):
+                row.update(rolling_avg=rolling_avg, rolling_min=rolling_min, rolling_max=rolling_max)
+    else:
+        frame = RowRange(start=-(window - 1), end=0)
+        order_by = [F("purchase_date").asc(), F("id").asc()]
+        rows = (
+            queryset.annotate(date=F("purchase_date"), unit_price=unit_price_expression())
+            .annotate(
+                rolling_avg=Window(Avg("unit_price"), partition_by=[F("store_id")], order_by=order_by, frame=frame),
+                rolling_min=Window(Min("unit_price"), partition_by=[F("store_id")], order_by=order_by, frame=frame),
+                rolling_max=Window(Max("unit_price"), partition_by=[F("store_id")], order_by=order_by, frame=frame),
+            )
+            .values(
+                "id",
+                "store_id",
+                "store__name",
+                "date",
+                "price",
+                "quantity",
+                "unit_price",
+                "rolling_avg",
+                "rolling_min",
+                "rolling_max",
+            )
+            .order_by("store_id", *order_by)
+        )
+
+    results = []
+    for row in rows:
+        row["store"] = row.pop("store__name")
+        for key in ("unit_price", "min_unit_price", "max_unit_price", "rolling_avg", "rolling_min", "rolling_max"):
+            if row.get(key) is not None:
+                row[key] = Decimal(str(row[key])).quantize(UNIT_PRICE_PLACES)
+        results.append(row)
+    return results
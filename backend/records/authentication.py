@@ -0,0 +1,46 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt import settings as jwt_settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from . import reference_cache
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that reads the user through a per-worker cache.
+
+    Warm requests authenticate without a query. Saving or deleting a user
+    (deactivation, password change) clears this worker's cache through
+    `records.signals`; other workers pick the change up within
+    `AUTH_USER_CACHE_TTL` seconds. The cached instance is shared between
+    requests and must be treated as read-only.
+    """
+
+    def get_user(self, validated_token):
+        # override_settings で差し替えられた設定も読めるよう、モジュール経由で参照する
+        api_settings = jwt_settings.api_settings
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # キャッシュは主キーで引くため、USER_ID_FIELD が主キー以外ならDBから読む
+        if api_settings.USER_ID_FIELD != self.user_model._meta.pk.name:
+            return super().get_user(validated_token)
+
+        try:
+            user = reference_cache.caches[self.user_model].get(self.user_model._meta.pk.to_python(user_id))
+        except self.user_model.DoesNotExist:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,165 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, ProtectedError, Sum
+
+from . import price_index, reference_cache, rollups, versioning
+from .models import Product, ShoppingRecord
+
+
+def spend_totals(records):
+    """
+    Sums a ShoppingRecord queryset per rollup key in a single query.
+
+    Returns {(purchase_date, category_id, store_id): [total_price, total_quantity, count]}.
+    """
+    rows = (
+        records.values("purchase_date", "product__category_id", "store_id")
+        .annotate(total_price=Sum("price"), total_quantity=Sum("quantity"), count=Count("id"))
+        .order_by()
+    )
+    return {
+        (row["purchase_date"], row["product__category_id"], row["store_id"]): [
+            row["total_price"],
+            Decimal(row["total_quantity"]),
+            row["count"],
+        ]
+        for row in rows
+    }
+
+
+def lock(rows):
+    """
+    Locks the rows of a queryset until the end of the transaction with a single SELECT ... FOR UPDATE.
+
+    Returns the number of rows locked. Other writers of these rows wait,
+    so the totals read afterwards match what a write on the same filter changes.
+    """
+    # ID順にロックし、範囲の重なる一括編集どうしのデッドロックを避ける
+    locked = rows.select_for_update(of=("self",)).order_by("pk").values_list("pk", flat=True)
+    return sum(1 for _ in locked.iterator())
+
+
+def negate(totals):
+    return {key: [-value for value in values] for key, values in totals.items()}
+
+
+def changed_totals(totals, changes):
+    """
+    Returns spend_totals() as they will be after `changes` are applied to every record.
+    """
+    changed = {}
+    for (purchase_date, category_id, store_id), (price, quantity, count) in totals.items():
+        key = (
+            changes.get("purchase_date", purchase_date),
+            changes["product"].category_id if "product" in changes else category_id,
+            changes["store"].pk if "store" in changes else store_id,
+        )
+        value = changed.setdefault(key, [0, Decimal(0), 0])
+        value[0] += changes["price"] * count if "price" in changes else price
+        value[1] += Decimal(changes["quantity"]) * count if "quantity" in changes else quantity
+        value[2] += count
+    return changed
+
+
+def update_records(records, changes):
+    """
+    Applies `changes` (field name -> value) to every record of `records` with a single UPDATE.
+
+    `store` and `product` are model instances. The records are locked first
+    (see lock()) and the rollup tables are moved by the difference in
+    the same transaction. Returns the number of records updated.
+    """
+    with transaction.atomic():
+        if not lock(records):
+            return 0
+        # UPDATE はシグナルを送らないため、変更前の集計値から差分を求めて集計テーブルを更新する
+        totals = spend_totals(records)
+        updated = records.update(**changes)
+        deltas = [changed_totals(totals, changes), negate(totals)]
+        rollups.apply_deltas(rollups.merge_deltas(*deltas))
+        price_index.mark_stale((category_id, day) for delta in deltas for day, category_id, _ in delta)
+        versioning.bump(ShoppingRecord)
+    return updated
+
+
+def delete_records(records):
+    """
+    Deletes every record of `records` with a single DELETE and removes them from the rollup tables.
+
+    The records are locked first (see lock()). ShoppingRecord.objects.delete()
+    and ShoppingRecord.delete() come here too. Returns the number of records deleted.
+    """
+    with transaction.atomic():
+        if not lock(records):
+            return 0
+        totals = spend_totals(records)
+        # 記録には削除シグナルの受信側も参照するモデルもないため、Django は読み込まずに1文の DELETE を実行する
+        deleted, _ = models.QuerySet.delete(records)
+        rollups.apply_deltas(negate(totals))
+        versioning.bump(ShoppingRecord)
+    return deleted
+
+
+def update_products(products, changes):
+    """
+    Applies `changes` (field name -> value) to every product of `products` with a single UPDATE.
+
+    Related fields take model instances. When the category changes, the
+    products' spending is moved to it in the rollup tables; category and
+    unit changes mark the price index months of their records stale.
+    Returns the number of products updated.
+    """
+    totals = {}
+    with transaction.atomic():
+        if "category" in changes or "unit" in changes:
+            # 商品の行ロックは、その商品を参照する記録の追加・付け替え (外部キーの検査) も待たせる
+            lock(products)
+            totals = spend_totals(ShoppingRecord.objects.filter(product__in=products))
+        updated = products.update(**changes)
+        if updated:
+            if totals:
+                new_category_id = changes["category"].pk if "category" in changes else None
+                moved = {(day, new_category_id, store_id): value for (day, _, store_id), value in totals.items()}
+                if new_category_id is not None:
+                    rollups.apply_deltas(rollups.merge_deltas(moved, negate(totals)))
+                # 元の分類と移動先の分類の、記録のある月の価格指数を計算し直す
+                price_index.mark_stale(
+                    (category_id, day) for delta in [totals, moved] for day, category_id, _ in delta
+                )
+            versioning.bump(Product)
+    if updated:
+        reference_cache.invalidate(Product)
+    return updated
+
+
+def protecting_products(products):
+    """
+    Returns the sorted ids of the products of `products` that shopping records still refer to.
+    """
+    return sorted(
+        ShoppingRecord.objects.filter(product__in=products).values_list("product_id", flat=True).order_by().distinct()
+    )
+
+
+def delete_products(products):
+    """
+    Deletes every product of `products`, unless shopping records refer to any of them.
+
+    Returns (deleted count, protected product ids). Nothing is deleted when
+    some products are protected (`on_delete=PROTECT`). The table version and
+    the reference cache are updated by the post_delete receivers.
+    """
+    try:
+        with transaction.atomic():
+            protected = protecting_products(products)
+            if protected:
+                return 0, protected
+            deleted, _ = products.delete()
+    except (IntegrityError, ProtectedError):
+        # 確認の後に別のリクエストが記録を追加した場合 (外部キー制約はコミット時に検査される)
+        protected = protecting_products(products)
+        if not protected:
+            raise
+        return 0, protected
+    return deleted, []
@@ -0,0 +1,42 @@
+from django.db import connection
+
+from .models import ShoppingRecord
+
+COPY_SQL = "COPY {table} (price, purchase_date, quantity, store_id, product_id) FROM STDIN"
+
+
+def copy_records(records):
+    """
+    Loads (price, purchase_date, quantity, store_id, product_id) tuples with PostgreSQL COPY.
+
+    Bypasses per-row INSERT overhead.
+    """
+    sql = COPY_SQL.format(table=connection.ops.quote_name(ShoppingRecord._meta.db_table))
+    with connection.cursor() as cursor:
+        with cursor.copy(sql) as copy:
+            for record in records:
+                copy.write_row(record)
+
+
+def insert_records(records, use_copy, batch_size=1000):
+    """
+    Inserts (price, purchase_date, quantity, store_id, product_id) tuples with COPY or bulk_create.
+
+    Neither sends signals, so callers must update the rollup tables themselves.
+    """
+    if use_copy:
+        copy_records(records)
+        return
+    ShoppingRecord.objects.bulk_create(
+        [
+            ShoppingRecord(
+                price=price,
+                purchase_date=purchase_date,
+                quantity=quantity,
+                store_id=store_id,
+                product_id=product_id,
+            )
+            for price, purchase_date, quantity, store_id, product_id in records
+        ],
+        batch_size=batch_size,
+    )
@@ -0,0 +1,380 @@
+import math
+import threading
+import time
+from datetime import date
+from decimal import Decimal
+
+from django.conf import settings
+
+from . import versioning
+from .analytics import QUANTITY_PLACES, UNIT_PRICE_PLACES, unit_price
+from .models import Category, Manufacturer, Product, ShoppingRecord, Store
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# column -> dtype; quantity is kept in thousandths so that sums stay exact
+COLUMNS = {
+    "id": "int64",
+    "day": "int32",  # date.toordinal()
+    "month": "int32",  # year * 12 + month - 1
+    "price": "int64",
+    "quantity": "int64",
+    "product": "int32",
+    "store": "int32",
+}
+BYTES_PER_ROW = sum(int(dtype.removeprefix("int")) // 8 for dtype in COLUMNS.values())
+LOAD_CHUNK_SIZE = 50000
+# Code of a missing manufacturer (and of products the snapshot does not know)
+NO_VALUE = -1
+
+# group_by key -> model whose names label the groups
+GROUP_NAME_MODELS = {"category": Category, "store": Store, "manufacturer": Manufacturer}
+
+
+class Snapshot:
+    """
+    Column arrays of ShoppingRecord rows ordered by id, with per-product category/manufacturer maps.
+
+    Snapshots are never modified; refreshing builds a new one, so queries
+    running in other threads keep a consistent view.
+    """
+
+    def __init__(self, columns, record_version, loaded_at, products=None, product_version=None):
+        self.columns = columns
+        self.record_version = record_version
+        self.loaded_at = loaded_at
+        # product id -> category id / manufacturer id (NO_VALUE if unknown or missing)
+        self.category_of, self.manufacturer_of = products or (np.zeros(0, "int32"), np.zeros(0, "int32"))
+        self.product_version = product_version
+
+    def __len__(self):
+        return len(self.columns["id"])
+
+    @property
+    def max_id(self):
+        return int(self.columns["id"][-1]) if len(self) else 0
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self.columns.values())
+
+    def has_unknown_products(self, start=0):
+        """
+        Returns True if rows from index `start` on reference products missing from the maps.
+        """
+        products = self.columns["product"][start:]
+        if not len(products):
+            return False
+        return bool(products.max() >= len(self.category_of) or (self.category_of[products] == NO_VALUE).any())
+
+    def key_codes(self, key, rows):
+        """
+        Returns the `key` (month index or related id) of the rows selected by `rows` (a mask or slice).
+        """
+        if key == "month":
+            return self.columns["month"][rows]
+        if key == "store":
+            return self.columns["store"][rows]
+        lookup = self.category_of if key == "category" else self.manufacturer_of
+        return lookup[self.columns["product"][rows]]
+
+
+def load_columns(queryset):
+    """
+    Reads the snapshot columns of `queryset`'s records in id order, LOAD_CHUNK_SIZE rows per query.
+    """
+    chunks = []
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "purchase_date", "price", "quantity", "product_id", "store_id")[:LOAD_CHUNK_SIZE]
+        )
+        if not rows:
+            break
+        ids, dates, prices, quantities, products, stores = zip(*rows)
+        chunks.append(
+            {
+                "id": ids,
+                "day": [d.toordinal() for d in dates],
+                "month": [d.year * 12 + d.month - 1 for d in dates],
+                "price": prices,
+                "quantity": [int(quantity.scaleb(3)) for quantity in quantities],
+                "product": products,
+                "store": stores,
+            }
+        )
+        last_id = ids[-1]
+    return {
+        name: np.concatenate([np.asarray(chunk[name], dtype) for chunk in chunks]) if chunks else np.zeros(0, dtype)
+        for name, dtype in COLUMNS.items()
+    }
+
+
+def load_products():
+    """
+    Returns (category_of, manufacturer_of) arrays indexed by product id.
+    """
+    rows = list(Product.objects.values_list("id", "category_id", "manufacturer_id"))
+    size = max((row[0] for row in rows), default=0) + 1
+    category_of = np.full(size, NO_VALUE, "int32")
+    manufacturer_of = np.full(size, NO_VALUE, "int32")
+    for product_id, category_id, manufacturer_id in rows:
+        category_of[product_id] = category_id
+        if manufacturer_id is not None:
+            manufacturer_of[product_id] = manufacturer_id
+    return category_of, manufacturer_of
+
+
+def dense_rank(codes):
+    """
+    Returns (sorted distinct codes, index of each code in them), like `np.unique(codes, return_inverse=True)`.
+
+    Codes spanning a small range are counted with bincount in linear time
+    instead of being sorted.
+    """
+    low = int(codes.min())
+    span = int(codes.max()) - low + 1
+    if span > max(4 * len(codes), 1 << 20):
+        values, index = np.unique(codes, return_inverse=True)
+        return values, index.reshape(-1)
+    offsets = codes.astype("int64") - low
+    present = np.bincount(offsets, minlength=span) > 0
+    rank = np.cumsum(present) - 1
+    return np.flatnonzero(present) + low, rank[offsets]
+
+
+def factorize(codes):
+    """
+    Returns (distinct codes, index of each code) with NO_VALUE sorted last, like NULLs on PostgreSQL.
+    """
+    missing = int(codes.max()) + 1
+    values, index = dense_rank(np.where(codes == NO_VALUE, missing, codes))
+    return np.where(values == missing, NO_VALUE, values), index
+
+
+def group_rows(key_codes):
+    """
+    Groups rows by several code arrays.
+
+    Returns (number of groups, group index per row, [distinct codes per key for each group]),
+    with the groups in ascending key order.
+    """
+    factors = [factorize(codes) for codes in key_codes]
+    if len(factors) == 1:
+        values, index = factors[0]
+        return len(values), index, [values]
+    sizes = [len(values) for values, _ in factors]
+    if math.prod(sizes) < 2**62:
+        # 各キーの連番を1つの整数にまとめて一度にグループ化する
+        combined = np.zeros(len(key_codes[0]), "int64")
+        for (_, index), size in zip(factors, sizes):
+            combined = combined * size + index
+        groups, group_index = dense_rank(combined)
+        group_codes = []
+        for (values, _), size in reversed(list(zip(factors, sizes))):
+            group_codes.append(values[groups % size])
+            groups = groups // size
+        group_codes.reverse()
+    else:
+        groups, group_index = np.unique(np.stack([index for _, index in factors], axis=1), axis=0, return_inverse=True)
+        group_codes = [values[groups[:, i]] for i, (values, _) in enumerate(factors)]
+        group_index = group_index.reshape(-1)
+    return len(group_codes[0]), group_index, group_codes
+
+
+def group_percentiles(values, group_index, groups, percentiles):
+    """
+    Returns {percentile: array} of per-group percentiles of `values` (linear interpolation, NaN for empty groups).
+    """
+    if not percentiles:
+        return {}
+    # 値で並べてからグループで安定ソートする (16ビット整数の安定ソートは基数ソートで速い)
+    order = np.argsort(values)
+    group_dtype = "uint16" if groups <= 1 << 16 else "int64"
+    order = order[np.argsort(group_index[order].astype(group_dtype), kind="stable")]
+    values = values[order]
+    counts = np.bincount(group_index, minlength=groups)
+    starts = np.cumsum(counts) - counts
+    results = {}
+    for percentile in percentiles:
+        if not len(values):
+            results[percentile] = np.full(groups, np.nan)
+            continue
+        position = starts + np.maximum(counts - 1, 0) * percentile / 100
+        lower = np.minimum(np.floor(position).astype("int64"), len(values) - 1)
+        upper = np.minimum(lower + 1, np.maximum(starts + counts - 1, 0))
+        result = values[lower] + (values[upper] - values[lower]) * (position - lower)
+        results[percentile] = np.where(counts > 0, result, np.nan)
+    return results
+
+
+class ColumnarEngine:
+    """
+    A per-worker columnar snapshot of ShoppingRecord answering spend summaries in memory.
+
+    Every query first brings the snapshot up to date: records with an id above
+    its highest id are appended, while an update or delete of a record (which
+    bumps the ShoppingRecord table version) or a snapshot older than
+    ANALYTICS_SNAPSHOT_MAX_AGE seconds reloads it. The age limit also picks up
+    records committed out of id order. Products are mapped to their category
+    and manufacturer at query time, so product edits only reload that map.
+
+    The engine is unavailable (queries return None) without NumPy, or while
+    the rows would take more than ANALYTICS_SNAPSHOT_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.snapshot = None
+        self.unavailable_until = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        with self.lock:
+            self.snapshot = None
+            self.unavailable_until = 0
+
+    def refresh(self):
+        """
+        Returns an up-to-date Snapshot, or None if the engine is unavailable.
+        """
+        if np is None:
+            return None
+        record_version = versioning.current(ShoppingRecord)[0]
+        product_version = versioning.current(Product)[0]
+        now = time.monotonic()
+        with self.lock:
+            if now < self.unavailable_until:
+                return None
+            previous = self.snapshot
+            if (
+                previous is None
+                or previous.record_version != record_version
+                or now - previous.loaded_at >= settings.ANALYTICS_SNAPSHOT_MAX_AGE
+            ):
+                snapshot = self.load(record_version, now)
+                checked = 0
+            else:
+                snapshot = self.append(previous)
+                checked = len(previous)
+            if snapshot is not None and (
+                snapshot.product_version != product_version or snapshot.has_unknown_products(checked)
+            ):
+                snapshot = Snapshot(
+                    snapshot.columns, snapshot.record_version, snapshot.loaded_at, load_products(), product_version
+                )
+            self.snapshot = snapshot
+            if snapshot is None:
+                # 予算を超えている間は行数を数え直さない
+                self.unavailable_until = now + settings.ANALYTICS_SNAPSHOT_MAX_AGE
+            return snapshot
+
+    def within_budget(self, rows):
+        return rows * BYTES_PER_ROW <= settings.ANALYTICS_SNAPSHOT_MAX_BYTES
+
+    def load(self, record_version, now):
+        if not self.within_budget(ShoppingRecord.objects.count()):
+            return None
+        return Snapshot(load_columns(ShoppingRecord.objects.all()), record_version, now)
+
+    def append(self, snapshot):
+        added = load_columns(ShoppingRecord.objects.filter(id__gt=snapshot.max_id))
+        if not len(added["id"]):
+            return snapshot
+        if not self.within_budget(len(snapshot) + len(added["id"])):
+            return None
+        columns = {name: np.concatenate([snapshot.columns[name], added[name]]) for name in COLUMNS}
+        return Snapshot(
+            columns,
+            snapshot.record_version,
+            snapshot.loaded_at,
+            (snapshot.category_of, snapshot.manufacturer_of),
+            snapshot.product_version,
+        )
+
+    def spend_summary(self, group_by, start_date=None, end_date=None, percentiles=()):
+        """
+        Computes `analytics.spend_summary` from the snapshot.
+
+        Each `percentiles` value adds a `unit_price_p<value>` key with that
+        percentile of the per-purchase unit prices (`price / quantity`,
+        interpolated linearly) in the group. Returns None if the engine is
+        unavailable.
+        """
+        snapshot = self.refresh()
+        if snapshot is None:
+            return None
+        columns = snapshot.columns
+        # 期間の指定がなければ列をコピーせずにそのまま使う
+        rows = slice(None)
+        if start_date or end_date:
+            rows = np.ones(len(snapshot), dtype=bool)
+            if start_date:
+                rows &= columns["day"] >= start_date.toordinal()
+            if end_date:
+                rows &= columns["day"] <= end_date.toordinal()
+        prices = columns["price"][rows]
+        quantities = columns["quantity"][rows]
+        if not len(prices):
+            return []
+
+        key_codes = [snapshot.key_codes(key, rows) for key in group_by] or [np.zeros(len(prices), "int64")]
+        groups, group_index, group_codes = group_rows(key_codes)
+        counts = np.bincount(group_index, minlength=groups)
+        # 整数の合計は 2**53 未満なら float64 でも正確
+        total_prices = np.bincount(group_index, weights=prices, minlength=groups).round()
+        total_quantities = np.bincount(group_index, weights=quantities, minlength=groups).round()
+
+        purchased = quantities > 0
+        unit_prices = group_percentiles(
+            prices[purchased] * 1000 / quantities[purchased],
+            group_index[purchased],
+            groups,
+            percentiles,
+        )
+
+        names = {
+            key: dict(
+                GROUP_NAME_MODELS[key]
+                .objects.filter(pk__in=np.unique(codes[codes != NO_VALUE]).tolist())
+                .values_list("id", "name")
+            )
+            for key, codes in zip(group_by, group_codes)
+            if key in GROUP_NAME_MODELS
+        }
+        # 行ごとの組み立ては Python の値で行う (NumPy のスカラーは遅い)
+        key_columns = [(key, codes.tolist()) for key, codes in zip(group_by, group_codes)]
+        percentile_columns = [
+            (f"unit_price_p{percentile:g}", values.tolist()) for percentile, values in unit_prices.items()
+        ]
+        results = []
+        for i, (total_price, total_quantity, count) in enumerate(
+            zip(total_prices.astype("int64").tolist(), total_quantities.astype("int64").tolist(), counts.tolist())
+        ):
+            result = {}
+            for key, codes in key_columns:
+                code = codes[i]
+                if key == "month":
+                    result[key] = date(code // 12, code % 12 + 1, 1)
+                else:
+                    result[f"{key}_id"] = None if code == NO_VALUE else code
+                    result[key] = names[key].get(code)
+            total_quantity = Decimal(total_quantity).scaleb(-3)
+            result.update(
+                total_price=total_price,
+                total_quantity=total_quantity.quantize(QUANTITY_PLACES),
+                count=count,
+                avg_unit_price=unit_price(total_price, total_quantity),
+            )
+            for name, values in percentile_columns:
+                value = values[i]
+                result[name] = None if math.isnan(value) else Decimal(str(value)).quantize(UNIT_PRICE_PLACES)
+            results.append(result)
+        return results
+
+
+engine = ColumnarEngine()
@@ -0,0 +1,98 @@
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+# (output column, ORM lookup) pairs; names are flattened through joins
+EXPORT_COLUMNS = [
+    ("id", "id"),
+    ("purchase_date", "purchase_date"),
+    ("price", "price"),
+    ("quantity", "quantity"),
+    ("product", "product__name"),
+    ("category", "product__category__name"),
+    ("unit", "product__unit__name"),
+    ("manufacturer", "product__manufacturer__name"),
+    ("origin", "product__origin__name"),
+    ("store", "store__name"),
+    ("store_location", "store__location"),
+]
+
+EXPORT_HEADER = [column for column, _ in EXPORT_COLUMNS]
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """
+    A file-like object that returns written values instead of buffering them.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields flat value tuples for the export columns.
+
+    `iterator()` uses a server-side cursor on PostgreSQL, so only one chunk of
+    rows is held in memory at a time.
+    """
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    return queryset.values_list(*lookups).iterator(chunk_size=chunk_size)
+
+
+async def aexport_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Async version of `export_rows`, fetching one chunk per thread hop.
+    """
+    # Django 5.2 でも values_list().aiterator() は最初の SQL を非同期コンテキストで実行してしまう
+    # (ValuesListIterable.__iter__ がジェネレータではないため)。同期イテレータをチャンク単位でスレッドに渡して読む
+    rows = export_rows(queryset, chunk_size)
+    next_chunk = sync_to_async(lambda: list(islice(rows, chunk_size)), thread_sensitive=True)
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield row
+
+
+def iter_csv(rows):
+    """
+    Yields CSV lines, starting with a header row.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+async def aiter_csv(rows):
+    """
+    Async version of `iter_csv`.
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_HEADER)
+    async for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_line(row):
+    return json.dumps(dict(zip(EXPORT_HEADER, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+def iter_ndjson(rows):
+    """
+    Yields one JSON object per line.
+    """
+    for row in rows:
+        yield ndjson_line(row)
+
+
+async def aiter_ndjson(rows):
+    """
+    Async version of `iter_ndjson`.
+    """
+    async for row in rows:
+        yield ndjson_line(row)
@@ -0,0 +1,91 @@
+from decimal import Decimal
+from functools import cache
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import serializers
+
+
+def decimal_formatter(field):
+    """
+    Returns a function that formats a Decimal like `field.to_representation` (coerced to string).
+    """
+    quantum = Decimal(1).scaleb(-field.decimal_places)
+    return lambda value: f"{value.quantize(quantum):f}"
+
+
+def date_formatter(field):
+    return lambda value: value.isoformat()
+
+
+FORMATTERS = [
+    (serializers.DecimalField, decimal_formatter),
+    (serializers.DateField, date_formatter),
+    (serializers.IntegerField, None),
+    (serializers.CharField, None),
+    (serializers.PrimaryKeyRelatedField, None),
+]
+
+
+class ValuesReader:
+    """
+    Builds a serializer's read representation straight from `.values()` rows.
+
+    The column-to-key mapping and per-column formatters are derived once from
+    the serializer's readable fields, so each row costs a few dict lookups
+    instead of DRF's per-field `get_attribute`/`to_representation` calls.
+    Only plain model fields and nested serializers are supported; anything
+    else raises ImproperlyConfigured so the output cannot silently diverge.
+    """
+
+    def __init__(self, serializer):
+        self.lookups = []
+        self.plan = self.compile(serializer, "")
+
+    def compile(self, serializer, prefix):
+        plan = []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            lookup = prefix + field.source.replace(".", "__")
+            if isinstance(field, serializers.BaseSerializer):
+                # FK列がNULLならネストしたオブジェクトもNULL
+                self.lookups.append(lookup)
+                plan.append((name, lookup, None, self.compile(field, f"{lookup}__")))
+                continue
+            for field_class, formatter in FORMATTERS:
+                if isinstance(field, field_class):
+                    break
+            else:
+                raise ImproperlyConfigured(f"ValuesReader does not support {type(field).__name__} ({lookup}).")
+            self.lookups.append(lookup)
+            plan.append((name, lookup, formatter(field) if formatter else None, None))
+        return plan
+
+    def build(self, row, plan):
+        result = {}
+        for key, lookup, formatter, nested in plan:
+            value = row[lookup]
+            if value is None:
+                result[key] = None
+            elif nested is not None:
+                result[key] = self.build(row, nested)
+            elif formatter is not None:
+                result[key] = formatter(value)
+            else:
+                result[key] = value
+        return result
+
+    def read(self, rows):
+        """
+        Converts `.values(*self.lookups)` rows into representation dicts.
+        """
+        plan = self.plan
+        return [self.build(row, plan) for row in rows]
+
+
+@cache
+def values_reader(serializer_class):
+    """
+    Returns the (per-process) ValuesReader for a serializer class.
+    """
+    return ValuesReader(serializer_class())
@@ -0,0 +1,155 @@
+from datetime import date
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+def parse_id_list(params, name):
+    """
+    Returns the comma-separated `name` query parameter as a list of ids, or None if it is absent.
+
+    Raises a ValidationError (400) if any value is not a positive integer.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        ids = [int(part) for part in value.split(",")]
+    except ValueError:
+        ids = []
+    if not ids or any(pk < 1 for pk in ids):
+        raise ValidationError({name: "Expected a comma-separated list of ids."})
+    return ids
+
+
+def parse_int(params, name):
+    """
+    Returns the `name` query parameter as a non-negative integer, or None if it is absent.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+    if number < 0:
+        raise ValidationError({name: "Expected a non-negative integer."})
+    return number
+
+
+def parse_date(params, name):
+    """
+    Returns the `name` query parameter as a date, or None if it is absent.
+    """
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValidationError({name: "Expected a date in YYYY-MM-DD format."})
+
+
+class IdFilter(BaseFilterBackend):
+    """
+    Filters a queryset by comma-separated id query parameters.
+
+    `id_filters` maps each query parameter to the lookup it filters on.
+    """
+
+    id_filters = {}
+
+    def get_lookups(self, params):
+        """
+        Returns the filter() lookups for the query parameters `params`.
+        """
+        lookups = {}
+        for name, lookup in self.id_filters.items():
+            ids = parse_id_list(params, name)
+            if ids is None:
+                continue
+            if len(ids) == 1:
+                # 1件なら IN ではなく = にする (複合インデックスの先頭列として使いやすい)
+                lookups[lookup.removesuffix("__in")] = ids[0]
+            else:
+                lookups[lookup] = ids
+        return lookups
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = self.get_lookups(request.query_params)
+        return queryset.filter(**lookups) if lookups else queryset
+
+
+class ProductFilter(IdFilter):
+    """
+    Filters products from query parameters.
+
+    Query parameters:
+        category, unit, manufacturer, origin: comma-separated ids.
+    """
+
+    id_filters = {
+        "category": "category_id__in",
+        "unit": "unit_id__in",
+        "manufacturer": "manufacturer_id__in",
+        "origin": "origin_id__in",
+    }
+
+
+class ShoppingRecordFilter(IdFilter):
+    """
+    Filters shopping records from query parameters.
+
+    Query parameters:
+        start_date / end_date: inclusive purchase date range (YYYY-MM-DD).
+        store, product, category, manufacturer: comma-separated ids.
+        min_price / max_price: inclusive price range.
+    """
+
+    id_filters = {
+        "store": "store_id__in",
+        "product": "product_id__in",
+        "category": "product__category_id__in",
+        "manufacturer": "product__manufacturer_id__in",
+    }
+
+    def get_lookups(self, params):
+        lookups = super().get_lookups(params)
+        start_date = parse_date(params, "start_date")
+        end_date = parse_date(params, "end_date")
+        if start_date:
+            lookups["purchase_date__gte"] = start_date
+        if end_date:
+            lookups["purchase_date__lte"] = end_date
+
+        min_price = parse_int(params, "min_price")
+        max_price = parse_int(params, "max_price")
+        if min_price is not None:
+            lookups["price__gte"] = min_price
+        if max_price is not None:
+            lookups["price__lte"] = max_price
+        return lookups
+
+
+class AllowListOrderingFilter(OrderingFilter):
+    """
+    `?ordering=` restricted to the view's `ordering_fields`, with `id` appended as a tie-breaker.
+
+    Unknown fields are rejected with a 400 instead of being silently ignored.
+    The ordering is also picked up by cursor pagination, which seeks on the first field.
+    """
+
+    def remove_invalid_fields(self, queryset, fields, view, request):
+        allowed = set(view.ordering_fields)
+        invalid = [field for field in fields if field.lstrip("-") not in allowed]
+        if invalid:
+            raise ValidationError({self.ordering_param: f"Unsupported ordering: {', '.join(invalid)}."})
+        return fields
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not any(field.lstrip("-") == "id" for field in ordering):
+            # 先頭列の並び順に合わせて id を付け、カーソルの位置を一意にする
+            ordering = (*ordering, "-id" if ordering[0].startswith("-") else "id")
+        return ordering
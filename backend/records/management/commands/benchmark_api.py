@@ -0,0 +1,209 @@
+import json
+import platform
+import statistics
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from records.metrics import RequestStats, current_stats
+from records.models import Category, Product, ShoppingRecord, Store
+
+
+def percentile(values, percent):
+    """
+    Returns the `percent` percentile of `values` with linear interpolation.
+    """
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[percent - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmarks the main API endpoints through the test client against the current database "
+        "and reports p50/p95/p99 latency, queries per request and throughput. "
+        "Writes made by the benchmark are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--iterations", type=int, default=50, help="Timed requests per scenario (default: 50).")
+        parser.add_argument("--warmup", type=int, default=3, help="Untimed requests per scenario (default: 3).")
+        parser.add_argument("--scenario", action="append", help="Run only the named scenario (repeatable).")
+        parser.add_argument("--output", help="Write the results as JSON to this path.")
+        parser.add_argument("--baseline", help="Compare against the JSON results of an earlier run.")
+        parser.add_argument(
+            "--max-regression",
+            type=float,
+            help="Fail if any scenario's p95 is more than this many percent slower than the baseline.",
+        )
+
+    def handle(self, *args, **options):
+        if options["iterations"] < 1:
+            raise CommandError("--iterations must be a positive integer.")
+        baseline = self.load_baseline(options["baseline"]) if options["baseline"] else None
+
+        # 計測用のユーザーや作成した記録を残さないよう、全体をロールバックする
+        # (計測はこのコマンドで行うため、ミドルウェアのサンプリングは止める)
+        overrides = {"PERFORMANCE_SAMPLE_RATE": 0, "ALLOWED_HOSTS": [*settings.ALLOWED_HOSTS, "testserver"]}
+        with transaction.atomic(), override_settings(**overrides):
+            scenarios = self.scenarios()
+            unknown = set(options["scenario"] or []) - scenarios.keys()
+            if unknown:
+                raise CommandError(
+                    f"Unknown scenarios: {', '.join(sorted(unknown))}. Available: {', '.join(scenarios)}"
+                )
+            user = get_user_model().objects.create_user(username=f"benchmark-{time.time_ns()}")
+            client = APIClient()
+            client.force_authenticate(user=user)
+
+            results = {}
+            for name, request in scenarios.items():
+                if options["scenario"] and name not in options["scenario"]:
+                    continue
+                results[name] = self.run_scenario(client, request, options["warmup"], options["iterations"])
+                self.report(name, results[name], baseline)
+            transaction.set_rollback(True)
+
+        output = {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "records": ShoppingRecord.objects.count(),
+            "iterations": options["iterations"],
+            "scenarios": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(output, f, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+        if baseline and options["max_regression"] is not None:
+            self.check_regressions(results, baseline, options["max_regression"])
+
+    def scenarios(self):
+        """
+        Returns {name: callable(client, i) -> response} for the benchmarked requests.
+        """
+        store = Store.objects.order_by("id").first()
+        product = Product.objects.order_by("id").first()
+        category = Category.objects.order_by("id").first()
+        if store is None or product is None:
+            raise CommandError("The database has no stores or products; run seed_synthetic first.")
+        latest = ShoppingRecord.objects.order_by("-purchase_date").values_list("purchase_date", flat=True).first()
+        end_date = latest.isoformat() if latest else "2025-12-31"
+        start_date = f"{end_date[:4]}-01-01"
+
+        def record(i):
+            return {
+                "price": 100 + i,
+                "purchase_date": end_date,
+                "quantity": "1.000",
+                "store_id": store.id,
+                "product_id": product.id,
+            }
+
+        return {
+            "categories_list": lambda client, i: client.get("/api/categories/"),
+            "products_list": lambda client, i: client.get("/api/products/"),
+            "products_search": lambda client, i: client.get("/api/products/search/", {"q": product.name[:4]}),
+            "records_list": lambda client, i: client.get("/api/shopping-records/"),
+            "records_filter": lambda client, i: client.get(
+                "/api/shopping-records/",
+                {
+                    "store": store.id,
+                    "category": category.id,
+                    "start_date": start_date,
+                    "end_date": end_date,
+                    "ordering": "-price",
+                },
+            ),
+            "records_create": lambda client, i: client.post("/api/shopping-records/", record(i), format="json"),
+            "records_bulk": lambda client, i: client.post(
+                "/api/shopping-records/bulk/", [record(i * 20 + j) for j in range(20)], format="json"
+            ),
+            "analytics_month": lambda client, i: client.get("/api/analytics/spend/", {"group_by": "month"}),
+            "analytics_category_store": lambda client, i: client.get(
+                "/api/analytics/spend/", {"group_by": "category,store", "start_date": start_date, "end_date": end_date}
+            ),
+            "analytics_columnar": lambda client, i: client.get(
+                "/api/analytics/spend/", {"group_by": "category,store", "engine": "columnar"}
+            ),
+            "price_history": lambda client, i: client.get(f"/api/products/{product.id}/price-history/"),
+        }
+
+    def run_scenario(self, client, request, warmup, iterations):
+        for i in range(warmup):
+            self.check_response(request(client, i))
+
+        latencies = []
+        queries = []
+        db_times = []
+        started = time.perf_counter()
+        for i in range(warmup, warmup + iterations):
+            stats = RequestStats()
+            token = current_stats.set(stats)
+            try:
+                request_started = time.perf_counter()
+                response = request(client, i)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                latencies.append(time.perf_counter() - request_started)
+            finally:
+                current_stats.reset(token)
+            self.check_response(response)
+            queries.append(stats.queries)
+            db_times.append(stats.db_time)
+        elapsed = time.perf_counter() - started
+
+        return {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+            "db_ms": round(statistics.fmean(db_times) * 1000, 3),
+            "queries": statistics.median(queries),
+            "max_queries": max(queries),
+            "throughput_rps": round(iterations / elapsed, 1),
+        }
+
+    def check_response(self, response):
+        if response.status_code >= 400:
+            raise CommandError(
+                f"{response.request['PATH_INFO']} returned {response.status_code}: {response.content!r}"
+            )
+
+    def report(self, name, result, baseline):
+        line = (
+            f"{name:<26} p50 {result['p50_ms']:>8.2f} ms  p95 {result['p95_ms']:>8.2f} ms  "
+            f"p99 {result['p99_ms']:>8.2f} ms  {result['queries']:>4g} queries  {result['throughput_rps']:>8.1f} req/s"
+        )
+        previous = baseline["scenarios"].get(name) if baseline else None
+        if previous:
+            line += f"  (p95 {self.change(previous['p95_ms'], result['p95_ms']):+.1f}% vs baseline)"
+        self.stdout.write(line)
+
+    def change(self, before, after):
+        return (after - before) / before * 100 if before else 0.0
+
+    def load_baseline(self, path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read baseline {path}: {e}")
+
+    def check_regressions(self, results, baseline, max_regression):
+        regressions = [
+            f"{name} ({self.change(baseline['scenarios'][name]['p95_ms'], result['p95_ms']):+.1f}%)"
+            for name, result in results.items()
+            if name in baseline["scenarios"]
+            and self.change(baseline["scenarios"][name]["p95_ms"], result["p95_ms"]) > max_regression
+        ]
+        if regressions:
+            raise CommandError(f"p95 regressed by more than {max_regression}%: {', '.join(regressions)}")
@@ -0,0 +1,92 @@
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from records.fast_read import values_reader
+from records.models import Category, Manufacturer, Origin, Product, ShoppingRecord, Store, Unit
+from records.serializers import ProductSerializer, ShoppingRecordSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the per-row CPU cost of ModelSerializer and the values() fast read path. "
+        "Sample rows are created inside a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2000, help="Number of shopping records (default: 2000).")
+        parser.add_argument("--repeat", type=int, default=5, help="Timing repetitions; the best is reported.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_rows(options["rows"])
+            for label, serializer_class, queryset in [
+                (
+                    "shopping records",
+                    ShoppingRecordSerializer,
+                    ShoppingRecord.objects.select_related(
+                        "store", "product__category", "product__unit", "product__manufacturer", "product__origin"
+                    ),
+                ),
+                (
+                    "products",
+                    ProductSerializer,
+                    Product.objects.select_related("category", "unit", "manufacturer", "origin"),
+                ),
+            ]:
+                # クエリ時間を除き、行からレスポンス辞書への変換コストだけを測る
+                instances = list(queryset)
+                reader = values_reader(serializer_class)
+                rows = list(queryset.values(*reader.lookups))
+                serializer_time = self.best_of(options["repeat"], lambda: serializer_class(instances, many=True).data)
+                reader_time = self.best_of(options["repeat"], lambda: reader.read(rows))
+                count = len(rows)
+                self.stdout.write(
+                    f"{label}: {count} rows, "
+                    f"serializer {serializer_time / count * 1e6:.1f} us/row, "
+                    f"values reader {reader_time / count * 1e6:.1f} us/row "
+                    f"({serializer_time / reader_time:.1f}x)"
+                )
+            transaction.set_rollback(True)
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def create_rows(self, count):
+        unit = Unit.objects.create(name="bench-g")
+        store = Store.objects.create(name="Bench store", location="Bench")
+        manufacturer = Manufacturer.objects.create(name="Bench manufacturer")
+        origin = Origin.objects.create(name="Bench origin")
+        categories = [Category.objects.create(name=f"Bench category {i}") for i in range(10)]
+        products = Product.objects.bulk_create(
+            [
+                Product(
+                    name=f"Bench product {i}",
+                    category=categories[i % len(categories)],
+                    unit=unit,
+                    manufacturer=manufacturer if i % 2 else None,
+                    origin=origin if i % 3 else None,
+                )
+                for i in range(max(count // 10, 1))
+            ]
+        )
+        ShoppingRecord.objects.bulk_create(
+            [
+                ShoppingRecord(
+                    price=100 + i % 500,
+                    purchase_date=date(2024, 1, 1) + timedelta(days=i % 365),
+                    store=store,
+                    quantity=i % 7 + 1,
+                    product=products[i % len(products)],
+                )
+                for i in range(count)
+            ],
+            batch_size=1000,
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from records import price_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Updates the monthly per-category price index, recomputing only the months whose records changed "
+        "(usually the latest one), or every month with --rebuild."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rebuild", action="store_true", help="Recompute every month.")
+
+    def handle(self, *args, **options):
+        written = price_index.refresh(rebuild=options["rebuild"])
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} price index rows."))
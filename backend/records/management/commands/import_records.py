@@ -0,0 +1,166 @@
+import csv
+import time
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from records import rollups, versioning
+from records.bulk_load import insert_records
+from records.models import Category, Manufacturer, Origin, Product, Store, Unit
+
+REQUIRED_COLUMNS = ["purchase_date", "price", "quantity", "product", "category", "unit", "store"]
+OPTIONAL_COLUMNS = ["manufacturer", "origin", "store_location"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports shopping records from a CSV file in chunks. "
+        "Accepts the same columns as /api/shopping-records/export/ and creates missing "
+        "categories, units, manufacturers, origins, stores and products by name."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv_path", help="Path to the CSV file to import.")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Rows per transaction (default: 5000).")
+        parser.add_argument(
+            "--no-copy", action="store_true", help="Use bulk_create even on PostgreSQL instead of COPY."
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options["chunk_size"]
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be a positive integer.")
+        use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+
+        # 参照テーブルは小さいので最初に name→id のマップとして全件読み込む
+        self.categories = dict(Category.objects.values_list("name", "id"))
+        self.units = dict(Unit.objects.values_list("name", "id"))
+        self.manufacturers = dict(Manufacturer.objects.values_list("name", "id"))
+        self.origins = dict(Origin.objects.values_list("name", "id"))
+        self.stores = {
+            (name, location): pk for pk, name, location in Store.objects.values_list("id", "name", "location")
+        }
+        self.products = {
+            key[1:]: key[0]
+            for key in Product.objects.values_list(
+                "id", "name", "category_id", "unit_id", "manufacturer_id", "origin_id"
+            )
+        }
+
+        started = time.monotonic()
+        total = 0
+        try:
+            with open(options["csv_path"], newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+                if missing:
+                    raise CommandError(f"Missing required columns: {', '.join(missing)}")
+
+                while chunk := list(islice(reader, chunk_size)):
+                    rows = [self.parse_row(row, reader.line_num - len(chunk) + i + 1) for i, row in enumerate(chunk)]
+                    with transaction.atomic():
+                        records, rollup_rows = self.resolve(rows)
+                        insert_records(records, use_copy)
+                        # COPY/bulk_create はシグナルを送らないため、集計テーブルをここでまとめて加算する
+                        rollups.add_deltas(rollups.record_deltas(rollup_rows))
+                    total += len(records)
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(f"{total} rows imported ({total / elapsed:.0f} rows/s)")
+        except OSError as e:
+            raise CommandError(f"Could not read {options['csv_path']}: {e}")
+
+        elapsed = time.monotonic() - started
+        rate = total / elapsed if elapsed else 0
+        method = "COPY" if use_copy else "bulk_create"
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {total} rows in {elapsed:.2f}s ({rate:.0f} rows/s, {method}).")
+        )
+
+    def parse_row(self, row, line_num):
+        """
+        Converts a CSV row into typed values, raising CommandError on bad input.
+        """
+        try:
+            return {
+                "purchase_date": date.fromisoformat(row["purchase_date"]),
+                "price": int(row["price"]),
+                "quantity": Decimal(row["quantity"]),
+                "product": row["product"].strip(),
+                "category": row["category"].strip(),
+                "unit": row["unit"].strip(),
+                "manufacturer": (row.get("manufacturer") or "").strip() or None,
+                "origin": (row.get("origin") or "").strip() or None,
+                "store": row["store"].strip(),
+                "store_location": (row.get("store_location") or "").strip(),
+            }
+        except (ValueError, InvalidOperation, AttributeError) as e:
+            raise CommandError(f"Line {line_num}: {e}")
+
+    def resolve(self, rows):
+        """
+        Maps names to ids, creating missing related rows with one bulk insert per table.
+
+        Returns (price, purchase_date, quantity, store_id, product_id) tuples and the
+        matching (purchase_date, category_id, store_id, price, quantity) rollup rows.
+        """
+        self.create_missing(Category, self.categories, {row["category"] for row in rows})
+        self.create_missing(Unit, self.units, {row["unit"] for row in rows})
+        self.create_missing(Manufacturer, self.manufacturers, {row["manufacturer"] for row in rows} - {None})
+        self.create_missing(Origin, self.origins, {row["origin"] for row in rows} - {None})
+
+        new_stores = {(row["store"], row["store_location"]) for row in rows} - self.stores.keys()
+        if new_stores:
+            created = Store.objects.bulk_create([Store(name=name, location=location) for name, location in new_stores])
+            self.stores.update({(store.name, store.location): store.pk for store in created})
+            versioning.bump(Store)
+
+        product_keys = [
+            (
+                row["product"],
+                self.categories[row["category"]],
+                self.units[row["unit"]],
+                self.manufacturers.get(row["manufacturer"]),
+                self.origins.get(row["origin"]),
+            )
+            for row in rows
+        ]
+        new_products = set(product_keys) - self.products.keys()
+        if new_products:
+            created = Product.objects.bulk_create(
+                [
+                    Product(
+                        name=name, category_id=category, unit_id=unit, manufacturer_id=manufacturer, origin_id=origin
+                    )
+                    for name, category, unit, manufacturer, origin in new_products
+                ]
+            )
+            self.products.update(
+                {(p.name, p.category_id, p.unit_id, p.manufacturer_id, p.origin_id): p.pk for p in created}
+            )
+
+        records = [
+            (
+                row["price"],
+                row["purchase_date"],
+                row["quantity"],
+                self.stores[(row["store"], row["store_location"])],
+                self.products[key],
+            )
+            for row, key in zip(rows, product_keys)
+        ]
+        rollup_rows = [
+            (purchase_date, key[1], store_id, price, quantity)
+            for (price, purchase_date, quantity, store_id, _), key in zip(records, product_keys)
+        ]
+        return records, rollup_rows
+
+    def create_missing(self, model, mapping, names):
+        new_names = names - mapping.keys()
+        if new_names:
+            created = model.objects.bulk_create([model(name=name) for name in new_names])
+            mapping.update({obj.name: obj.pk for obj in created})
+            # bulk_create はシグナルを送らないため、条件付きGET用のバージョンをここで更新する
+            versioning.bump(model)
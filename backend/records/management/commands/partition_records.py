@@ -0,0 +1,78 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from records import partitioning, versioning
+from records.models import DailySpend, MonthlySpend, ShoppingRecord
+
+
+class Command(BaseCommand):
+    help = (
+        "Manages range partitioning of the shopping record table by purchase date (PostgreSQL only): "
+        "convert the table, pre-create future partitions, or detach old partitions for archival."
+    )
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action", required=True)
+
+        convert = subparsers.add_parser("convert", help="Convert the table into a partitioned table.")
+        convert.add_argument("--interval", choices=partitioning.INTERVALS, default="year")
+        convert.add_argument(
+            "--ahead", type=int, default=2, help="Future partitions to create after the current one (default: 2)."
+        )
+
+        create = subparsers.add_parser(
+            "create", help="Create the missing future partitions. Does nothing if the table is not partitioned."
+        )
+        create.add_argument(
+            "--ahead", type=int, default=2, help="Future partitions to keep after the current one (default: 2)."
+        )
+
+        detach = subparsers.add_parser("detach", help="Detach the partitions ending on or before a date.")
+        detach.add_argument("--before", type=date.fromisoformat, required=True, help="Date in YYYY-MM-DD format.")
+        detach.add_argument("--drop", action="store_true", help="Drop the detached tables instead of keeping them.")
+
+    def handle(self, *args, **options):
+        if options.get("ahead", 0) < 0:
+            raise CommandError("--ahead must not be negative.")
+        if connection.vendor != "postgresql":
+            if options["action"] == "create":
+                self.stdout.write("The shopping record table is not partitioned; nothing to do.")
+                return
+            raise CommandError("Partitioning requires PostgreSQL.")
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            partitioned = partitioning.is_partitioned(cursor)
+            if options["action"] == "convert":
+                if partitioned:
+                    raise CommandError("The shopping record table is already partitioned.")
+                partitioning.convert_table(cursor, options["interval"], timezone.localdate(), options["ahead"])
+                count = len(partitioning.list_partitions(cursor))
+                self.stdout.write(self.style.SUCCESS(f"Partitioned the table into {count} {options['interval']}s."))
+            elif not partitioned:
+                if options["action"] == "detach":
+                    raise CommandError("The shopping record table is not partitioned.")
+                self.stdout.write("The shopping record table is not partitioned; nothing to do.")
+            elif options["action"] == "create":
+                created = partitioning.create_future_partitions(cursor, timezone.localdate(), options["ahead"])
+                self.stdout.write(self.style.SUCCESS(self.summary("Created", created)))
+            else:
+                self.detach(cursor, options["before"], options["drop"])
+
+    def detach(self, cursor, before, drop):
+        detached = partitioning.detach_partitions(cursor, before)
+        for name, start, end in detached:
+            # 切り離した期間の記録は集計対象から外れるので、その期間の集計行も消す
+            DailySpend.objects.filter(date__gte=start, date__lt=end).delete()
+            MonthlySpend.objects.filter(month__gte=start, month__lt=end).delete()
+            if drop:
+                cursor.execute(f"DROP TABLE {partitioning.quote(name)}")
+        if detached:
+            versioning.bump(ShoppingRecord)
+        names = [name for name, _, _ in detached]
+        self.stdout.write(self.style.SUCCESS(self.summary("Dropped" if drop else "Detached", names)))
+
+    def summary(self, action, names):
+        return f"{action} {len(names)} partitions" + (f": {', '.join(names)}" if names else ".")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from records import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the daily/monthly spend rollup tables from ShoppingRecord, or verifies them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Compare the rollup tables with ShoppingRecord without writing; fails on any mismatch.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["verify"]:
+            daily, monthly = rollups.rebuild()
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {daily} daily and {monthly} monthly rollup rows."))
+            return
+
+        expected_daily, expected_monthly = rollups.expected_rollups()
+        stored_daily, stored_monthly = rollups.stored_rollups()
+        mismatches = 0
+        for level, expected, stored in [
+            ("daily", expected_daily, stored_daily),
+            ("monthly", expected_monthly, stored_monthly),
+        ]:
+            for key in sorted(expected.keys() | stored.keys()):
+                if expected.get(key) != stored.get(key):
+                    mismatches += 1
+                    self.stdout.write(f"{level} {key}: expected {expected.get(key)}, stored {stored.get(key)}")
+        if mismatches:
+            raise CommandError(f"{mismatches} rollup rows differ from ShoppingRecord; run rebuild_rollups.")
+        self.stdout.write(self.style.SUCCESS("Rollup tables match ShoppingRecord."))
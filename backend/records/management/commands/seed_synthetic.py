@@ -0,0 +1,193 @@
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from records import reference_cache, rollups, versioning
+from records.bulk_load import insert_records
+from records.models import Category, Manufacturer, Origin, Product, Store, Unit
+from records.signals import VERSIONED_MODELS
+
+CATEGORY_NAMES = [
+    "Meat", "Fish", "Vegetables", "Fruit", "Dairy", "Eggs", "Bakery", "Rice", "Noodles", "Snacks",
+    "Sweets", "Beverages", "Alcohol", "Coffee & Tea", "Frozen", "Seasonings", "Canned", "Tofu", "Deli", "Household",
+]  # fmt: skip
+PRODUCT_WORDS = [
+    "Beef", "Pork", "Chicken", "Salmon", "Tuna", "Cabbage", "Carrot", "Onion", "Tomato", "Apple",
+    "Banana", "Milk", "Yogurt", "Cheese", "Bread", "Udon", "Soba", "Chips", "Chocolate", "Green Tea",
+    "Beer", "Sake", "Coffee", "Ice Cream", "Soy Sauce", "Miso", "Tofu", "Natto", "Curry", "Detergent",
+]  # fmt: skip
+PRODUCT_VARIANTS = ["", "Organic", "Premium", "Light", "Family Pack", "Mini", "Value", "Fresh"]
+STORE_NAMES = ["Supermarket", "Drugstore", "Convenience Store", "Discount Store", "Department Store", "Market"]
+CITIES = ["Kyoto", "Osaka", "Kobe", "Nara", "Otsu", "Tokyo", "Nagoya", "Sapporo", "Fukuoka", "Sendai"]
+ORIGIN_NAMES = ["Hokkaido", "Aomori", "Shiga", "Kagoshima", "Okinawa", "Nagano", "USA", "Brazil", "Australia", "Chile"]
+# unit -> (quantity choices, typical price per unit)
+UNITS = {
+    "g": ([100, 150, 200, 300, 500, 1000], 2.0),
+    "ml": ([200, 350, 500, 1000, 1800], 0.4),
+    "pieces": ([1, 2, 3, 4, 6, 10], 120.0),
+}
+
+
+def numbered(names, count):
+    """
+    Returns `count` unique names, cycling through `names` and numbering repeats.
+    """
+    return [
+        names[i % len(names)] if i < len(names) else f"{names[i % len(names)]} {i // len(names) + 1}"
+        for i in range(count)
+    ]
+
+
+def zipf_cum_weights(count, skew):
+    """
+    Returns cumulative Zipf weights (rank ** -skew) for `random.choices`; skew 0 is uniform.
+    """
+    return list(accumulate((rank + 1) ** -skew for rank in range(count)))
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates a synthetic catalog and shopping records for load testing. "
+        "Product and store popularity follow a Zipf distribution; records are inserted in chunks "
+        "with COPY on PostgreSQL (bulk_create otherwise), then the spend rollups are rebuilt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--records", type=int, default=100_000, help="Shopping records (default: 100000).")
+        parser.add_argument("--products", type=int, default=2000, help="Products (default: 2000).")
+        parser.add_argument("--stores", type=int, default=20, help="Stores (default: 20).")
+        parser.add_argument("--categories", type=int, default=20, help="Categories (default: 20).")
+        parser.add_argument("--manufacturers", type=int, default=200, help="Manufacturers (default: 200).")
+        parser.add_argument("--origins", type=int, default=10, help="Origins (default: 10).")
+        parser.add_argument("--days", type=int, default=730, help="Days of history before --end-date (default: 730).")
+        parser.add_argument("--end-date", type=date.fromisoformat, default=date.today(), help="Last purchase date.")
+        parser.add_argument(
+            "--skew", type=float, default=1.1, help="Zipf exponent for product/store popularity; 0 is uniform."
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0).")
+        parser.add_argument("--chunk-size", type=int, default=10_000, help="Rows per transaction (default: 10000).")
+        parser.add_argument(
+            "--no-copy", action="store_true", help="Use bulk_create even on PostgreSQL instead of COPY."
+        )
+
+    def handle(self, *args, **options):
+        for name in ("records", "products", "stores", "categories", "chunk_size", "days"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be a positive integer.")
+        if options["skew"] < 0:
+            raise CommandError("--skew must not be negative.")
+        self.random = random.Random(options["seed"])
+        use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+
+        with transaction.atomic():
+            products = self.create_catalog(options)
+            stores = self.ensure(
+                Store,
+                [
+                    {"name": name, "location": CITIES[i % len(CITIES)]}
+                    for i, name in enumerate(numbered(STORE_NAMES, options["stores"]))
+                ],
+            )
+        # 人気の偏りをつけるため、並び順をシャッフルしてから順位に Zipf の重みを割り当てる
+        self.random.shuffle(products)
+        self.random.shuffle(stores)
+        product_weights = zipf_cum_weights(len(products), options["skew"])
+        store_weights = zipf_cum_weights(len(stores), options["skew"])
+        first_date = options["end_date"] - timedelta(days=options["days"] - 1)
+
+        started = time.monotonic()
+        total = 0
+        while total < options["records"]:
+            size = min(options["chunk_size"], options["records"] - total)
+            chosen_products = self.random.choices(products, cum_weights=product_weights, k=size)
+            chosen_stores = self.random.choices(stores, cum_weights=store_weights, k=size)
+            records = [
+                self.make_record(
+                    product, store_id, first_date + timedelta(days=self.random.randrange(options["days"]))
+                )
+                for product, store_id in zip(chosen_products, chosen_stores)
+            ]
+            with transaction.atomic():
+                insert_records(records, use_copy)
+            total += size
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"{total} rows inserted ({total / elapsed:.0f} rows/s)")
+
+        # 大量の行を差分で反映するより、最後に1回集計し直す方が速い
+        rollups.rebuild()
+        for model in VERSIONED_MODELS:
+            versioning.bump(model)
+        reference_cache.clear_all()
+
+        elapsed = time.monotonic() - started
+        method = "COPY" if use_copy else "bulk_create"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Seeded {total} records over {len(products)} products and {len(stores)} stores "
+                f"in {elapsed:.2f}s ({total / elapsed:.0f} rows/s, {method})."
+            )
+        )
+
+    def create_catalog(self, options):
+        """
+        Creates (or reuses) the reference rows and products.
+
+        Returns (product_id, base price per unit, quantity choices) tuples.
+        """
+        units = self.ensure(Unit, [{"name": name} for name in UNITS])
+        categories = self.ensure(
+            Category, [{"name": name} for name in numbered(CATEGORY_NAMES, options["categories"])]
+        )
+        manufacturers = self.ensure(
+            Manufacturer, [{"name": f"Maker {i + 1:04d}"} for i in range(options["manufacturers"])]
+        )
+        origins = self.ensure(Origin, [{"name": name} for name in numbered(ORIGIN_NAMES, options["origins"])])
+
+        unit_names = list(UNITS)
+        specs = []
+        for i in range(options["products"]):
+            word = PRODUCT_WORDS[i % len(PRODUCT_WORDS)]
+            variant = PRODUCT_VARIANTS[(i // len(PRODUCT_WORDS)) % len(PRODUCT_VARIANTS)]
+            specs.append(
+                {
+                    "name": f"{variant} {word} {i + 1}".strip(),
+                    "category_id": categories[i % len(categories)],
+                    "unit_id": units[i % len(units)],
+                    "manufacturer_id": self.random.choice(manufacturers) if manufacturers and i % 4 else None,
+                    "origin_id": self.random.choice(origins) if origins and i % 3 == 0 else None,
+                }
+            )
+        product_ids = self.ensure(Product, specs)
+
+        products = []
+        for i, product_id in enumerate(product_ids):
+            quantities, unit_price = UNITS[unit_names[i % len(units)]]
+            # 商品ごとの単価のばらつき (対数正規分布)
+            products.append((product_id, unit_price * self.random.lognormvariate(0, 0.5), quantities))
+        return products
+
+    def ensure(self, model, specs):
+        """
+        Returns the ids of rows named as in `specs` (field dicts), bulk-creating the missing ones.
+
+        Generated names are unique, so existing rows are reused by name even when
+        an earlier run (e.g. with another --seed) gave them different attributes.
+        """
+        names = [spec["name"] for spec in specs]
+        existing = dict(model.objects.filter(name__in=names).values_list("name", "id"))
+        missing = [spec for spec in specs if spec["name"] not in existing]
+        if missing:
+            for obj in model.objects.bulk_create([model(**spec) for spec in missing], batch_size=1000):
+                existing[obj.name] = obj.pk
+        return [existing[name] for name in names]
+
+    def make_record(self, product, store_id, purchase_date):
+        product_id, unit_price, quantities = product
+        quantity = self.random.choice(quantities)
+        price = max(1, round(unit_price * quantity * self.random.lognormvariate(0, 0.1)))
+        return (price, purchase_date, Decimal(quantity), store_id, product_id)
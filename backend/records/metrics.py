@@ -0,0 +1,197 @@
+import os
+import time
+from contextvars import ContextVar
+
+from django.db import connections
+from prometheus_client import (
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    disable_created_metrics,
+    generate_latest,
+    multiprocess,
+)
+
+# Prometheus client defaults (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# psycopg_pool `pop_stats()` keys -> (metric name, type, help)
+POOL_METRICS = [
+    ("pool_max", "shoptrack_db_pool_max_size", "gauge", "Maximum connections in the pool."),
+    ("pool_size", "shoptrack_db_pool_size", "gauge", "Connections in the pool, in use or idle."),
+    ("pool_available", "shoptrack_db_pool_available", "gauge", "Idle connections in the pool."),
+    ("requests_waiting", "shoptrack_db_pool_waiting", "gauge", "Requests waiting for a connection."),
+    ("requests_num", "shoptrack_db_pool_requests_total", "counter", "Connection requests."),
+    ("requests_queued", "shoptrack_db_pool_requests_queued_total", "counter", "Requests that had to wait."),
+    ("requests_errors", "shoptrack_db_pool_requests_errors_total", "counter", "Requests that timed out."),
+    ("connections_num", "shoptrack_db_pool_connections_total", "counter", "Connection attempts to the server."),
+    ("connections_errors", "shoptrack_db_pool_connection_errors_total", "counter", "Failed connection attempts."),
+    (
+        "connections_lost",
+        "shoptrack_db_pool_connections_lost_total",
+        "counter",
+        "Connections that failed a health check.",
+    ),
+    ("returns_bad", "shoptrack_db_pool_returns_bad_total", "counter", "Connections returned in a bad state."),
+    ("requests_wait_ms", "shoptrack_db_pool_wait_seconds_total", "counter", "Time spent waiting for a connection."),
+]
+
+# Counters of sampled requests, in the order of RequestStats values added by Registry.observe()
+SAMPLED_METRICS = [
+    ("shoptrack_sampled_requests_total", "Requests with query instrumentation."),
+    ("shoptrack_sampled_db_queries_total", "Database queries of sampled requests."),
+    ("shoptrack_sampled_db_seconds_total", "Database time of sampled requests."),
+    ("shoptrack_sampled_serialize_seconds_total", "Serialization time of sampled requests."),
+    ("shoptrack_sampled_render_seconds_total", "Render time of sampled requests."),
+]
+
+# 複数のワーカーの値を合算する multiprocess モードでは出力されないため、単一プロセスでも出さない
+disable_created_metrics()
+
+
+class RequestStats:
+    """
+    Timings collected for one sampled request.
+    """
+
+    __slots__ = ("queries", "db_time", "serialize_start", "serialize_time", "render_start", "render_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_start = None
+        self.serialize_time = 0.0
+        self.render_start = None
+        self.render_time = 0.0
+
+
+# 非同期ビューのクエリは sync_to_async のスレッドで実行されるため、スレッドローカルではなく
+# コンテキスト変数で計測対象のリクエストを引き継ぐ
+current_stats = ContextVar("current_stats", default=None)
+
+
+def time_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper that adds each query to the current request's stats.
+
+    Installed on every connection by `records.signals`; requests that are not
+    sampled pay a single context variable lookup.
+    """
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.db_time += time.perf_counter() - start
+        stats.queries += 1
+
+
+def time_serialization(func, *args):
+    """
+    Calls `func(*args)` and adds its duration to the current request's serialization time.
+
+    Used around building representation dicts (see `records.serializers`);
+    nested calls are counted once, by the outermost one. Queries they run are
+    counted in the DB time as well.
+    """
+    stats = current_stats.get()
+    if stats is None or stats.serialize_start is not None:
+        return func(*args)
+    stats.serialize_start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stats.serialize_time += time.perf_counter() - stats.serialize_start
+        stats.serialize_start = None
+
+
+class Registry:
+    """
+    Request and database pool metrics, rendered in the Prometheus text format.
+
+    With PROMETHEUS_MULTIPROC_DIR set (entrypoint.sh sets it for Gunicorn),
+    prometheus_client keeps every worker's values in files of that directory
+    and a scrape answered by any worker reports the sum over all of them, so
+    no series carries a process id. Without it the values are per process,
+    as with `runserver` and the tests.
+    """
+
+    def __init__(self):
+        self.collectors = CollectorRegistry()
+        self.duration = Histogram(
+            "shoptrack_request_duration_seconds",
+            "Request latency by view.",
+            ["view", "method"],
+            buckets=LATENCY_BUCKETS,
+            registry=self.collectors,
+        )
+        self.sampled = [
+            Counter(name, help_text, ["view", "method"], registry=self.collectors)
+            for name, help_text in SAMPLED_METRICS
+        ]
+        # プールは各ワーカーのものなので、ゲージは生きているワーカーの合計を報告する
+        self.pool = {
+            key: Gauge(name, help_text, ["database"], registry=self.collectors, multiprocess_mode="livesum")
+            if metric_type == "gauge"
+            else Counter(name, help_text, ["database"], registry=self.collectors)
+            for key, name, metric_type, help_text in POOL_METRICS
+        }
+
+    def observe(self, view, method, duration, stats=None):
+        self.duration.labels(view, method).observe(duration)
+        # 計測しなかったリクエストの系列も 0 として出す
+        values = (
+            (1, stats.queries, stats.db_time, stats.serialize_time, stats.render_time)
+            if stats is not None
+            else (0,) * 5
+        )
+        for counter, value in zip(self.sampled, values):
+            counter.labels(view, method).inc(value)
+
+    def observe_pools(self, pools):
+        """
+        Adds the connection pool stats of this process (`pools`: {alias: psycopg_pool pool}).
+
+        The counters are taken with `pop_stats()`, which resets them in the
+        pool, so each connection request is added once.
+        """
+        for alias, pool in pools.items():
+            stats = pool.pop_stats()
+            for key, metric in self.pool.items():
+                # 一度も発生していないカウンターは pop_stats() に含まれない
+                value = stats.get(key, 0)
+                if isinstance(metric, Gauge):
+                    metric.labels(alias).set(value)
+                else:
+                    metric.labels(alias).inc(value / 1000 if key == "requests_wait_ms" else value)
+
+    def clear(self):
+        for metric in [self.duration, *self.sampled, *self.pool.values()]:
+            metric.clear()
+
+    def render(self):
+        """
+        Returns all metrics as Prometheus text exposition format.
+        """
+        collectors = self.collectors
+        if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+            collectors = CollectorRegistry()
+            multiprocess.MultiProcessCollector(collectors)
+        return generate_latest(collectors).decode()
+
+
+def database_pools():
+    """
+    Returns {alias: pool} for the databases configured with connection pooling.
+    """
+    return {
+        alias: connections[alias].pool
+        for alias in connections.settings
+        if connections.settings[alias].get("OPTIONS", {}).get("pool")
+    }
+
+
+registry = Registry()
@@ -0,0 +1,286 @@
+import gzip
+import json
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import RequestStats, current_stats, database_pools, registry
+from .routers import PRIMARY_PIN_COOKIE, RoutingState, current_routing
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("records.performance")
+
+KNOWN_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+# JSON (API, OpenAPI schema) and CSV; never HTML, which carries CSRF tokens
+COMPRESSIBLE_TYPES = ("application/json", "application/vnd.oai.openapi", "text/csv")
+# 動的なレスポンス向けに速度を優先した圧縮レベル
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+
+class PerformanceMiddleware:
+    """
+    Records request latency per view, plus DB and render timings for sampled requests.
+
+    Every request is added to the latency histograms served at `/api/metrics/`.
+    A `PERFORMANCE_SAMPLE_RATE` fraction of requests also counts queries and
+    DB time (see `metrics.time_query`), serialization time (see
+    `metrics.time_serialization`) and render time, and reports them in a
+    `Server-Timing` header and a JSON log line on the `records.performance`
+    logger. For streaming responses the total covers the time to the first
+    byte, not the whole download.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start, stats, token = self.begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                current_stats.reset(token)
+        return self.end(request, response, start, stats)
+
+    async def __acall__(self, request):
+        start, stats, token = self.begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                current_stats.reset(token)
+        return self.end(request, response, start, stats)
+
+    def begin(self):
+        start = time.perf_counter()
+        if random.random() >= settings.PERFORMANCE_SAMPLE_RATE:
+            return start, None, None
+        stats = RequestStats()
+        return start, stats, current_stats.set(stats)
+
+    def process_template_response(self, request, response):
+        # DRF の Response はこの後に描画されるため、描画の前後で時間を計る
+        stats = current_stats.get()
+        if stats is not None:
+            stats.render_start = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: self.record_render(stats))
+        return response
+
+    def record_render(self, stats):
+        stats.render_time = time.perf_counter() - stats.render_start
+
+    def end(self, request, response, start, stats):
+        duration = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match else "<unresolved>"
+        method = request.method if request.method in KNOWN_METHODS else "OTHER"
+        registry.observe(view, method, duration, stats)
+        if stats is None:
+            return response
+        # 他のワーカーが応答するスクレイプにも反映されるよう、計測対象のリクエストでプールの統計を書き出す
+        registry.observe_pools(database_pools())
+
+        response["Server-Timing"] = ", ".join(
+            [
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+                f"serialize;dur={stats.serialize_time * 1000:.2f}",
+                f"render;dur={stats.render_time * 1000:.2f}",
+                f"total;dur={duration * 1000:.2f}",
+            ]
+        )
+        logger.info(
+            json.dumps(
+                {
+                    "method": request.method,
+                    "path": request.path,
+                    "view": view,
+                    "status": response.status_code,
+                    "duration_ms": round(duration * 1000, 2),
+                    "db_ms": round(stats.db_time * 1000, 2),
+                    "queries": stats.queries,
+                    "serialize_ms": round(stats.serialize_time * 1000, 2),
+                    "render_ms": round(stats.render_time * 1000, 2),
+                }
+            )
+        )
+        return response
+
+
+def parse_accept_encoding(header):
+    """
+    Returns {coding: q} for an Accept-Encoding header (lowercased codings, default q=1).
+    """
+    codings = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def gzip_compress(content):
+    # mtime=0 で同じ内容なら同じバイト列になるようにする
+    return gzip.compress(content, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def brotli_compress(content):
+    return brotli.compress(content, quality=BROTLI_QUALITY)
+
+
+class CompressionMiddleware:
+    """
+    Compresses API responses of at least `RESPONSE_COMPRESSION_MIN_SIZE` bytes.
+
+    The coding is negotiated from Accept-Encoding: brotli when the `brotli`
+    package is installed and the client prefers it at least as much as gzip,
+    otherwise gzip. Only COMPRESSIBLE_TYPES are compressed, so HTML pages with
+    CSRF tokens (admin) are never exposed to BREACH-style attacks. Streaming
+    responses (exports) are passed through unchanged.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.encoders = {"gzip": gzip_compress}
+        if brotli is not None:
+            self.encoders["br"] = brotli_compress
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (
+            response.streaming
+            or response.has_header("Content-Encoding")
+            or len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE
+            or not response.get("Content-Type", "").startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+
+        coding = self.negotiate(request.META.get("HTTP_ACCEPT_ENCODING", ""))
+        if coding is None:
+            return response
+        compressed = self.encoders[coding](response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = coding
+        # 圧縮後のバイト列は元と異なるため、強い ETag は弱い ETag にする (GZipMiddleware と同じ)
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        return response
+
+    def negotiate(self, header):
+        """
+        Returns the best coding acceptable to the client, or None; ties go to brotli.
+        """
+        accepted = parse_accept_encoding(header)
+        wildcard = accepted.get("*", 0.0)
+        best, best_q = None, 0.0
+        for coding in ("br", "gzip"):
+            q = accepted.get(coding, wildcard)
+            if coding in self.encoders and q > best_q:
+                best, best_q = coding, q
+        return best
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Lets safe-method requests to `ReplicaReadMixin` views read from the replica.
+
+    Only applies when REPLICA_DATABASE is set. A request that writes marks
+    the client with the PRIMARY_PIN_COOKIE cookie for REPLICA_PIN_SECONDS;
+    requests carrying it stay on the primary, so clients read their own writes
+    despite replication lag.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.end(response, state)
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        return self.end(response, state)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = current_routing.get()
+        state.use_replica = bool(
+            settings.REPLICA_DATABASE
+            and request.method in SAFE_METHODS
+            and getattr(getattr(view_func, "cls", None), "replica_reads", False)
+            and PRIMARY_PIN_COOKIE not in request.COOKIES
+        )
+        return None
+
+    def end(self, response, state):
+        if state.wrote and settings.REPLICA_DATABASE:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE,
+                "1",
+                max_age=settings.REPLICA_PIN_SECONDS,
+                path="/api/",
+                httponly=True,
+                samesite="Lax",
+                secure=not settings.DEBUG,
+            )
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.8 on 2026-10-18 04:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingrecord',
+            index=models.Index(fields=['purchase_date', 'id'], name='records_sr_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.8 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0002_shoppingrecord_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingrecord',
+            index=models.Index(fields=['purchase_date'], include=('price', 'quantity', 'store', 'product'), name='records_sr_spend_cover_idx'),
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.0.8 on 2026-10-18 04:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+
+
+def backfill_rollups(apps, schema_editor):
+    # Records saved before this migration have no rollup rows yet; later writes maintain them.
+    db = schema_editor.connection.alias
+    ShoppingRecord = apps.get_model('records', 'ShoppingRecord')
+    DailySpend = apps.get_model('records', 'DailySpend')
+    MonthlySpend = apps.get_model('records', 'MonthlySpend')
+    records = ShoppingRecord.objects.using(db).annotate(month=TruncMonth('purchase_date'))
+    totals = {'total_price': Sum('price'), 'total_quantity': Sum('quantity'), 'count': Count('id')}
+
+    def rollups(model, period, field):
+        rows = records.values(field, 'product__category_id', 'store_id').annotate(**totals).order_by()
+        model.objects.using(db).bulk_create(
+            [
+                model(
+                    category_id=row['product__category_id'],
+                    store_id=row['store_id'],
+                    total_price=row['total_price'],
+                    total_quantity=row['total_quantity'],
+                    count=row['count'],
+                    **{period: row[field]},
+                )
+                for row in rows
+            ],
+            batch_size=1000,
+        )
+
+    rollups(DailySpend, 'date', 'purchase_date')
+    rollups(MonthlySpend, 'month', 'month')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0003_shoppingrecord_spend_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_price', models.BigIntegerField(default=0)),
+                ('total_quantity', models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('date', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.category')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.store')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MonthlySpend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_price', models.BigIntegerField(default=0)),
+                ('total_quantity', models.DecimalField(decimal_places=3, default=0, max_digits=16)),
+                ('count', models.IntegerField(default=0)),
+                ('month', models.DateField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.category')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.store')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyspend',
+            constraint=models.UniqueConstraint(fields=('date', 'category', 'store'), name='records_dailyspend_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='monthlyspend',
+            constraint=models.UniqueConstraint(fields=('month', 'category', 'store'), name='records_monthlyspend_unique'),
+        ),
+        migrations.RunPython(backfill_rollups, migrations.RunPython.noop),
+    ]
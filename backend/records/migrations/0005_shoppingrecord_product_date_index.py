@@ -0,0 +1,17 @@
+# Generated by Django 5.0.8 on 2026-10-18 04:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0004_spend_rollups'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingrecord',
+            index=models.Index(fields=['product', 'purchase_date'], name='records_sr_product_date_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.0.8 on 2026-10-18 05:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0006_table_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingrecord',
+            index=models.Index(fields=['store', 'purchase_date'], name='records_sr_store_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingrecord',
+            index=models.Index(fields=['price', 'id'], name='records_sr_price_id_idx'),
+        ),
+    ]
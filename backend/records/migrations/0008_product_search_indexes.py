@@ -0,0 +1,46 @@
+from django.db import migrations
+
+# Django renders case-insensitive lookups on PostgreSQL as UPPER("name"::text) LIKE UPPER(%s),
+# so the indexes are built on the same expression.
+TRIGRAM_INDEXES = [
+    ('records_product_name_trgm', 'records_product'),
+    ('records_manufacturer_name_trgm', 'records_manufacturer'),
+    ('records_category_name_trgm', 'records_category'),
+]
+PREFIX_INDEX = 'records_product_name_prefix'
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table in TRIGRAM_INDEXES:
+            schema_editor.execute(
+                f'CREATE INDEX IF NOT EXISTS {name} ON {table} USING gin ((UPPER(name::text)) gin_trgm_ops)'
+            )
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {PREFIX_INDEX} ON records_product ((UPPER(name::text)) text_pattern_ops)'
+        )
+    elif vendor == 'sqlite':
+        # LIKE 'q%' can only use an index with NOCASE collation on SQLite
+        schema_editor.execute(f'CREATE INDEX IF NOT EXISTS {PREFIX_INDEX} ON records_product (name COLLATE NOCASE)')
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        for name, _ in TRIGRAM_INDEXES:
+            schema_editor.execute(f'DROP INDEX IF EXISTS {name}')
+    if vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute(f'DROP INDEX IF EXISTS {PREFIX_INDEX}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0007_shoppingrecord_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0008_product_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('index', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('change', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('matched_products', models.IntegerField()),
+                ('source_count', models.IntegerField()),
+                ('source_total_price', models.BigIntegerField()),
+                ('source_total_quantity', models.DecimalField(decimal_places=3, max_digits=16)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'month'), name='records_priceindex_unique')],
+            },
+        ),
+    ]
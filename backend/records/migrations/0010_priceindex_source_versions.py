@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0009_price_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='priceindex',
+            name='product_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='priceindex',
+            name='record_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
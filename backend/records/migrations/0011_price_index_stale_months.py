@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('records', '0010_priceindex_source_versions'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='priceindex',
+            name='product_version',
+        ),
+        migrations.RemoveField(
+            model_name='priceindex',
+            name='record_version',
+        ),
+        migrations.CreateModel(
+            name='PriceIndexStaleMonth',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField()),
+                ('marked_at', models.DateTimeField()),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='records.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('category', 'month'), name='records_priceindexstalemonth_unique')],
+            },
+        ),
+    ]
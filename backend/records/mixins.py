@@ -0,0 +1,201 @@
+import hashlib
+from calendar import timegm
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.decorators import classonlymethod
+from django.utils.http import http_date, quote_etag
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.response import Response
+
+from . import metrics, versioning
+from .fast_read import values_reader
+
+
+class AsyncDispatchMixin:
+    """
+    Lets a DRF view or viewset add `async def` versions of its handlers, used when served over ASGI.
+
+    An async handler is named after the method or viewset action with an `a`
+    prefix (`aget`, `alist`, `aexport`). With SERVER_MODE "asgi" the view is
+    an async view: async handlers run on the event loop (authentication and
+    permission checks run in a thread first), other handlers go through DRF's
+    normal `dispatch` in a thread. Otherwise the view is a plain sync view and
+    the async handlers are unused, so WSGI requests take no event loop or
+    thread hops.
+    """
+
+    # as_view() が SERVER_MODE から設定する
+    async_handlers = False
+
+    @classonlymethod
+    def as_view(cls, *args, **initkwargs):
+        async_handlers = settings.SERVER_MODE == "asgi"
+        view = super().as_view(*args, async_handlers=async_handlers, **initkwargs)
+        if async_handlers:
+            # ViewSet の as_view() は View.as_view() を通らないため、ここで非同期ビューとして印を付ける
+            markcoroutinefunction(view)
+        return view
+
+    def dispatch(self, request, *args, **kwargs):
+        if self.async_handlers:
+            return self.adispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    async def adispatch(self, request, *args, **kwargs):
+        method = request.method.lower()
+        handler = None
+        if method in self.http_method_names:
+            # ViewSet ではHTTPメソッドに対応するアクション名 (list, export) を使う
+            handler = getattr(self, f"a{getattr(self, 'action_map', {}).get(method, method)}", None)
+        if handler is None:
+            return await sync_to_async(super().dispatch)(request, *args, **kwargs)
+
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await handler(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class ReplicaReadMixin:
+    """
+    Marks a view whose safe-method requests may read from the read replica.
+
+    See `ReplicaRoutingMiddleware` and `ReplicaRouter`.
+    """
+
+    replica_reads = True
+
+
+class ConditionalGetMixin:
+    """
+    Adds ETag/Last-Modified validators to `list` and `retrieve` from the table's version stamp.
+
+    A matching `If-None-Match` (or `If-Modified-Since`) is answered with 304
+    after a single primary-key lookup, before the rows are read or serialized.
+    The model must be kept in `records.signals.VERSIONED_MODELS`.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(request, super().retrieve, *args, **kwargs)
+
+    def conditional_response(self, request, view, *args, **kwargs):
+        version, updated_at = versioning.current(self.queryset.model)
+        # 同じテーブルバージョンでもURL (ページ・詳細ID) ごとに内容が異なるため、パスも含める
+        path_hash = hashlib.md5(request.get_full_path().encode(), usedforsecurity=False).hexdigest()[:16]
+        etag = quote_etag(f"{self.queryset.model._meta.db_table}-{version}-{path_hash}")
+        last_modified = timegm(updated_at.utctimetuple()) if updated_at else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if response.status_code in (200, 304):
+            response["ETag"] = etag
+            if last_modified is not None:
+                response["Last-Modified"] = http_date(last_modified)
+            # ブラウザにキャッシュさせつつ、毎回 If-None-Match で再検証させる
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def select_related_paths(tree, prefix=""):
+    """
+    Flattens a `query.select_related` tree into `expand` paths (`product.category`).
+    """
+    paths = []
+    for name, children in tree.items():
+        path = f"{prefix}{name}"
+        paths.extend(select_related_paths(children, f"{path}.") or [path])
+    return paths
+
+
+class SparseFieldsetMixin:
+    """
+    Adds `?fields=` and `?expand=` query parameters to a viewset's read responses.
+
+    The serializer must use `DynamicFieldsMixin`. When `fields` or `expand` is
+    given, the queryset's joins are reduced to the embedded relations that are
+    also in `fields` (every `select_related()` relation is embedded when
+    `expand` is absent), so join cost follows what the client asked for.
+    """
+
+    def get_list_param(self, name):
+        """
+        Returns the comma-separated query parameter `name` as a list, or None if absent.
+        """
+        if self.request is None or self.request.method not in SAFE_METHODS or name not in self.request.query_params:
+            return None
+        return [value.strip() for value in self.request.query_params[name].split(",") if value.strip()]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_list_param("fields"))
+        kwargs.setdefault("expand", self.get_list_param("expand"))
+        return super().get_serializer(*args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_list_param("fields")
+        expand = self.get_list_param("expand")
+        if fields is None and expand is None:
+            return queryset
+        if expand is None:
+            # select_related() を引数なしで呼んだ queryset は結合先が分からないため、そのまま使う
+            if not isinstance(queryset.query.select_related, dict):
+                return queryset
+            expand = select_related_paths(queryset.query.select_related)
+        # 不正な expand/fields を SQL エラーではなく 400 として返すため、先にシリアライザで検証する
+        self.get_serializer()
+        relations = [path.replace(".", "__") for path in expand if fields is None or path.split(".")[0] in fields]
+        # select_related() を引数なしで呼ぶと全FKを結合するため、空の場合は呼ばない
+        queryset = queryset.select_related(None)
+        return queryset.select_related(*relations) if relations else queryset
+
+
+class FastListMixin(AsyncDispatchMixin):
+    """
+    Serves `list` from `.values()` rows through a ValuesReader, bypassing ModelSerializer.
+
+    The JSON shape is the same as the viewset's serializer. Requests with
+    `?fields=` or `?expand=` fall back to the serializer. `alist` is the
+    async version (see AsyncDispatchMixin).
+    """
+
+    def list(self, request, *args, **kwargs):
+        if "fields" in request.query_params or "expand" in request.query_params:
+            return super().list(request, *args, **kwargs)
+
+        reader, queryset = self.values_queryset()
+        if self.paginator is None:
+            return Response(metrics.time_serialization(reader.read, list(queryset)))
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(metrics.time_serialization(reader.read, page))
+
+    async def alist(self, request, *args, **kwargs):
+        if "fields" in request.query_params or "expand" in request.query_params:
+            return await sync_to_async(super().list)(request, *args, **kwargs)
+
+        reader, queryset = self.values_queryset()
+        if self.paginator is None:
+            return Response(metrics.time_serialization(reader.read, [row async for row in queryset]))
+        # DRF のページネーションは同期APIのため、ページ取得のクエリ1本だけスレッドで実行する
+        page = await sync_to_async(self.paginate_queryset)(queryset)
+        return self.get_paginated_response(metrics.time_serialization(reader.read, page))
+
+    def values_queryset(self):
+        """
+        Returns the ValuesReader of the serializer and the filtered queryset of its `.values()` rows.
+        """
+        reader = values_reader(self.get_serializer_class())
+        return reader, self.filter_queryset(self.get_queryset()).values(*reader.lookups)
@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router
 
 
 class Category(models.Model):
@@ -79,6 +79,18 @@ class Product(models.Model):
         return f"{self.name} ({'/'.join(details)})" if details else self.name
 
 
+class ShoppingRecordQuerySet(models.QuerySet):
+    def delete(self):
+        """
+        Deletes the records with bulk_edit.delete_records(), which also updates the rollup tables and the table version.
+        """
+        # bulk_edit はこのモジュールを読み込むため、ここで読み込む
+        from . import bulk_edit
+
+        deleted = bulk_edit.delete_records(self)
+        return deleted, {self.model._meta.label: deleted}
+
+
 class ShoppingRecord(models.Model):
     """
     Represents a record of a shopping transaction.
@@ -91,5 +103,145 @@ class ShoppingRecord(models.Model):
     quantity = models.DecimalField(max_digits=10, decimal_places=3)
     product = models.ForeignKey(Product, on_delete=models.PROTECT)
 
+    objects = ShoppingRecordQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["purchase_date", "id"], name="records_sr_date_id_idx"),
+            # Covering index for date-ranged aggregation (index-only scans on PostgreSQL)
+            models.Index(
+                fields=["purchase_date"],
+                include=["price", "quantity", "store", "product"],
+                name="records_sr_spend_cover_idx",
+            ),
+            models.Index(fields=["product", "purchase_date"], name="records_sr_product_date_idx"),
+            # List filters: store within a date range, and price range / ordering
+            models.Index(fields=["store", "purchase_date"], name="records_sr_store_date_idx"),
+            models.Index(fields=["price", "id"], name="records_sr_price_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.product} @ {self.store}"
+
+    def delete(self, using=None, keep_parents=False):
+        # 削除シグナルを受け取るモデルは QuerySet.delete() が1文の DELETE にできないため、
+        # 集計テーブルの更新はシグナルではなく一括削除と同じ経路で行う
+        deleted = (
+            ShoppingRecord.objects.using(using or router.db_for_write(ShoppingRecord)).filter(pk=self.pk).delete()
+        )
+        self.pk = None
+        return deleted
+
+
+class SpendRollup(models.Model):
+    """
+    Abstract base for pre-aggregated ShoppingRecord spending per category and store.
+
+    Rows are maintained incrementally by `records.rollups` and can be rebuilt
+    with `manage.py rebuild_rollups`.
+    """
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="+")
+    total_price = models.BigIntegerField(default=0)
+    total_quantity = models.DecimalField(max_digits=16, decimal_places=3, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+
+class DailySpend(SpendRollup):
+    """
+    Represents total spending per day, category and store.
+    """
+
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["date", "category", "store"], name="records_dailyspend_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id}/{self.store_id}: {self.total_price}"
+
+
+class MonthlySpend(SpendRollup):
+    """
+    Represents total spending per month (first day of the month), category and store.
+    """
+
+    month = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["month", "category", "store"], name="records_monthlyspend_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.category_id}/{self.store_id}: {self.total_price}"
+
+
+class PriceIndex(models.Model):
+    """
+    Represents the chained price index of a category for a month (first day of the month).
+
+    The index is 100 in the category's first month with purchases. Rows are
+    computed by `records.price_index`, which keeps the category's MonthlySpend
+    totals (`source_*`) to find months whose records changed since; edits
+    that keep the totals are marked in PriceIndexStaleMonth.
+    """
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    month = models.DateField()
+    index = models.DecimalField(max_digits=14, decimal_places=4)
+    # Price change from the category's previous month with purchases, in percent (null in the first month)
+    change = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    matched_products = models.IntegerField()
+    source_count = models.IntegerField()
+    source_total_price = models.BigIntegerField()
+    source_total_quantity = models.DecimalField(max_digits=16, decimal_places=3)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "month"], name="records_priceindex_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.category_id}: {self.index}"
+
+
+class PriceIndexStaleMonth(models.Model):
+    """
+    Represents a month of a category whose price index must be recomputed.
+
+    Marked by record and product edits that may keep the MonthlySpend totals
+    (see `records.price_index.mark_stale`) and consumed by the next refresh.
+    """
+
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="+")
+    month = models.DateField()
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["category", "month"], name="records_priceindexstalemonth_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.category_id}"
+
+
+class TableVersion(models.Model):
+    """
+    Represents a version stamp of a table, bumped on every write to it.
+    Used to answer conditional GETs without reading the table itself.
+    """
+
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
@@ -0,0 +1,28 @@
+from rest_framework.pagination import CursorPagination
+
+
+class DefaultCursorPagination(CursorPagination):
+    """
+    Default pagination for the reference-data viewsets.
+
+    Cursor pagination seeks by primary key instead of using OFFSET and does not
+    run a COUNT(*), so every page costs the same regardless of depth.
+    """
+
+    ordering = "id"
+    page_size = 100
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+class ShoppingRecordCursorPagination(CursorPagination):
+    """
+    Keyset pagination for shopping records ordered by (purchase_date, id).
+
+    Backed by the composite index on the same columns.
+    """
+
+    ordering = ("purchase_date", "id")
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 500
@@ -0,0 +1,208 @@
+import re
+from datetime import date
+
+from .models import ShoppingRecord
+
+INTERVALS = ("year", "month")
+PARTITION_KEY = "purchase_date"
+
+BOUND_RE = re.compile(r"FROM \('(\d{4}-\d{2}-\d{2})'\) TO \('(\d{4}-\d{2}-\d{2})'\)")
+
+
+def quote(name):
+    return '"%s"' % name.replace('"', '""')
+
+
+def period_start(day, interval):
+    """
+    Returns the first day of the `interval` ("year" or "month") containing `day`.
+    """
+    return date(day.year, 1, 1) if interval == "year" else date(day.year, day.month, 1)
+
+
+def next_period(start, interval):
+    """
+    Returns the first day of the `interval` after the one starting on `start`.
+    """
+    if interval == "year":
+        return date(start.year + 1, 1, 1)
+    return date(start.year + start.month // 12, start.month % 12 + 1, 1)
+
+
+def periods(first, last, interval):
+    """
+    Returns the start of every `interval` from the one containing `first` to the one containing `last`.
+    """
+    starts = [period_start(first, interval)]
+    while next_period(starts[-1], interval) <= last:
+        starts.append(next_period(starts[-1], interval))
+    return starts
+
+
+def partition_name(start, interval, table=ShoppingRecord._meta.db_table):
+    return f"{table}_y{start:%Y}" if interval == "year" else f"{table}_m{start:%Y%m}"
+
+
+def default_partition_name(table=ShoppingRecord._meta.db_table):
+    return f"{table}_default"
+
+
+def is_partitioned(cursor, table=ShoppingRecord._meta.db_table):
+    cursor.execute(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = %s AND c.relnamespace = current_schema()::regnamespace)",
+        [table],
+    )
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor, table=ShoppingRecord._meta.db_table):
+    """
+    Returns [(name, start, end)] for the range partitions of `table`, oldest first.
+
+    The default partition is left out.
+    """
+    cursor.execute(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = %s AND p.relnamespace = current_schema()::regnamespace",
+        [table],
+    )
+    partitions = []
+    for name, bound in cursor.fetchall():
+        match = BOUND_RE.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+
+def partition_interval(partitions):
+    """
+    Returns the interval of existing partitions from their bounds, or None if there are none.
+    """
+    if not partitions:
+        return None
+    _, start, end = partitions[-1]
+    return "year" if (end - start).days > 31 else "month"
+
+
+def create_partition(cursor, start, interval, table=ShoppingRecord._meta.db_table):
+    """
+    Adds the partition of `table` for the `interval` starting on `start`.
+
+    Rows of that period that went to the default partition are moved into it.
+    """
+    name = partition_name(start, interval, table)
+    end = next_period(start, interval)
+    cursor.execute(f"CREATE TABLE {quote(name)} (LIKE {quote(table)} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    # 既定パーティションに該当期間の行が残っていると ATTACH できないため、先に移す
+    cursor.execute(
+        f"WITH moved AS (DELETE FROM {quote(default_partition_name(table))} "
+        f"WHERE {PARTITION_KEY} >= %s AND {PARTITION_KEY} < %s RETURNING *) "
+        f"INSERT INTO {quote(name)} SELECT * FROM moved",
+        [start, end],
+    )
+    cursor.execute(
+        f"ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+    return name
+
+
+def create_future_partitions(cursor, today, ahead, table=ShoppingRecord._meta.db_table):
+    """
+    Creates the missing partitions from the latest one up to `ahead` periods after the one containing `today`.
+
+    Returns the names of the created partitions.
+    """
+    partitions = list_partitions(cursor, table)
+    interval = partition_interval(partitions)
+    if interval is None:
+        return []
+    last = period_start(today, interval)
+    for _ in range(ahead):
+        last = next_period(last, interval)
+    existing = {start for _, start, _ in partitions}
+    return [
+        create_partition(cursor, start, interval, table)
+        for start in periods(partitions[-1][1], last, interval)
+        if start not in existing
+    ]
+
+
+def convert_table(cursor, interval, today, ahead, table=ShoppingRecord._meta.db_table):
+    """
+    Replaces `table` with a copy range-partitioned by purchase_date per `interval`.
+
+    Partitions cover every existing row and `ahead` periods after `today`;
+    rows outside them go to a default partition. The primary key becomes
+    (id, purchase_date), as PostgreSQL requires, and the indexes and foreign
+    keys are recreated under their original names. Run it in a transaction:
+    the table is locked for the whole copy.
+    """
+    legacy = f"{table}_unpartitioned"
+    cursor.execute(f"LOCK TABLE {quote(table)} IN ACCESS EXCLUSIVE MODE")
+    cursor.execute(
+        "SELECT i.relname, pg_get_indexdef(i.oid) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+        "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary",
+        [table],
+    )
+    indexes = cursor.fetchall()
+    cursor.execute(
+        "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+        "WHERE conrelid = %s::regclass AND contype IN ('p', 'f')",
+        [table],
+    )
+    constraints = cursor.fetchall()
+    primary_key = next(name for name, kind, _ in constraints if kind == "p")
+    cursor.execute(f"SELECT MIN({PARTITION_KEY}), MAX({PARTITION_KEY}) FROM {quote(table)}")
+    first, last = cursor.fetchone()
+
+    # 索引名はスキーマ内で一意なので、元の名前で作り直せるよう旧テーブルから外しておく
+    cursor.execute(f"ALTER TABLE {quote(table)} RENAME TO {quote(legacy)}")
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX {quote(name)}")
+    cursor.execute(f"ALTER TABLE {quote(legacy)} DROP CONSTRAINT {quote(primary_key)}")
+
+    cursor.execute(
+        f"CREATE TABLE {quote(table)} (LIKE {quote(legacy)} INCLUDING DEFAULTS INCLUDING IDENTITY "
+        f"INCLUDING CONSTRAINTS) PARTITION BY RANGE ({PARTITION_KEY})"
+    )
+    cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(primary_key)} PRIMARY KEY (id, {PARTITION_KEY})")
+    cursor.execute(f"CREATE TABLE {quote(default_partition_name(table))} PARTITION OF {quote(table)} DEFAULT")
+    end = period_start(today, interval)
+    for _ in range(ahead):
+        end = next_period(end, interval)
+    for start in periods(min(first or today, today), max(last or today, end), interval):
+        create_partition(cursor, start, interval, table)
+
+    cursor.execute(f"INSERT INTO {quote(table)} SELECT * FROM {quote(legacy)}")
+    cursor.execute(f"DROP TABLE {quote(legacy)}")
+    # LIKE ... INCLUDING IDENTITY は新しいシーケンスを作るので、名前と現在値を引き継ぐ
+    cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+    sequence = cursor.fetchone()[0]
+    if sequence.split(".")[-1].strip('"') != f"{table}_id_seq":
+        cursor.execute(f"ALTER SEQUENCE {sequence} RENAME TO {quote(f'{table}_id_seq')}")
+    cursor.execute(
+        f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {quote(table)}",
+        [table],
+    )
+
+    for _, definition in indexes:
+        cursor.execute(definition)
+    for name, kind, definition in constraints:
+        if kind == "f":
+            cursor.execute(f"ALTER TABLE {quote(table)} ADD CONSTRAINT {quote(name)} {definition}")
+
+
+def detach_partitions(cursor, before, table=ShoppingRecord._meta.db_table):
+    """
+    Detaches the partitions of `table` that end on or before `before`.
+
+    The detached tables keep their rows under their partition names, ready
+    to be archived (e.g. with pg_dump) and dropped. Returns [(name, start, end)].
+    """
+    detached = [partition for partition in list_partitions(cursor, table) if partition[2] <= before]
+    for name, _, _ in detached:
+        cursor.execute(f"ALTER TABLE {quote(table)} DETACH PARTITION {quote(name)}")
+    return detached
@@ -0,0 +1,268 @@
+from decimal import Decimal
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import versioning
+from .analytics import QUANTITY_PLACES
+from .models import MonthlySpend, PriceIndex, PriceIndexStaleMonth, ShoppingRecord
+
+BASE_INDEX = Decimal(100)
+INDEX_PLACES = Decimal("0.0001")
+CHANGE_PLACES = Decimal("0.01")
+
+
+def month_index(month):
+    return month.year * 12 + month.month - 1
+
+
+def source_totals():
+    """
+    Returns {(category_id, month): (count, total_price, total_quantity)} from MonthlySpend.
+    """
+    rows = (
+        MonthlySpend.objects.values("category_id", "month")
+        .annotate(count=Sum("count"), total_price=Sum("total_price"), total_quantity=Sum("total_quantity"))
+        .order_by()
+    )
+    return {
+        (row["category_id"], row["month"]): (
+            row["count"],
+            row["total_price"],
+            Decimal(row["total_quantity"]).quantize(QUANTITY_PLACES),
+        )
+        for row in rows
+        if row["count"]
+    }
+
+
+def stale_months(sources, stored):
+    """
+    Returns {category_id: first month to recompute} for categories whose stored rows differ from `sources`.
+
+    `stored` maps (category_id, month) to the stored (count, total_price, total_quantity).
+    """
+    months = {}
+    for category_id, month in sources.keys() | stored.keys():
+        months.setdefault(category_id, []).append(month)
+    stale = {}
+    for category_id, category_months in months.items():
+        for month in sorted(category_months):
+            if sources.get((category_id, month)) != stored.get((category_id, month)):
+                stale[category_id] = month
+                break
+    return stale
+
+
+def product_month_prices(category_ids, since):
+    """
+    Returns arrays of (category, product/unit code, month index, total price, total quantity) per product and month.
+
+    Only purchases with a positive quantity from `since` on are included.
+    """
+    rows = list(
+        ShoppingRecord.objects.filter(product__category_id__in=category_ids, purchase_date__gte=since, quantity__gt=0)
+        .annotate(month=TruncMonth("purchase_date"))
+        .values_list("product__category_id", "product_id", "product__unit_id", "month")
+        .annotate(total_price=Sum("price"), total_quantity=Sum("quantity"))
+        .order_by()
+    )
+    if not rows:
+        empty = np.zeros(0, "int64")
+        return empty, empty, empty, np.zeros(0), np.zeros(0)
+    categories, products, units, months, prices, quantities = zip(*rows)
+    # 単位が違えば単価は比べられないので、(商品, 単位) を1品目として扱う
+    _, items = np.unique(np.stack([products, units], axis=1), axis=0, return_inverse=True)
+    return (
+        np.asarray(categories, "int64"),
+        items.reshape(-1),
+        np.asarray([month_index(month) for month in months], "int64"),
+        np.asarray(prices, "float64"),
+        np.asarray(quantities, "float64"),
+    )
+
+
+def chain_links(observed_categories, observed_months, categories, items, months, prices, quantities):
+    """
+    Computes the price change of each observed (category, month) from the category's previous observed month.
+
+    The observed arrays must be sorted by category, then month. Each link is
+    a Laspeyres ratio over the items bought in both months, weighted by the
+    quantities of the earlier month: sum(p1 * q0) / sum(p0 * q0). Returns
+    (links, matched item counts); links without matched items are 1.
+    """
+    span = int(max(observed_months.max(), months.max(initial=0))) + 1
+    observed_keys = observed_categories * span + observed_months
+    # 各行の (分類, 月) の位置と、同じ分類で1つ前に購入があった月
+    keys = categories * span + months
+    position = np.minimum(np.searchsorted(observed_keys, keys), len(observed_keys) - 1)
+    has_previous = (
+        (observed_keys[position] == keys)
+        & (position > 0)
+        & (observed_categories[np.maximum(position - 1, 0)] == categories)
+    )
+    previous_months = observed_months[np.maximum(position - 1, 0)]
+
+    item_keys = items * span + months
+    order = np.argsort(item_keys)
+    sorted_keys = item_keys[order]
+    wanted = items * span + previous_months
+    found = np.minimum(np.searchsorted(sorted_keys, wanted), len(sorted_keys) - 1)
+    matched = has_previous & (sorted_keys[found] == wanted)
+    previous = order[found[matched]]
+
+    unit_prices = prices[matched] / quantities[matched]
+    positions = position[matched]
+    size = len(observed_keys)
+    numerator = np.bincount(positions, weights=unit_prices * quantities[previous], minlength=size)
+    denominator = np.bincount(positions, weights=prices[previous], minlength=size)
+    links = np.divide(numerator, denominator, out=np.ones(size), where=denominator > 0)
+    return links, np.bincount(positions, minlength=size)
+
+
+def compute(sources, stale, stored_indexes):
+    """
+    Returns the PriceIndex rows of every category in `stale` from its stale month on.
+
+    `stored_indexes` maps (category_id, month) to the stored index of the months kept.
+    """
+    observed = sorted((category_id, month) for category_id, month in sources if category_id in stale)
+    if not observed:
+        return []
+    observed_categories = np.asarray([category_id for category_id, _ in observed], "int64")
+    observed_months = np.asarray([month_index(month) for _, month in observed], "int64")
+
+    # 分類ごとに再計算する最初の位置と、読む必要のある最初の月 (その前月)
+    first = {}
+    since = None
+    for i, (category_id, month) in enumerate(observed):
+        if category_id not in first and month >= stale[category_id]:
+            first[category_id] = i
+            start = observed[i - 1][1] if i and observed[i - 1][0] == category_id else month
+            since = start if since is None or start < since else since
+    if not first:
+        return []
+    links, matched = chain_links(observed_categories, observed_months, *product_month_prices(list(stale), since))
+
+    results = []
+    index = None
+    for i, (category_id, month) in enumerate(observed):
+        if i < first.get(category_id, len(observed)):
+            continue
+        first_month = i == 0 or observed[i - 1][0] != category_id
+        if first_month:
+            index, change = BASE_INDEX, None
+        else:
+            if i == first[category_id]:
+                index = stored_indexes[observed[i - 1]]
+            # 保存する丸めた値から連鎖させ、差分更新と全体の再計算で結果を揃える
+            index = Decimal(str(float(index) * links[i])).quantize(INDEX_PLACES)
+            change = Decimal(str((links[i] - 1) * 100)).quantize(CHANGE_PLACES)
+        count, total_price, total_quantity = sources[(category_id, month)]
+        results.append(
+            PriceIndex(
+                category_id=category_id,
+                month=month,
+                index=index,
+                change=change,
+                matched_products=0 if first_month else int(matched[i]),
+                source_count=count,
+                source_total_price=total_price,
+                source_total_quantity=total_quantity,
+            )
+        )
+    return results
+
+
+def mark_stale(keys):
+    """
+    Marks the months of (category_id, date) pairs to be recomputed by the next refresh().
+
+    Used for edits that may keep the MonthlySpend totals (a record moved to
+    another product of the same category, a product's unit changed), which
+    refresh() cannot see from the totals.
+    """
+    now = timezone.now()
+    months = {(category_id, day.replace(day=1)) for category_id, day in keys if category_id is not None}
+    if months:
+        # 既にある印も marked_at を進め、実行中の refresh() に消されないようにする
+        PriceIndexStaleMonth.objects.bulk_create(
+            [
+                PriceIndexStaleMonth(category_id=category_id, month=month, marked_at=now)
+                for category_id, month in months
+            ],
+            update_conflicts=True,
+            unique_fields=["category", "month"],
+            update_fields=["marked_at"],
+        )
+
+
+def find_stale(rebuild=False):
+    """
+    Returns (stale marks, sources, stored rows, stale months) for refresh().
+
+    A category is stale from the first month whose MonthlySpend totals
+    differ from the stored ones or that mark_stale() marked, whichever is
+    earlier. `rebuild` makes every month stale.
+    """
+    # データより先に読み、読んだ後に付いた印は次の更新まで残す
+    marks = list(PriceIndexStaleMonth.objects.values_list("pk", "category_id", "month", "marked_at"))
+    sources = source_totals()
+    stored = {
+        (row.category_id, row.month): row
+        for row in PriceIndex.objects.only(
+            "category_id", "month", "index", "source_count", "source_total_price", "source_total_quantity"
+        )
+    }
+    if rebuild:
+        stale = {}
+        for category_id, month in sources.keys() | stored.keys():
+            stale[category_id] = min(month, stale.get(category_id, month))
+    else:
+        stale = stale_months(
+            sources,
+            {
+                key: (row.source_count, row.source_total_price, row.source_total_quantity)
+                for key, row in stored.items()
+            },
+        )
+        for _, category_id, month, _ in marks:
+            stale[category_id] = min(month, stale.get(category_id, month))
+    return marks, sources, stored, stale
+
+
+def refresh(rebuild=False):
+    """
+    Brings the PriceIndex table up to date and returns the number of rows written.
+
+    Only the months of each category from the first one whose records
+    changed (see find_stale()) are recomputed, so new records in the latest
+    month recompute that month alone. `rebuild` recomputes everything.
+
+    Run by the `compute_price_index` command; requests only read the stored
+    rows. Concurrent refreshes are serialized by the PriceIndex TableVersion
+    row, which is locked before writing; a refresh that waited finds
+    nothing left to do.
+    """
+    if not rebuild and not find_stale()[3]:
+        return 0
+    with transaction.atomic():
+        # 行ロックを取り、待たされた場合は先に更新した側のコミット後の状態から差分を求め直す
+        versioning.bump(PriceIndex)
+        marks, sources, stored, stale = find_stale(rebuild)
+        consumed = Q(pk__in=[])
+        for pk, _, _, marked_at in marks:
+            consumed |= Q(pk=pk, marked_at=marked_at)
+        PriceIndexStaleMonth.objects.filter(consumed).delete()
+        if not stale:
+            return 0
+        rows = compute(sources, stale, {key: row.index for key, row in stored.items()})
+        stale_rows = Q()
+        for category_id, month in stale.items():
+            stale_rows |= Q(category_id=category_id, month__gte=month)
+        PriceIndex.objects.filter(stale_rows).delete()
+        PriceIndex.objects.bulk_create(rows)
+        return len(rows)
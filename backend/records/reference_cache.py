@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from .models import Category, Manufacturer, Origin, Product, Store, TableVersion, Unit
+
+# TableVersion rows read in the current request, or None outside requests (see records.signals)
+request_versions = ContextVar("reference_cache_request_versions", default=None)
+
+
+class ModelCache:
+    """
+    A per-worker LRU cache of model instances by primary key.
+
+    Writes in this worker clear the cache immediately through `records.signals`.
+    Writes in other workers are seen through the TableVersion of each table in
+    `versioned` (see check_versions()). Entries also expire after `ttl_setting`
+    seconds (`REFERENCE_CACHE_TTL` by default), which bounds how long a write
+    that bypasses versioning can be served stale.
+    """
+
+    def __init__(self, model, select_related=(), ttl_setting="REFERENCE_CACHE_TTL", versioned=()):
+        self.model = model
+        self.select_related = select_related
+        self.ttl_setting = ttl_setting
+        self.tables = [versioned_model._meta.db_table for versioned_model in versioned]
+        self.versions = None
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, pk):
+        """
+        Returns the instance for `pk`, reading the database only on a miss.
+
+        Raises `model.DoesNotExist` if there is no such row.
+        """
+        if self.tables:
+            check_versions()
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(pk)
+            if entry is not None and now - entry[1] < getattr(settings, self.ttl_setting):
+                self.entries.move_to_end(pk)
+                return entry[0]
+
+        instance = self.model.objects.select_related(*self.select_related).get(pk=pk)
+        with self.lock:
+            self.entries[pk] = (instance, now)
+            self.entries.move_to_end(pk)
+            while len(self.entries) > settings.REFERENCE_CACHE_MAX_SIZE:
+                self.entries.popitem(last=False)
+        return instance
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def sync(self, versions):
+        """
+        Clears the cache if any of its tables has a different version than when it was filled.
+        """
+        current = [versions.get(table, 0) for table in self.tables]
+        with self.lock:
+            if current != self.versions:
+                self.entries.clear()
+                self.versions = current
+
+
+caches = {
+    Category: ModelCache(Category, versioned=[Category]),
+    Unit: ModelCache(Unit, versioned=[Unit]),
+    Manufacturer: ModelCache(Manufacturer, versioned=[Manufacturer]),
+    Origin: ModelCache(Origin, versioned=[Origin]),
+    Store: ModelCache(Store, versioned=[Store]),
+    Product: ModelCache(
+        Product,
+        select_related=("category", "unit", "manufacturer", "origin"),
+        versioned=[Product, Category, Unit, Manufacturer, Origin],
+    ),
+    # Users for JWT authentication (see records.authentication)
+    get_user_model(): ModelCache(get_user_model(), ttl_setting="AUTH_USER_CACHE_TTL"),
+}
+
+# model -> caches holding copies of its rows (products embed their related rows)
+DEPENDENT_CACHES = {
+    Category: [caches[Category], caches[Product]],
+    Unit: [caches[Unit], caches[Product]],
+    Manufacturer: [caches[Manufacturer], caches[Product]],
+    Origin: [caches[Origin], caches[Product]],
+    Store: [caches[Store]],
+    Product: [caches[Product]],
+    get_user_model(): [caches[get_user_model()]],
+}
+
+
+def begin_request(**kwargs):
+    request_versions.set({})
+
+
+def end_request(**kwargs):
+    request_versions.set(None)
+
+
+def check_versions():
+    """
+    Clears the caches whose tables were written since they were filled, e.g. by another worker.
+
+    Reads the versions of every cached table in one query. Within a request
+    they are read once, by the first cache lookup; outside requests every
+    lookup reads them.
+    """
+    checked = request_versions.get()
+    if checked:
+        return
+    tables = {table for cache in caches.values() for table in cache.tables}
+    versions = dict.fromkeys(tables, 0)
+    versions.update(TableVersion.objects.filter(table__in=tables).values_list("table", "version"))
+    for cache in caches.values():
+        cache.sync(versions)
+    if checked is not None:
+        # ContextVar.set() ではなく dict を書き換え、sync_to_async のスレッドからも同じリクエストで共有する
+        checked.update(versions)
+
+
+def invalidate(model):
+    """
+    Clears every cache that may hold rows of `model`.
+    """
+    for cache in DEPENDENT_CACHES.get(model, []):
+        cache.clear()
+
+
+def clear_all():
+    for cache in caches.values():
+        cache.clear()
@@ -0,0 +1,79 @@
+import codecs
+import io
+
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson が直接扱えない型 (Decimal, 遅延評価の文字列など) は DRF と同じ変換にかける
+drf_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    The output follows JSONRenderer with the default settings (compact,
+    unescaped UTF-8, U+2028/U+2029 escaped): dates, times and datetimes are
+    encoded natively in the same ISO 8601 form, and the remaining types (e.g.
+    Decimal as a float) go through DRF's JSONEncoder. It is not byte-identical
+    for every value:
+
+    - Floats are the same numbers but orjson writes exponents its own way
+      (1e-7, not 1e-07).
+    - NaN and Infinity are rendered as null, where JSONRenderer (STRICT_JSON)
+      raises ValueError.
+    - UTC offsets with seconds are truncated to minutes.
+
+    API fields are integers, Decimals and dates, so responses are unaffected;
+    FastJSONTest pins these differences.
+
+    Data orjson rejects (e.g. integers beyond 64 bits), indented output
+    (browsable API, `; indent=` media type parameter) and non-default JSON
+    settings are rendered by JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or not self.is_default_format(accepted_media_type, renderer_context):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=drf_default, option=orjson.OPT_UTC_Z)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
+
+    def is_default_format(self, accepted_media_type, renderer_context):
+        return (
+            self.encoder_class is encoders.JSONEncoder
+            and not self.ensure_ascii
+            and self.compact
+            and self.get_indent(accepted_media_type, renderer_context or {}) is None
+        )
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+
+    Bodies orjson rejects are parsed again by JSONParser, so invalid JSON gets
+    the same error message as before. Integers beyond 64 bits are read as
+    floats, which the serializer fields then reject as usual.
+    """
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or not self.strict or codecs.lookup(encoding).name != "utf-8":
+            return super().parse(stream, media_type, parser_context)
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
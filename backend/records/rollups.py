@@ -0,0 +1,226 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q, Sum
+
+from .models import DailySpend, MonthlySpend, ShoppingRecord
+
+
+def record_deltas(rows, sign=1):
+    """
+    Sums (purchase_date, category_id, store_id, price, quantity) rows per rollup key.
+
+    Returns {(purchase_date, category_id, store_id): [price, quantity, count]}
+    with every value multiplied by `sign` (use -1 for removed rows).
+    """
+    deltas = defaultdict(lambda: [0, Decimal(0), 0])
+    for purchase_date, category_id, store_id, price, quantity in rows:
+        delta = deltas[(purchase_date, category_id, store_id)]
+        delta[0] += sign * price
+        delta[1] += sign * Decimal(quantity)
+        delta[2] += sign
+    return deltas
+
+
+def merge_deltas(*deltas):
+    """
+    Adds several record_deltas() results together, dropping keys that cancel out.
+    """
+    merged = defaultdict(lambda: [0, Decimal(0), 0])
+    for delta in deltas:
+        for key, (price, quantity, count) in delta.items():
+            merged[key][0] += price
+            merged[key][1] += quantity
+            merged[key][2] += count
+    return {key: value for key, value in merged.items() if any(value)}
+
+
+def monthly_deltas(deltas):
+    """
+    Sums record_deltas() per (month, category_id, store_id).
+    """
+    monthly = defaultdict(lambda: [0, Decimal(0), 0])
+    for (purchase_date, category_id, store_id), (price, quantity, count) in deltas.items():
+        value = monthly[(purchase_date.replace(day=1), category_id, store_id)]
+        value[0] += price
+        value[1] += quantity
+        value[2] += count
+    return monthly
+
+
+def add_deltas(deltas, batch_size=1000):
+    """
+    Adds record_deltas() of inserted records to the rollup tables with set-based upserts.
+
+    Bulk insert counterpart of apply_deltas(): each batch of keys is one
+    `INSERT ... ON CONFLICT DO UPDATE SET total = total + excluded.total`
+    (PostgreSQL and SQLite 3.24+). Counts only grow, so no row is emptied.
+    """
+    quote = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        for model, date_field, level in [
+            (DailySpend, "date", deltas),
+            (MonthlySpend, "month", monthly_deltas(deltas)),
+        ]:
+            table = quote(model._meta.db_table)
+            keys = [quote(model._meta.get_field(name).column) for name in (date_field, "category", "store")]
+            totals = [quote(name) for name in ("total_price", "total_quantity", "count")]
+            sql = (
+                f"INSERT INTO {table} ({', '.join(keys + totals)}) VALUES {{values}} "
+                f"ON CONFLICT ({', '.join(keys)}) DO UPDATE SET "
+                + ", ".join(f"{column} = {table}.{column} + excluded.{column}" for column in totals)
+            )
+            rows = [(*key, *value) for key, value in level.items()]
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start : start + batch_size]
+                values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch))
+                cursor.execute(sql.format(values=values), [param for row in batch for param in row])
+
+
+def apply_deltas(deltas):
+    """
+    Applies record_deltas() to the daily and monthly rollup tables.
+
+    Each key is an `UPDATE ... SET total = total + delta`; a zero row is inserted
+    first when the key does not exist yet, so concurrent writers never lose an
+    increment. Rows of these keys whose count drops to zero are deleted.
+    """
+    with transaction.atomic():
+        for model, date_field, level in [
+            (DailySpend, "date", deltas),
+            (MonthlySpend, "month", monthly_deltas(deltas)),
+        ]:
+            emptied = Q()
+            for (period, category_id, store_id), (price, quantity, count) in level.items():
+                if not (price or quantity or count):
+                    continue
+                key = {date_field: period, "category_id": category_id, "store_id": store_id}
+                changes = {
+                    "total_price": F("total_price") + price,
+                    "total_quantity": F("total_quantity") + quantity,
+                    "count": F("count") + count,
+                }
+                if not model.objects.filter(**key).update(**changes):
+                    model.objects.bulk_create([model(**key)], ignore_conflicts=True)
+                    model.objects.filter(**key).update(**changes)
+                if count < 0:
+                    emptied |= Q(**key)
+            if emptied:
+                # 減らしたキーだけを対象にし、表全体を走査しない
+                model.objects.filter(emptied, count__lte=0).delete()
+
+
+def record_row(record, category_id):
+    """
+    Converts a ShoppingRecord instance into a record_deltas() row.
+
+    The fields are converted with `to_python()` because a saved instance keeps
+    the values it was given, e.g. `purchase_date="2025-01-01"`.
+    """
+    fields = ShoppingRecord._meta
+    return (
+        fields.get_field("purchase_date").to_python(record.purchase_date),
+        category_id,
+        record.store_id,
+        fields.get_field("price").to_python(record.price),
+        fields.get_field("quantity").to_python(record.quantity),
+    )
+
+
+def rollup_rows(records):
+    """
+    Converts ShoppingRecord instances into record_deltas() rows.
+
+    Uses the cached `product` of each record when available.
+    """
+    return [record_row(record, record.product.category_id) for record in records]
+
+
+def queryset_rows(queryset):
+    """
+    Reads record_deltas() rows for a ShoppingRecord queryset in a single query.
+    """
+    return queryset.values_list("purchase_date", "product__category_id", "store_id", "price", "quantity")
+
+
+def expected_rollups():
+    """
+    Aggregates ShoppingRecord from scratch into daily and monthly rollup values.
+
+    Returns two dicts keyed like record_deltas(): one per day and one per month.
+    """
+    daily = {}
+    monthly = defaultdict(lambda: [0, Decimal(0), 0])
+    rows = (
+        ShoppingRecord.objects.values("purchase_date", "product__category_id", "store_id")
+        .annotate(total_price=Sum("price"), total_quantity=Sum("quantity"), count=Count("id"))
+        .order_by()
+    )
+    for row in rows.iterator():
+        key = (row["purchase_date"], row["product__category_id"], row["store_id"])
+        value = [row["total_price"], Decimal(row["total_quantity"]), row["count"]]
+        daily[key] = value
+        month = monthly[(key[0].replace(day=1), key[1], key[2])]
+        month[0] += value[0]
+        month[1] += value[1]
+        month[2] += value[2]
+    return daily, dict(monthly)
+
+
+def stored_rollups():
+    """
+    Reads the current rollup tables into the same shape as expected_rollups().
+    """
+    daily = {
+        (row[0], row[1], row[2]): [row[3], row[4], row[5]]
+        for row in DailySpend.objects.values_list(
+            "date", "category_id", "store_id", "total_price", "total_quantity", "count"
+        )
+    }
+    monthly = {
+        (row[0], row[1], row[2]): [row[3], row[4], row[5]]
+        for row in MonthlySpend.objects.values_list(
+            "month", "category_id", "store_id", "total_price", "total_quantity", "count"
+        )
+    }
+    return daily, monthly
+
+
+def rebuild(batch_size=1000):
+    """
+    Replaces both rollup tables with values recomputed from ShoppingRecord.
+    """
+    daily, monthly = expected_rollups()
+    with transaction.atomic():
+        DailySpend.objects.all().delete()
+        MonthlySpend.objects.all().delete()
+        DailySpend.objects.bulk_create(
+            [
+                DailySpend(
+                    date=day,
+                    category_id=category_id,
+                    store_id=store_id,
+                    total_price=price,
+                    total_quantity=quantity,
+                    count=count,
+                )
+                for (day, category_id, store_id), (price, quantity, count) in daily.items()
+            ],
+            batch_size=batch_size,
+        )
+        MonthlySpend.objects.bulk_create(
+            [
+                MonthlySpend(
+                    month=month,
+                    category_id=category_id,
+                    store_id=store_id,
+                    total_price=price,
+                    total_quantity=quantity,
+                    count=count,
+                )
+                for (month, category_id, store_id), (price, quantity, count) in monthly.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(daily), len(monthly)
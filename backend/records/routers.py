@@ -0,0 +1,53 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# 書き込んだクライアントを REPLICA_PIN_SECONDS の間プライマリに固定する Cookie (レプリケーション遅延対策)
+PRIMARY_PIN_COOKIE = "use_primary"
+
+
+class RoutingState:
+    """
+    Replica routing decision for one request, set up by `ReplicaRoutingMiddleware`.
+    """
+
+    __slots__ = ("use_replica", "wrote")
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+# 非同期ビューのクエリは sync_to_async のスレッドで実行されるため、コンテキスト変数で引き継ぐ
+# (状態は書き換え可能なオブジェクトなので、スレッド側で記録した書き込みも見える)
+current_routing = ContextVar("current_routing", default=None)
+
+
+class ReplicaRouter:
+    """
+    Sends reads to the `REPLICA_DATABASE` alias for requests marked by `ReplicaRoutingMiddleware`.
+
+    Everything else (writes, management commands, requests to other views)
+    uses the default database. Once a request writes, its remaining reads go
+    to the primary as well, so it reads its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is not None and state.use_replica and not state.wrote:
+            return settings.REPLICA_DATABASE
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカはプライマリの複製なので、どちらから読んだオブジェクトも関連付けてよい
+        aliases = {DEFAULT_DB_ALIAS, settings.REPLICA_DATABASE}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
@@ -0,0 +1,42 @@
+from django.db.models import Case, Q, Value, When
+
+from .models import Category, Manufacturer, Product
+
+# pg_trgm は3文字のトライグラムで索引するため、それより短い検索語は前方一致のみにする
+TRIGRAM_MIN_LENGTH = 3
+# 名前が一致したメーカー・カテゴリーをIN句に展開する上限
+MAX_RELATED_MATCHES = 200
+
+
+def search_products(query):
+    """
+    Returns products matching `query`, best matches first.
+
+    Ranking: product name prefix, then product name substring, then products
+    whose manufacturer or category name contains `query`. Queries shorter
+    than TRIGRAM_MIN_LENGTH only match product name prefixes.
+
+    Every condition is a case-insensitive LIKE on a single table so it can use
+    the indexes from migration 0008 (trigram GIN and prefix btree indexes on
+    PostgreSQL, a NOCASE prefix index on SQLite). Manufacturer and category
+    matches are resolved to ids first; joining them into the product filter
+    would turn the OR into a scan of every product.
+    """
+    products = Product.objects.all()
+    if len(query) < TRIGRAM_MIN_LENGTH:
+        return products.filter(name__istartswith=query).order_by("name", "id")
+
+    matches = Q(name__icontains=query)
+    manufacturer_ids = Manufacturer.objects.filter(name__icontains=query).values_list("id", flat=True)
+    category_ids = Category.objects.filter(name__icontains=query).values_list("id", flat=True)
+    for field, ids in (("manufacturer_id", manufacturer_ids), ("category_id", category_ids)):
+        ids = list(ids[:MAX_RELATED_MATCHES])
+        if ids:
+            matches |= Q(**{f"{field}__in": ids})
+
+    rank = Case(
+        When(name__istartswith=query, then=Value(0)),
+        When(name__icontains=query, then=Value(1)),
+        default=Value(2),
+    )
+    return products.filter(matches).annotate(search_rank=rank).order_by("search_rank", "name", "id")
@@ -1,9 +1,73 @@
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
 
+from . import metrics, reference_cache, rollups
 from .models import Category, Manufacturer, Origin, Product, ShoppingRecord, Store, Unit
 
 
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    PrimaryKeyRelatedField that resolves ids through the per-worker reference cache.
+    """
+
+    def to_internal_value(self, data):
+        if self.pk_field is not None:
+            data = self.pk_field.to_internal_value(data)
+        model = self.get_queryset().model
+        try:
+            if isinstance(data, bool):
+                raise TypeError
+            return reference_cache.caches[model].get(model._meta.pk.to_python(data))
+        except model.DoesNotExist:
+            self.fail("does_not_exist", pk_value=data)
+        except (TypeError, ValueError, DjangoValidationError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer mixin that accepts `fields` and `expand` keyword arguments.
+
+    `fields` keeps only the listed fields in the representation (write-only
+    fields are always kept). `expand` lists the relations to embed, using dots
+    for nested relations (`product.category` also expands `product`); other
+    nested serializers are rendered as primary keys. With `expand=None`
+    every relation stays embedded.
+
+    Representations are timed for sampled requests (see `records.middleware`).
+    """
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        relations = {name for name, field in self.fields.items() if isinstance(field, serializers.BaseSerializer)}
+
+        if fields is not None:
+            unknown = set(fields) - set(self.fields)
+            if unknown:
+                raise serializers.ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}."})
+            for name in list(self.fields):
+                if name not in fields and not self.fields[name].write_only:
+                    self.fields.pop(name)
+
+        if expand is not None:
+            expanded = {path.split(".")[0] for path in expand}
+            unknown = expanded - relations
+            if unknown:
+                raise serializers.ValidationError({"expand": f"Unknown relations: {', '.join(sorted(unknown))}."})
+            for name in relations & set(self.fields):
+                field = self.fields[name]
+                if name in expanded:
+                    nested = [path.split(".", 1)[1] for path in expand if path.startswith(f"{name}.")]
+                    self.fields[name] = type(field)(read_only=True, expand=nested)
+                else:
+                    self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
+    def to_representation(self, instance):
+        return metrics.time_serialization(super().to_representation, instance)
+
+
 class UserSerializer(serializers.ModelSerializer):
     """
     Serializer for User model.
@@ -14,7 +78,7 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "email"]
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Category model.
     """
@@ -24,7 +88,7 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
-class UnitSerializer(serializers.ModelSerializer):
+class UnitSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Unit model.
     """
@@ -34,7 +98,7 @@ class UnitSerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
-class ManufacturerSerializer(serializers.ModelSerializer):
+class ManufacturerSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Manufacturer model.
     """
@@ -44,7 +108,7 @@ class ManufacturerSerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
-class OriginSerializer(serializers.ModelSerializer):
+class OriginSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Origin model.
     """
@@ -54,7 +118,7 @@ class OriginSerializer(serializers.ModelSerializer):
         fields = ["id", "name"]
 
 
-class StoreSerializer(serializers.ModelSerializer):
+class StoreSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Store model.
     """
@@ -64,7 +128,7 @@ class StoreSerializer(serializers.ModelSerializer):
         fields = ["id", "name", "location"]
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for Product model.
     """
@@ -74,12 +138,12 @@ class ProductSerializer(serializers.ModelSerializer):
     manufacturer = ManufacturerSerializer(read_only=True)
     origin = OriginSerializer(read_only=True)
 
-    category_id = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all(), write_only=True)
-    unit_id = serializers.PrimaryKeyRelatedField(queryset=Unit.objects.all(), write_only=True)
-    manufacturer_id = serializers.PrimaryKeyRelatedField(
+    category_id = CachedPrimaryKeyRelatedField(queryset=Category.objects.all(), write_only=True)
+    unit_id = CachedPrimaryKeyRelatedField(queryset=Unit.objects.all(), write_only=True)
+    manufacturer_id = CachedPrimaryKeyRelatedField(
         queryset=Manufacturer.objects.all(), required=False, allow_null=True, write_only=True
     )
-    origin_id = serializers.PrimaryKeyRelatedField(
+    origin_id = CachedPrimaryKeyRelatedField(
         queryset=Origin.objects.all(), required=False, allow_null=True, write_only=True
     )
 
@@ -113,7 +177,7 @@ class ProductSerializer(serializers.ModelSerializer):
         return super().update(instance, validated_data)
 
 
-class ShoppingRecordSerializer(serializers.ModelSerializer):
+class ShoppingRecordSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Serializer for ShoppingRecord model.
     """
@@ -121,8 +185,8 @@ class ShoppingRecordSerializer(serializers.ModelSerializer):
     store = StoreSerializer(read_only=True)
     product = ProductSerializer(read_only=True)
 
-    store_id = serializers.PrimaryKeyRelatedField(queryset=Store.objects.all(), write_only=True)
-    product_id = serializers.PrimaryKeyRelatedField(queryset=Product.objects.all(), write_only=True)
+    store_id = CachedPrimaryKeyRelatedField(queryset=Store.objects.all(), write_only=True)
+    product_id = CachedPrimaryKeyRelatedField(queryset=Product.objects.all(), write_only=True)
 
     class Meta:
         model = ShoppingRecord
@@ -137,3 +201,62 @@ class ShoppingRecordSerializer(serializers.ModelSerializer):
         instance.store = validated_data.pop("store_id", instance.store)
         instance.product = validated_data.pop("product_id", instance.product)
         return super().update(instance, validated_data)
+
+
+class ShoppingRecordBulkListSerializer(serializers.ListSerializer):
+    """
+    List serializer that validates and creates many ShoppingRecords at once.
+
+    Store and product ids are resolved with one `IN` query per table instead of
+    one lookup per item, and the records are inserted with a single `bulk_create`.
+    """
+
+    def to_internal_value(self, data):
+        # validate() wraps errors in non_field_errors, so the FK check runs here
+        # to keep the errors aligned with the submitted items.
+        attrs = super().to_internal_value(data)
+        stores = Store.objects.in_bulk({item["store_id"] for item in attrs})
+        products = Product.objects.select_related("category", "unit", "manufacturer", "origin").in_bulk(
+            {item["product_id"] for item in attrs}
+        )
+        does_not_exist = serializers.PrimaryKeyRelatedField.default_error_messages["does_not_exist"]
+
+        errors = []
+        for item in attrs:
+            item_errors = {}
+            if item["store_id"] not in stores:
+                item_errors["store_id"] = [does_not_exist.format(pk_value=item["store_id"])]
+            if item["product_id"] not in products:
+                item_errors["product_id"] = [does_not_exist.format(pk_value=item["product_id"])]
+            errors.append(item_errors)
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        for item in attrs:
+            item["store"] = stores[item.pop("store_id")]
+            item["product"] = products[item.pop("product_id")]
+        return attrs
+
+    def create(self, validated_data):
+        with transaction.atomic():
+            # bulk_create はシグナルを送らないため、集計テーブルをここで更新する
+            records = ShoppingRecord.objects.bulk_create([ShoppingRecord(**item) for item in validated_data])
+            rollups.apply_deltas(rollups.record_deltas(rollups.rollup_rows(records)))
+        return records
+
+
+class ShoppingRecordBulkItemSerializer(serializers.ModelSerializer):
+    """
+    Serializer for a single item of a bulk ShoppingRecord create.
+
+    Related ids are plain integers here; they are checked in bulk by
+    `ShoppingRecordBulkListSerializer`.
+    """
+
+    store_id = serializers.IntegerField()
+    product_id = serializers.IntegerField()
+
+    class Meta:
+        model = ShoppingRecord
+        fields = ["price", "purchase_date", "quantity", "store_id", "product_id"]
+        list_serializer_class = ShoppingRecordBulkListSerializer
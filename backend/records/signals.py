@@ -0,0 +1,155 @@
+from decimal import Decimal
+
+from django.core.signals import request_finished, request_started
+from django.db.backends.signals import connection_created
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import metrics, price_index, reference_cache, rollups, versioning
+from .models import Category, Manufacturer, Origin, Product, ShoppingRecord, Store, Unit
+
+VERSIONED_MODELS = [Category, Unit, Manufacturer, Origin, Store]
+
+
+@receiver(pre_save, sender=ShoppingRecord)
+def remember_previous_record(sender, instance, raw=False, **kwargs):
+    """
+    Stores the saved state of an existing record so post_save can apply the difference.
+    """
+    instance._rollup_previous = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    instance._rollup_previous = list(rollups.queryset_rows(ShoppingRecord.objects.filter(pk=instance.pk)))
+
+
+@receiver(post_save, sender=ShoppingRecord)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = rollups.record_deltas(rollups.rollup_rows([instance]))
+    previous = getattr(instance, "_rollup_previous", None)
+    if previous:
+        deltas = rollups.merge_deltas(deltas, rollups.record_deltas(previous, sign=-1))
+    rollups.apply_deltas(deltas)
+
+
+@receiver(post_save, sender=ShoppingRecord)
+def mark_price_index_on_update(sender, instance, created, raw=False, **kwargs):
+    # 追加と削除は月次集計の件数が変わるため price_index.refresh() が自分で検出する
+    previous = getattr(instance, "_rollup_previous", None)
+    if raw or created or not previous:
+        return
+    purchase_date, category_id, *_ = rollups.record_row(instance, instance.product.category_id)
+    price_index.mark_stale([(category_id, purchase_date)] + [(row[1], row[0]) for row in previous])
+
+
+@receiver(pre_save, sender=Product)
+def remember_previous_category(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous_category_id = None
+    instance._previous_unit_id = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+    previous = Product.objects.filter(pk=instance.pk).values_list("category_id", "unit_id").first()
+    if previous:
+        instance._rollup_previous_category_id, instance._previous_unit_id = previous
+
+
+@receiver(post_save, sender=Product)
+def move_rollups_on_category_change(sender, instance, raw=False, **kwargs):
+    """
+    Moves a product's spending to its new category when the category changes.
+    """
+    previous_category_id = getattr(instance, "_rollup_previous_category_id", None)
+    if raw or previous_category_id is None or previous_category_id == instance.category_id:
+        return
+    totals = (
+        ShoppingRecord.objects.filter(product=instance)
+        .values("purchase_date", "store_id")
+        .annotate(total_price=Sum("price"), total_quantity=Sum("quantity"), count=Count("id"))
+        .order_by()
+    )
+    deltas = {}
+    for row in totals:
+        value = [row["total_price"], Decimal(row["total_quantity"]), row["count"]]
+        deltas[(row["purchase_date"], previous_category_id, row["store_id"])] = [-v for v in value]
+        deltas[(row["purchase_date"], instance.category_id, row["store_id"])] = value
+    rollups.apply_deltas(deltas)
+
+
+@receiver(post_save, sender=Product)
+def mark_price_index_on_product_change(sender, instance, raw=False, **kwargs):
+    """
+    Marks the months of a product's records when its category or unit changes.
+    """
+    previous_category_id = getattr(instance, "_rollup_previous_category_id", None)
+    if raw or previous_category_id is None:
+        return
+    if (
+        previous_category_id == instance.category_id
+        and getattr(instance, "_previous_unit_id", None) == instance.unit_id
+    ):
+        return
+    months = (
+        ShoppingRecord.objects.filter(product=instance)
+        .annotate(month=TruncMonth("purchase_date"))
+        .values_list("month", flat=True)
+        .order_by()
+        .distinct()
+    )
+    price_index.mark_stale(
+        (category_id, month) for month in months for category_id in {previous_category_id, instance.category_id}
+    )
+
+
+def bump_table_version(sender, **kwargs):
+    versioning.bump(sender)
+
+
+for model in VERSIONED_MODELS:
+    post_save.connect(bump_table_version, sender=model, dispatch_uid=f"bump_table_version_save_{model.__name__}")
+    post_delete.connect(bump_table_version, sender=model, dispatch_uid=f"bump_table_version_delete_{model.__name__}")
+
+
+@receiver(post_save, sender=ShoppingRecord)
+def bump_record_version_on_update(sender, instance, created, raw=False, **kwargs):
+    # 追加は列指向スナップショット (records.columnar) が最大IDから取り込むので、更新と削除だけ知らせる
+    if not created:
+        versioning.bump(ShoppingRecord)
+
+
+@receiver(post_save, sender=Product)
+def bump_product_version_on_update(sender, instance, created, raw=False, **kwargs):
+    # 列指向スナップショットの商品 -> 分類・メーカー対応表用 (新しい商品は未知のIDとして検出される)
+    if not created:
+        versioning.bump(Product)
+
+
+@receiver(post_delete, sender=Product)
+def bump_product_version_on_delete(sender, **kwargs):
+    versioning.bump(Product)
+
+
+def invalidate_reference_cache(sender, **kwargs):
+    reference_cache.invalidate(sender)
+
+
+for model in reference_cache.DEPENDENT_CACHES:
+    post_save.connect(
+        invalidate_reference_cache, sender=model, dispatch_uid=f"invalidate_reference_cache_save_{model.__name__}"
+    )
+    post_delete.connect(
+        invalidate_reference_cache, sender=model, dispatch_uid=f"invalidate_reference_cache_delete_{model.__name__}"
+    )
+
+# 他のワーカーの書き込みを検出するテーブルバージョンは、リクエストごとに1回だけ読む
+request_started.connect(reference_cache.begin_request, dispatch_uid="reference_cache_begin_request")
+request_finished.connect(reference_cache.end_request, dispatch_uid="reference_cache_end_request")
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # execute_wrapper() のコンテキストは末尾を pop するため、先頭に入れてその順序を崩さない
+    if metrics.time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, metrics.time_query)
@@ -1,11 +1,75 @@
-from datetime import date
+import csv
+import gzip
+import importlib
+import io
+import json
+import logging
+import os
+import random
+import stat
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import date, datetime, timedelta
+from datetime import timezone as dt_timezone
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock, skipIf, skipUnless
 
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.exceptions import SynchronousOnlyOperation
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, resolve
+from django.utils.translation import gettext_lazy
 from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
 
-from .models import Category, Manufacturer, Origin, Product, ShoppingRecord, Store, Unit
+from shoptrack.settings import database_pool_options
+
+from . import bulk_edit, columnar, partitioning, price_index, reference_cache, rollups, versioning
+from . import urls as records_urls
+from .analytics import spend_summary
+from .fast_read import values_reader
+from .metrics import database_pools, registry
+from .middleware import brotli, parse_accept_encoding
+from .models import (
+    Category,
+    DailySpend,
+    Manufacturer,
+    MonthlySpend,
+    Origin,
+    PriceIndex,
+    Product,
+    ShoppingRecord,
+    Store,
+    Unit,
+)
+from .renderers import FastJSONRenderer, orjson
+from .routers import PRIMARY_PIN_COOKIE, ReplicaRouter, RoutingState, current_routing
+from .serializers import ProductSerializer, ShoppingRecordSerializer
+
+try:
+    import psycopg
+    import psycopg_pool
+except ImportError:
+    psycopg = psycopg_pool = None
+
+# サンプリングされたリクエストの計測ログでテスト出力が埋もれないようにする
+logging.getLogger("records.performance").setLevel(logging.WARNING)
 
 
 class CategoryModelTest(TestCase):
@@ -100,7 +164,7 @@ class CategoryAPITest(APITestCase):
         Category.objects.create(name="Fruits")
         response = self.client.get("/api/categories/", format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(response.data["results"]), 2)
 
 
 class ShoppingRecordAPITest(APITestCase):
@@ -129,6 +193,2175 @@ class ShoppingRecordAPITest(APITestCase):
     def test_get_shopping_records(self):
         response = self.client.get("/api/shopping-records/", format="json")
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 1)
-        self.assertEqual(response.data[0]["store"]["name"], "Supermarket")
-        self.assertEqual(response.data[0]["product"]["name"], "Beef")
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertEqual(response.data["results"][0]["store"]["name"], "Supermarket")
+        self.assertEqual(response.data["results"][0]["product"]["name"], "Beef")
+
+    def test_shopping_records_cursor_pagination(self):
+        for day in range(2, 6):
+            ShoppingRecord.objects.create(
+                price=100, purchase_date=date(2025, 1, day), store=self.store, quantity=1, product=self.product
+            )
+        # 同じ日付のレコードがページ境界を跨いでも重複・欠落しないこと
+        ShoppingRecord.objects.create(
+            price=200, purchase_date=date(2025, 1, 2), store=self.store, quantity=1, product=self.product
+        )
+        expected = list(ShoppingRecord.objects.order_by("purchase_date", "id").values_list("id", flat=True))
+
+        seen = []
+        url = "/api/shopping-records/?page_size=2"
+        while url:
+            response = self.client.get(url, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn("count", response.data)
+            seen.extend(record["id"] for record in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(seen, expected)
+
+
+class QueryBudgetMixin:
+    """
+    Asserts that an endpoint runs a fixed number of queries regardless of row count.
+    """
+
+    def assert_query_budget(self, url, budget, grow):
+        """
+        Requests `url`, calls `grow()` to add more rows, and requests it again.
+
+        Both requests must run exactly `budget` queries, so the count can neither
+        exceed the budget nor scale with the number of rows returned.
+        """
+        counts = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            counts.append(len(ctx.captured_queries))
+            grow()
+        self.assertEqual(
+            counts,
+            [budget, budget],
+            f"{url} ran {counts} queries, expected {budget} independent of row count",
+        )
+
+
+class QueryBudgetAPITest(QueryBudgetMixin, APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.unit = Unit.objects.create(name="g")
+        self.n = 0
+        self.add_records()
+
+    def add_records(self, count=5):
+        for _ in range(count):
+            self.n += 1
+            product = Product.objects.create(
+                name=f"Product {self.n}",
+                category=Category.objects.create(name=f"Category {self.n}"),
+                unit=self.unit,
+                manufacturer=Manufacturer.objects.create(name=f"Manufacturer {self.n}"),
+                origin=Origin.objects.create(name=f"Origin {self.n}"),
+            )
+            ShoppingRecord.objects.create(
+                price=100, purchase_date=date(2025, 1, self.n % 28 + 1), store=self.store, quantity=1, product=product
+            )
+
+    def test_reference_list_budgets(self):
+        # テーブルバージョンの取得 + 一覧
+        for url in ["/api/categories/", "/api/units/", "/api/manufacturers/", "/api/origins/", "/api/stores/"]:
+            with self.subTest(url=url):
+                self.assert_query_budget(url, 2, self.add_records)
+
+    def test_product_list_budget(self):
+        self.assert_query_budget("/api/products/", 1, self.add_records)
+
+    def test_shopping_record_list_budget(self):
+        self.assert_query_budget("/api/shopping-records/", 1, self.add_records)
+
+    def test_shopping_record_detail_budget(self):
+        record = ShoppingRecord.objects.first()
+        self.assert_query_budget(f"/api/shopping-records/{record.id}/", 1, self.add_records)
+
+    def test_shopping_record_create_budget(self):
+        product = Product.objects.first()
+        data = {
+            "price": 100,
+            "purchase_date": "2025-01-02",
+            "quantity": 1,
+            "store_id": self.store.id,
+            "product_id": product.id,
+        }
+        # 1回目でFK参照キャッシュが温まる
+        self.client.post("/api/shopping-records/", data, format="json")
+        # テーブルバージョンの取得 + INSERT + 既存の日次・月次集計行のUPDATE (トランザクションのSAVEPOINTは除く)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/shopping-records/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["product"]["category"]["name"], product.category.name)
+        queries = [q for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(queries), 4)
+
+    def test_product_create_budget(self):
+        product = Product.objects.first()
+        data = {
+            "name": "New product",
+            "category_id": product.category_id,
+            "unit_id": product.unit_id,
+            "manufacturer_id": product.manufacturer_id,
+            "origin_id": product.origin_id,
+        }
+        self.client.post("/api/products/", data, format="json")
+        # テーブルバージョンの取得 (4つの参照で1回) + INSERT
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/products/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["manufacturer"]["name"], product.manufacturer.name)
+        queries = [q for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(queries), 2)
+
+
+class ShoppingRecordExportAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.product = Product.objects.create(
+            name="Beef",
+            category=Category.objects.create(name="Meat"),
+            unit=Unit.objects.create(name="g"),
+            manufacturer=Manufacturer.objects.create(name="Glico"),
+        )
+        for day in (1, 15, 31):
+            ShoppingRecord.objects.create(
+                price=1000, purchase_date=date(2025, 1, day), store=self.store, quantity=500, product=self.product
+            )
+
+    def read(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_export_csv(self):
+        response = self.client.get("/api/shopping-records/export/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = list(csv.DictReader(io.StringIO(self.read(response))))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["product"], "Beef")
+        self.assertEqual(rows[0]["category"], "Meat")
+        self.assertEqual(rows[0]["manufacturer"], "Glico")
+        self.assertEqual(rows[0]["origin"], "")
+        self.assertEqual(rows[0]["store"], "Supermarket")
+
+    def test_export_ndjson_date_range(self):
+        response = self.client.get(
+            "/api/shopping-records/export/?file_type=ndjson&start_date=2025-01-10&end_date=2025-01-31"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in self.read(response).splitlines()]
+        self.assertEqual([row["purchase_date"] for row in rows], ["2025-01-15", "2025-01-31"])
+        self.assertEqual(rows[0]["quantity"], "500.000")
+        self.assertIsNone(rows[0]["origin"])
+
+    def test_export_constant_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.read(self.client.get("/api/shopping-records/export/"))
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_export_invalid_params(self):
+        response = self.client.get("/api/shopping-records/export/?file_type=xml")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/shopping-records/export/?start_date=2025-13-01")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ShoppingRecordBulkCreateAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        unit = Unit.objects.create(name="g")
+        category = Category.objects.create(name="Meat")
+        self.products = [Product.objects.create(name=f"Product {i}", category=category, unit=unit) for i in range(3)]
+
+    def item(self, product, **overrides):
+        data = {
+            "price": 100,
+            "purchase_date": "2025-01-01",
+            "quantity": "1.5",
+            "store_id": self.store.id,
+            "product_id": product.id,
+        }
+        data.update(overrides)
+        return data
+
+    def test_bulk_create(self):
+        items = [self.item(product) for product in self.products * 10]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post("/api/shopping-records/bulk/", items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(response.data[0]["product"]["category"]["name"], "Meat")
+        self.assertEqual(ShoppingRecord.objects.count(), 30)
+        # Store IN + Product IN + INSERT + 新規集計行の作成 (日次・月次で UPDATE/INSERT/UPDATE)
+        queries = [q for q in ctx.captured_queries if "SAVEPOINT" not in q["sql"]]
+        self.assertEqual(len(queries), 9)
+
+    def test_bulk_create_per_item_errors(self):
+        items = [self.item(self.products[0]), self.item(self.products[1], store_id=9999, product_id=9999)]
+        response = self.client.post("/api/shopping-records/bulk/", items, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data[0], {})
+        self.assertIn("store_id", response.data[1])
+        self.assertIn("product_id", response.data[1])
+        self.assertEqual(ShoppingRecord.objects.count(), 0)
+
+    def test_bulk_create_rejects_empty_and_non_list(self):
+        response = self.client.post("/api/shopping-records/bulk/", [], format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post("/api/shopping-records/bulk/", self.item(self.products[0]), format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkEditAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        self.meat = Category.objects.create(name="Meat")
+        self.snacks = Category.objects.create(name="Snacks")
+        self.stores = [
+            Store.objects.create(name="Supermarket", location="Kyoto"),
+            Store.objects.create(name="Drugstore", location="Osaka"),
+        ]
+        self.beef = Product.objects.create(name="Beef", category=self.meat, unit=unit)
+        self.pocky = Product.objects.create(name="Pocky", category=self.snacks, unit=unit)
+        self.unused = [Product.objects.create(name=f"Unused {i}", category=self.snacks, unit=unit) for i in range(2)]
+        for i in range(6):
+            ShoppingRecord.objects.create(
+                price=100 * (i + 1),
+                purchase_date=date(2025, 1, i + 1),
+                store=self.stores[0],
+                quantity=1,
+                product=self.beef if i < 4 else self.pocky,
+            )
+
+    def assert_rollups_consistent(self):
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+    def test_update_records_by_filter(self):
+        version = versioning.current(ShoppingRecord)[0]
+        response = self.client.patch(
+            f"/api/shopping-records/bulk/?store={self.stores[0].id}&category={self.meat.id}",
+            {"store_id": self.stores[1].id},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"updated": 4})
+        self.assertEqual(
+            set(ShoppingRecord.objects.values_list("product_id", "store_id")),
+            {(self.beef.id, self.stores[1].id), (self.pocky.id, self.stores[0].id)},
+        )
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version + 1)
+        self.assert_rollups_consistent()
+
+    def test_update_records_by_ids(self):
+        ids = list(ShoppingRecord.objects.order_by("id").values_list("id", flat=True)[:3])
+        response = self.client.patch(
+            f"/api/shopping-records/bulk/?ids={','.join(map(str, ids))}",
+            {"product_id": self.pocky.id, "price": 50, "quantity": "2.5", "purchase_date": "2025-02-01"},
+            format="json",
+        )
+        self.assertEqual(response.data, {"updated": 3})
+        self.assertEqual(
+            set(
+                ShoppingRecord.objects.filter(id__in=ids).values_list(
+                    "product_id", "price", "quantity", "purchase_date"
+                )
+            ),
+            {(self.pocky.id, 50, Decimal("2.5"), date(2025, 2, 1))},
+        )
+        self.assertEqual(MonthlySpend.objects.get(month=date(2025, 2, 1), category=self.snacks).total_price, 150)
+        self.assert_rollups_consistent()
+
+    def test_update_records_rejects_invalid_requests(self):
+        response = self.client.patch("/api/shopping-records/bulk/", {"price": 1}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("ids", response.data)
+        response = self.client.patch("/api/shopping-records/bulk/?ids=1", {"store_id": 9999}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("store_id", response.data)
+        response = self.client.patch("/api/shopping-records/bulk/?ids=1", {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ShoppingRecord.objects.filter(price=1).count(), 0)
+
+    def test_delete_records(self):
+        response = self.client.delete("/api/shopping-records/bulk/?end_date=2025-01-03")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"deleted": 3})
+        self.assertEqual(
+            sorted(ShoppingRecord.objects.values_list("purchase_date", flat=True)),
+            [date(2025, 1, 4), date(2025, 1, 5), date(2025, 1, 6)],
+        )
+        self.assertFalse(DailySpend.objects.filter(date__lte=date(2025, 1, 3)).exists())
+        self.assert_rollups_consistent()
+
+        response = self.client.delete("/api/shopping-records/bulk/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(ShoppingRecord.objects.count(), 3)
+
+    def test_delete_records_bumps_version_once(self):
+        version = versioning.current(ShoppingRecord)[0]
+        self.client.delete("/api/shopping-records/bulk/?end_date=2025-01-02")
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version + 1)
+        self.client.delete("/api/shopping-records/bulk/?end_date=2025-01-03")
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version + 2)
+
+    def test_bulk_writes_match_nothing(self):
+        version = versioning.current(ShoppingRecord)[0]
+        response = self.client.patch("/api/shopping-records/bulk/?end_date=2024-12-31", {"price": 1}, format="json")
+        self.assertEqual(response.data, {"updated": 0})
+        response = self.client.delete("/api/shopping-records/bulk/?end_date=2024-12-31")
+        self.assertEqual(response.data, {"deleted": 0})
+        self.assertEqual(ShoppingRecord.objects.count(), 6)
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version)
+
+    def test_queryset_and_instance_delete(self):
+        version = versioning.current(ShoppingRecord)[0]
+        self.assertEqual(
+            ShoppingRecord.objects.filter(product=self.pocky).delete(), (2, {"records.ShoppingRecord": 2})
+        )
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version + 1)
+        record = ShoppingRecord.objects.earliest("purchase_date")
+        record.delete()
+        self.assertIsNone(record.pk)
+        self.assertEqual(ShoppingRecord.objects.count(), 3)
+        self.assertEqual(versioning.current(ShoppingRecord)[0], version + 2)
+        self.assert_rollups_consistent()
+
+    def test_update_products_moves_rollups(self):
+        reference_cache.caches[Product].get(self.beef.id)
+        response = self.client.patch(
+            f"/api/products/bulk/?ids={self.beef.id},{self.pocky.id}", {"category_id": self.meat.id}, format="json"
+        )
+        self.assertEqual(response.data, {"updated": 2})
+        self.assertEqual(Product.objects.filter(category=self.meat).count(), 2)
+        self.assertEqual(MonthlySpend.objects.get().category_id, self.meat.id)
+        self.assertNotIn(self.beef.id, reference_cache.caches[Product].entries)
+        self.assert_rollups_consistent()
+
+        response = self.client.patch(
+            f"/api/products/bulk/?category={self.snacks.id}", {"name": "Snack"}, format="json"
+        )
+        self.assertEqual(response.data, {"updated": 2})
+        self.assertEqual(set(Product.objects.filter(category=self.snacks).values_list("name", flat=True)), {"Snack"})
+
+    def test_delete_products(self):
+        response = self.client.delete(f"/api/products/bulk/?category={self.snacks.id}")
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data["protected"], [self.pocky.id])
+        self.assertEqual(Product.objects.count(), 4)
+
+        ids = ",".join(str(product.id) for product in self.unused)
+        response = self.client.delete(f"/api/products/bulk/?ids={ids}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {"deleted": 2})
+        self.assertEqual(set(Product.objects.all()), {self.beef, self.pocky})
+
+
+class ImportRecordsCommandTest(TestCase):
+    def write_csv(self, text):
+        f = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8")
+        f.write(text)
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        return f.name
+
+    def test_import_records(self):
+        Category.objects.create(name="Meat")
+        path = self.write_csv(
+            "purchase_date,price,quantity,product,category,unit,manufacturer,origin,store,store_location\n"
+            "2025-01-01,1000,500,Beef,Meat,g,,Hokkaido,Supermarket,Kyoto\n"
+            "2025-01-02,1200,500,Beef,Meat,g,,Hokkaido,Supermarket,Kyoto\n"
+            "2025-01-02,150,1,Pocky,Snacks,pieces,Glico,,Supermarket,Kyoto\n"
+        )
+        out = io.StringIO()
+        call_command("import_records", path, "--chunk-size", "2", stdout=out)
+
+        self.assertIn("Imported 3 rows", out.getvalue())
+        self.assertIn("rows/s", out.getvalue())
+        self.assertEqual(ShoppingRecord.objects.count(), 3)
+        self.assertEqual(Category.objects.count(), 2)
+        self.assertEqual(Product.objects.count(), 2)
+        self.assertEqual(Store.objects.count(), 1)
+        pocky = Product.objects.get(name="Pocky")
+        self.assertEqual(pocky.manufacturer.name, "Glico")
+        self.assertIsNone(pocky.origin)
+        self.assertEqual(ShoppingRecord.objects.get(price=150).quantity, Decimal("1"))
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+    def test_import_records_adds_to_existing_rollups(self):
+        path = self.write_csv(
+            "purchase_date,price,quantity,product,category,unit,store\n2025-01-01,1000,500,Beef,Meat,g,Supermarket\n"
+        )
+        call_command("import_records", path, stdout=io.StringIO())
+        call_command("import_records", path, stdout=io.StringIO())
+
+        daily = DailySpend.objects.get(date=date(2025, 1, 1))
+        self.assertEqual((daily.total_price, daily.total_quantity, daily.count), (2000, Decimal("1000"), 2))
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+    @skipUnless(connection.vendor == "postgresql", "COPY requires PostgreSQL")
+    def test_import_records_with_copy(self):
+        path = self.write_csv(
+            "purchase_date,price,quantity,product,category,unit,store\n"
+            "2025-01-01,1000,500,Beef,Meat,g,Supermarket\n"
+            "2025-01-01,300,0.25,Beef,Meat,g,Supermarket\n"
+            "2025-02-03,150,1,Pocky,Snacks,pieces,Supermarket\n"
+        )
+        out = io.StringIO()
+        call_command("import_records", path, "--chunk-size", "2", stdout=out)
+
+        self.assertIn("Imported 3 rows", out.getvalue())
+        self.assertIn("COPY", out.getvalue())
+        self.assertEqual(ShoppingRecord.objects.count(), 3)
+        self.assertEqual(ShoppingRecord.objects.get(price=300).quantity, Decimal("0.25"))
+        daily = DailySpend.objects.get(date=date(2025, 1, 1))
+        self.assertEqual((daily.total_price, daily.total_quantity, daily.count), (1300, Decimal("500.25"), 2))
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+    def test_import_records_export_roundtrip(self):
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        product = Product.objects.create(
+            name="Beef", category=Category.objects.create(name="Meat"), unit=Unit.objects.create(name="g")
+        )
+        ShoppingRecord.objects.create(
+            price=1000, purchase_date=date(2025, 1, 1), store=store, quantity=500, product=product
+        )
+        user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        client = APIClient()
+        client.force_authenticate(user=user)
+        exported = b"".join(client.get("/api/shopping-records/export/").streaming_content).decode()
+
+        call_command("import_records", self.write_csv(exported), stdout=io.StringIO())
+        self.assertEqual(ShoppingRecord.objects.count(), 2)
+        self.assertEqual(Product.objects.count(), 1)
+        self.assertEqual(Store.objects.count(), 1)
+
+    def test_import_records_invalid_row(self):
+        path = self.write_csv(
+            "purchase_date,price,quantity,product,category,unit,store\n2025-01-01,abc,1,Beef,Meat,g,Supermarket\n"
+        )
+        with self.assertRaisesMessage(CommandError, "Line 2"):
+            call_command("import_records", path, stdout=io.StringIO())
+        self.assertEqual(ShoppingRecord.objects.count(), 0)
+
+    def test_import_records_missing_columns(self):
+        path = self.write_csv("purchase_date,price\n2025-01-01,100\n")
+        with self.assertRaisesMessage(CommandError, "Missing required columns"):
+            call_command("import_records", path, stdout=io.StringIO())
+
+
+class SyntheticDataCommandTest(TestCase):
+    seed_args = ["--records", "600", "--products", "40", "--stores", "5", "--categories", "4", "--chunk-size", "250"]
+
+    def test_seed_synthetic(self):
+        out = io.StringIO()
+        call_command("seed_synthetic", *self.seed_args, "--end-date", "2025-06-30", "--days", "30", stdout=out)
+
+        self.assertIn("Seeded 600 records", out.getvalue())
+        self.assertEqual(ShoppingRecord.objects.count(), 600)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(Store.objects.count(), 5)
+        self.assertEqual(Category.objects.count(), 4)
+        dates = ShoppingRecord.objects.values_list("purchase_date", flat=True)
+        self.assertGreaterEqual(min(dates), date(2025, 6, 1))
+        self.assertLessEqual(max(dates), date(2025, 6, 30))
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+        # 人気商品に偏る (一様分布なら1商品あたり15件)
+        top = ShoppingRecord.objects.values("product").annotate(n=Count("id")).order_by("-n").first()
+        self.assertGreater(top["n"], 60)
+
+        call_command("seed_synthetic", *self.seed_args, "--seed", "1", stdout=io.StringIO())
+        self.assertEqual(ShoppingRecord.objects.count(), 1200)
+        self.assertEqual(Product.objects.count(), 40)
+
+    def test_uniform_skew(self):
+        call_command("seed_synthetic", *self.seed_args, "--skew", "0", stdout=io.StringIO())
+        top = ShoppingRecord.objects.values("product").annotate(n=Count("id")).order_by("-n").first()
+        self.assertLess(top["n"], 60)
+
+    def test_seed_synthetic_invalid_options(self):
+        with self.assertRaisesMessage(CommandError, "--records must be a positive integer."):
+            call_command("seed_synthetic", "--records", "0", stdout=io.StringIO())
+
+    def test_benchmark_api(self):
+        call_command("seed_synthetic", *self.seed_args, stdout=io.StringIO())
+        users = get_user_model().objects.count()
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            path = f.name
+        self.addCleanup(os.remove, path)
+
+        out = io.StringIO()
+        call_command("benchmark_api", "--iterations", "2", "--warmup", "0", "--output", path, stdout=out)
+        with open(path, encoding="utf-8") as f:
+            results = json.load(f)
+        self.assertEqual(results["records"], 600)
+        self.assertIn("records_filter", results["scenarios"])
+        self.assertEqual(
+            set(results["scenarios"]["records_list"]),
+            {"p50_ms", "p95_ms", "p99_ms", "mean_ms", "db_ms", "queries", "max_queries", "throughput_rps"},
+        )
+        self.assertEqual(results["scenarios"]["records_list"]["queries"], 1)
+        # 計測中に作成したユーザーと記録はロールバックされる
+        self.assertEqual(ShoppingRecord.objects.count(), 600)
+        self.assertEqual(get_user_model().objects.count(), users)
+
+        for scenario in results["scenarios"].values():
+            scenario["p95_ms"] = 0.001
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f)
+        out = io.StringIO()
+        with self.assertRaisesMessage(CommandError, "p95 regressed by more than 50.0%: records_list"):
+            call_command(
+                "benchmark_api",
+                *("--iterations", "2", "--warmup", "0", "--scenario", "records_list"),
+                *("--baseline", path, "--max-regression", "50"),
+                stdout=out,
+            )
+        self.assertIn("vs baseline", out.getvalue())
+
+    def test_benchmark_api_unknown_scenario(self):
+        call_command("seed_synthetic", *self.seed_args, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, "Unknown scenarios: nope"):
+            call_command("benchmark_api", "--scenario", "nope", stdout=io.StringIO())
+
+
+class SpendAnalyticsAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        self.meat = Category.objects.create(name="Meat")
+        self.snacks = Category.objects.create(name="Snacks")
+        self.glico = Manufacturer.objects.create(name="Glico")
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        beef = Product.objects.create(name="Beef", category=self.meat, unit=unit)
+        pocky = Product.objects.create(name="Pocky", category=self.snacks, unit=unit, manufacturer=self.glico)
+
+        for purchase_date, price, quantity, product in [
+            (date(2025, 1, 5), 1000, "500", beef),
+            (date(2025, 1, 20), 600, "300", beef),
+            (date(2025, 1, 20), 150, "2", pocky),
+            (date(2025, 2, 1), 160, "1", pocky),
+            (date(2024, 12, 31), 999, "1", pocky),
+        ]:
+            ShoppingRecord.objects.create(
+                price=price, purchase_date=purchase_date, store=self.store, quantity=quantity, product=product
+            )
+
+    def test_spend_by_month(self):
+        response = self.client.get("/api/analytics/spend/?start_date=2025-01-01")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data,
+            [
+                {
+                    "month": date(2025, 1, 1),
+                    "total_price": 1750,
+                    "total_quantity": "802.000",
+                    "count": 3,
+                    "avg_unit_price": "2.18",
+                },
+                {
+                    "month": date(2025, 2, 1),
+                    "total_price": 160,
+                    "total_quantity": "1.000",
+                    "count": 1,
+                    "avg_unit_price": "160.00",
+                },
+            ],
+        )
+
+    def test_spend_by_category_and_manufacturer(self):
+        response = self.client.get(
+            "/api/analytics/spend/?group_by=category,manufacturer&start_date=2025-01-01&end_date=2025-01-31"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = {row["category"]: row for row in response.data}
+        self.assertEqual(rows["Meat"]["category_id"], self.meat.id)
+        self.assertIsNone(rows["Meat"]["manufacturer"])
+        self.assertEqual(rows["Meat"]["total_price"], 1600)
+        self.assertEqual(rows["Snacks"]["manufacturer"], "Glico")
+        self.assertEqual(rows["Snacks"]["count"], 1)
+
+    def test_spend_single_query(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/analytics/spend/?group_by=month,category,store,manufacturer")
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_spend_without_grouping(self):
+        for engine in ["sql", "columnar"]:
+            response = self.client.get(f"/api/analytics/spend/?group_by=&start_date=2025-01-01&engine={engine}")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(
+                response.data,
+                [{"total_price": 1910, "total_quantity": "803.000", "count": 4, "avg_unit_price": "2.38"}],
+            )
+            response = self.client.get(f"/api/analytics/spend/?group_by=&start_date=2030-01-01&engine={engine}")
+            self.assertEqual(response.data, [])
+
+    def test_spend_invalid_group_by(self):
+        response = self.client.get("/api/analytics/spend/?group_by=product")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class SpendRollupTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        self.meat = Category.objects.create(name="Meat")
+        self.snacks = Category.objects.create(name="Snacks")
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.beef = Product.objects.create(name="Beef", category=self.meat, unit=unit)
+
+    def assert_rollups_consistent(self):
+        self.assertEqual(rollups.stored_rollups(), rollups.expected_rollups())
+
+    def create_record(self, **overrides):
+        data = {
+            "price": 1000,
+            "purchase_date": "2025-01-05",
+            "quantity": "500",
+            "store_id": self.store.id,
+            "product_id": self.beef.id,
+        }
+        data.update(overrides)
+        response = self.client.post("/api/shopping-records/", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data["id"]
+
+    def test_rollups_follow_api_writes(self):
+        record_id = self.create_record()
+        self.create_record(price=500, purchase_date="2025-01-20")
+        daily = DailySpend.objects.get(date=date(2025, 1, 5))
+        self.assertEqual((daily.total_price, daily.count), (1000, 1))
+        monthly = MonthlySpend.objects.get(month=date(2025, 1, 1))
+        self.assertEqual((monthly.total_price, monthly.total_quantity, monthly.count), (1500, Decimal("1000"), 2))
+
+        response = self.client.patch(
+            f"/api/shopping-records/{record_id}/", {"purchase_date": "2025-02-01"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(DailySpend.objects.filter(date=date(2025, 1, 5)).exists())
+        self.assertEqual(MonthlySpend.objects.get(month=date(2025, 2, 1)).total_price, 1000)
+        self.assert_rollups_consistent()
+
+        response = self.client.delete(f"/api/shopping-records/{record_id}/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(MonthlySpend.objects.filter(month=date(2025, 2, 1)).exists())
+        self.assert_rollups_consistent()
+
+    def test_rollups_follow_bulk_and_queryset_writes(self):
+        items = [
+            {
+                "price": 100,
+                "purchase_date": "2025-01-05",
+                "quantity": "1",
+                "store_id": self.store.id,
+                "product_id": self.beef.id,
+            }
+        ] * 3
+        self.client.post("/api/shopping-records/bulk/", items, format="json")
+        self.assertEqual(DailySpend.objects.get().count, 3)
+        self.assert_rollups_consistent()
+
+        # 管理画面の一括削除と同じ QuerySet.delete() 経路
+        ShoppingRecord.objects.filter(pk__in=ShoppingRecord.objects.values("pk")[:2]).delete()
+        self.assertEqual(DailySpend.objects.get().count, 1)
+        self.assert_rollups_consistent()
+
+    def test_rollups_follow_model_writes_with_string_values(self):
+        record = ShoppingRecord.objects.create(
+            product=self.beef, store=self.store, price="300", quantity="1.5", purchase_date="2025-01-01"
+        )
+        daily = DailySpend.objects.get()
+        self.assertEqual(
+            (daily.date, daily.total_price, daily.total_quantity), (date(2025, 1, 1), 300, Decimal("1.5"))
+        )
+        self.assert_rollups_consistent()
+
+        record.delete()
+        self.assertFalse(DailySpend.objects.exists())
+        self.assert_rollups_consistent()
+
+    def test_delete_removes_only_its_empty_rows(self):
+        record_id = self.create_record()
+        # 別の書き込みが作ったばかりの、まだ加算されていない行
+        pending = DailySpend.objects.create(date=date(2025, 2, 1), category=self.snacks, store=self.store)
+        self.client.delete(f"/api/shopping-records/{record_id}/")
+        self.assertEqual(list(DailySpend.objects.all()), [pending])
+
+    def test_rollups_follow_product_category_change(self):
+        self.create_record()
+        self.client.patch(f"/api/products/{self.beef.id}/", {"category_id": self.snacks.id}, format="json")
+        self.assertEqual(DailySpend.objects.get().category_id, self.snacks.id)
+        self.assert_rollups_consistent()
+
+    def test_analytics_reads_only_rollups(self):
+        self.create_record()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/analytics/spend/?group_by=month,category,store&start_date=2025-01-03")
+        self.assertEqual(response.data[0]["total_price"], 1000)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("records_dailyspend", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("records_shoppingrecord", ctx.captured_queries[0]["sql"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get("/api/analytics/spend/?start_date=2025-01-01&end_date=2025-01-31")
+        self.assertIn("records_monthlyspend", ctx.captured_queries[0]["sql"])
+
+    def test_rebuild_rollups_command(self):
+        self.create_record()
+        self.create_record(purchase_date="2025-03-01")
+        DailySpend.objects.update(total_price=1)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rollups", "--verify", stdout=io.StringIO())
+
+        call_command("rebuild_rollups", stdout=io.StringIO())
+        out = io.StringIO()
+        call_command("rebuild_rollups", "--verify", stdout=out)
+        self.assertIn("match", out.getvalue())
+        self.assert_rollups_consistent()
+
+    def test_migration_backfills_existing_records(self):
+        self.create_record()
+        self.create_record(purchase_date="2025-03-01")
+        # 集計テーブル作成前に保存された記録の状態
+        DailySpend.objects.all().delete()
+        MonthlySpend.objects.all().delete()
+
+        migration = importlib.import_module("records.migrations.0004_spend_rollups")
+        # マイグレーション時点のモデルで実行する
+        state = MigrationExecutor(connection).loader.project_state(("records", "0004_spend_rollups"))
+        migration.backfill_rollups(state.apps, SimpleNamespace(connection=connection))
+        self.assertEqual(DailySpend.objects.count(), 2)
+        self.assert_rollups_consistent()
+
+
+class ProductPriceHistoryAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        category = Category.objects.create(name="Meat")
+        self.beef = Product.objects.create(name="Beef", category=category, unit=unit)
+        self.pork = Product.objects.create(name="Pork", category=category, unit=unit)
+        self.kyoto = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.osaka = Store.objects.create(name="Supermarket", location="Osaka")
+        for purchase_date, price, quantity, store in [
+            (date(2025, 1, 1), 100, "1", self.kyoto),
+            (date(2025, 1, 10), 200, "2", self.kyoto),
+            (date(2025, 1, 19), 330, "1", self.kyoto),
+            (date(2025, 2, 3), 90, "1", self.kyoto),
+            (date(2025, 2, 6), 500, "4", self.osaka),
+        ]:
+            ShoppingRecord.objects.create(
+                price=price, purchase_date=purchase_date, store=store, quantity=quantity, product=self.beef
+            )
+        ShoppingRecord.objects.create(
+            price=1, purchase_date=date(2025, 1, 1), store=self.kyoto, quantity=1, product=self.pork
+        )
+
+    def test_price_history_points(self):
+        response = self.client.get(f"/api/products/{self.beef.id}/price-history/?window=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        points = response.data["points"]
+        self.assertEqual(len(points), 5)
+        self.assertEqual([p["unit_price"] for p in points[:4]], ["100.00", "100.00", "330.00", "90.00"])
+        self.assertEqual([p["rolling_avg"] for p in points[:4]], ["100.00", "100.00", "215.00", "210.00"])
+        self.assertEqual(points[3]["rolling_min"], "90.00")
+        self.assertEqual(points[3]["rolling_max"], "330.00")
+        # 店舗ごとに独立した系列になる
+        self.assertEqual(points[4]["store_id"], self.osaka.id)
+        self.assertEqual(points[4]["rolling_avg"], "125.00")
+
+    def test_price_history_monthly_buckets(self):
+        response = self.client.get(f"/api/products/{self.beef.id}/price-history/?bucket=month&window=2")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        kyoto = [p for p in response.data["points"] if p["store_id"] == self.kyoto.id]
+        self.assertEqual([p["date"] for p in kyoto], [date(2025, 1, 1), date(2025, 2, 1)])
+        self.assertEqual(kyoto[0]["unit_price"], "157.50")
+        self.assertEqual(kyoto[0]["count"], 3)
+        self.assertEqual(kyoto[0]["min_unit_price"], "100.00")
+        self.assertEqual(kyoto[0]["max_unit_price"], "330.00")
+        self.assertEqual(kyoto[1]["rolling_avg"], "123.75")
+
+    def test_price_history_invalid_params(self):
+        for query in ["bucket=year", "window=0", "window=abc"]:
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/products/{self.beef.id}/price-history/?{query}")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/products/9999/price-history/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class ConditionalGetAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Meat")
+
+    def test_not_modified_without_reading_rows(self):
+        response = self.client.get("/api/categories/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response["ETag"]
+        self.assertIn("Last-Modified", response)
+        self.assertIn("no-cache", response["Cache-Control"])
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("records_tableversion", ctx.captured_queries[0]["sql"])
+
+    def test_etag_changes_on_write(self):
+        etag = self.client.get("/api/categories/")["ETag"]
+        self.client.patch(f"/api/categories/{self.category.id}/", {"name": "Fish"}, format="json")
+        response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        self.category.delete()
+        response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_is_per_url_and_table(self):
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        list_etag = self.client.get("/api/categories/")["ETag"]
+        detail = self.client.get(f"/api/categories/{self.category.id}/")
+        self.assertNotEqual(detail["ETag"], list_etag)
+        response = self.client.get(f"/api/stores/{store.id}/", HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # 他テーブルへの書き込みでは変わらない
+        Unit.objects.create(name="g")
+        response = self.client.get(f"/api/categories/{self.category.id}/", HTTP_IF_NONE_MATCH=detail["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_import_bumps_version(self):
+        etag = self.client.get("/api/categories/")["ETag"]
+        f = tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8")
+        f.write(
+            "purchase_date,price,quantity,product,category,unit,store\n2025-01-01,100,1,Pocky,Snacks,pieces,Shop\n"
+        )
+        f.close()
+        self.addCleanup(os.remove, f.name)
+        call_command("import_records", f.name, stdout=io.StringIO())
+        response = self.client.get("/api/categories/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+
+
+class ReferenceCacheTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        self.category = Category.objects.create(name="Meat")
+        self.unit = Unit.objects.create(name="g")
+
+    def create_product(self, **overrides):
+        data = {"name": "Beef", "category_id": self.category.id, "unit_id": self.unit.id}
+        data.update(overrides)
+        return self.client.post("/api/products/", data, format="json")
+
+    def test_local_write_invalidates(self):
+        self.create_product()
+        self.client.patch(f"/api/categories/{self.category.id}/", {"name": "Fish"}, format="json")
+        response = self.create_product()
+        self.assertEqual(response.data["category"]["name"], "Fish")
+
+        unit = Unit.objects.create(name="ml")
+        product_id = self.create_product(unit_id=unit.id).data["id"]
+        self.client.delete(f"/api/products/{product_id}/")
+        self.client.delete(f"/api/units/{unit.id}/")
+        response = self.create_product(unit_id=unit.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("unit_id", response.data)
+
+    def test_other_worker_write_invalidates(self):
+        self.create_product()
+        unit = Unit.objects.create(name="ml")
+        # 商品は作らずに単位をキャッシュに載せる
+        self.create_product(name="", unit_id=unit.id)
+        self.assertIn(unit.id, reference_cache.caches[Unit].entries)
+        # 別のワーカーの書き込み: このワーカーのシグナルは届かず、テーブルバージョンだけが変わる
+        Category.objects.filter(pk=self.category.id).update(name="Fish")
+        versioning.bump(Category)
+        response = self.create_product()
+        self.assertEqual(response.data["category"]["name"], "Fish")
+
+        Unit.objects.filter(pk=unit.id)._raw_delete(connection.alias)
+        versioning.bump(Unit)
+        response = self.create_product(unit_id=unit.id)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("unit_id", response.data)
+
+    def test_invalid_ids(self):
+        for value in [9999, "abc", True]:
+            with self.subTest(value=value):
+                response = self.create_product(category_id=value)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertIn("category_id", response.data)
+        # 文字列のIDも同じキャッシュエントリに解決される
+        response = self.create_product(category_id=str(self.category.id))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(REFERENCE_CACHE_MAX_SIZE=2)
+    def test_bounded_size(self):
+        cache = reference_cache.caches[Category]
+        cache.clear()
+        categories = [Category.objects.create(name=f"Category {i}") for i in range(3)]
+        for category in categories:
+            cache.get(category.id)
+        self.assertEqual(list(cache.entries), [categories[1].id, categories[2].id])
+
+    @override_settings(REFERENCE_CACHE_TTL=0)
+    def test_ttl_expiry(self):
+        cache = reference_cache.caches[Category]
+        cache.get(self.category.id)
+        # 他のワーカーでの更新 (シグナルが届かない) を再現
+        Category.objects.filter(pk=self.category.id).update(name="Fish")
+        self.assertEqual(cache.get(self.category.id).name, "Fish")
+
+
+class SparseFieldsetAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        self.category = Category.objects.create(name="Meat")
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.product = Product.objects.create(
+            name="Beef",
+            category=self.category,
+            unit=Unit.objects.create(name="g"),
+            manufacturer=Manufacturer.objects.create(name="Glico"),
+        )
+        ShoppingRecord.objects.create(
+            price=1000, purchase_date=date(2025, 1, 1), store=self.store, quantity=500, product=self.product
+        )
+
+    def test_default_shape_unchanged(self):
+        record = self.client.get("/api/shopping-records/").data["results"][0]
+        self.assertEqual(record["product"]["category"]["name"], "Meat")
+        self.assertEqual(record["store"]["name"], "Supermarket")
+
+    def test_fields_without_relations(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/shopping-records/?fields=id,price,purchase_date&expand=")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(response.data["results"][0]), {"id", "price", "purchase_date"})
+        self.assertNotIn("JOIN", ctx.captured_queries[0]["sql"])
+
+    def test_fields_reduce_joins(self):
+        for url, expected in [
+            ("/api/shopping-records/?fields=id,price", {"id", "price"}),
+            ("/api/products/?fields=id,name", {"id", "name"}),
+        ]:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+                self.assertEqual(set(response.data["results"][0]), expected)
+                self.assertEqual(len(ctx.captured_queries), 1)
+                self.assertNotIn("JOIN", ctx.captured_queries[0]["sql"])
+
+        # expand なしでは fields にある関連だけを、その埋め込み先まで結合する
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/shopping-records/?fields=id,product")
+        self.assertEqual(response.data["results"][0]["product"]["category"]["name"], "Meat")
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertIn("records_category", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("records_store", ctx.captured_queries[0]["sql"])
+
+    def test_unexpanded_relations_are_ids(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/shopping-records/?expand=product")
+        record = response.data["results"][0]
+        self.assertEqual(record["store"], self.store.id)
+        self.assertEqual(record["product"]["name"], "Beef")
+        self.assertEqual(record["product"]["category"], self.category.id)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn("records_store", ctx.captured_queries[0]["sql"])
+        self.assertNotIn("records_category", ctx.captured_queries[0]["sql"])
+
+    def test_nested_expand(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/api/shopping-records/?fields=id,product&expand=product.manufacturer")
+        record = response.data["results"][0]
+        self.assertEqual(set(record), {"id", "product"})
+        self.assertEqual(record["product"]["manufacturer"]["name"], "Glico")
+        self.assertEqual(record["product"]["unit"], self.product.unit_id)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_reference_and_detail_fields(self):
+        response = self.client.get("/api/stores/?fields=name")
+        self.assertEqual(response.data["results"], [{"name": "Supermarket"}])
+        response = self.client.get(f"/api/products/{self.product.id}/?expand=category")
+        self.assertEqual(response.data["category"]["name"], "Meat")
+        self.assertIsNone(response.data["origin"])
+
+    def test_invalid_params(self):
+        for query in ["fields=id,secret", "expand=price", "expand=owner"]:
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/shopping-records/?{query}")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_writes_ignore_sparse_params(self):
+        data = {"name": "Pork", "category_id": self.category.id, "unit_id": self.product.unit_id}
+        response = self.client.post("/api/products/?fields=id", data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["category"]["name"], "Meat")
+
+
+class FastReadPathTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        category = Category.objects.create(name="Meat")
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        products = [
+            Product.objects.create(name="Beef", category=category, unit=unit),
+            Product.objects.create(
+                name="Pocky",
+                category=category,
+                unit=unit,
+                manufacturer=Manufacturer.objects.create(name="Glico"),
+                origin=Origin.objects.create(name="Hokkaido"),
+            ),
+        ]
+        for i, quantity in enumerate(["500", "0.125", "1.5", "12"]):
+            ShoppingRecord.objects.create(
+                price=100 * i,
+                purchase_date=date(2025, 1, i + 1),
+                store=store,
+                quantity=quantity,
+                product=products[i % 2],
+            )
+
+    def assert_parity(self, serializer_class, queryset):
+        reader = values_reader(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        actual = JSONRenderer().render(reader.read(queryset.values(*reader.lookups)))
+        self.assertEqual(actual, expected)
+
+    def test_parity_with_serializers(self):
+        self.assert_parity(ShoppingRecordSerializer, ShoppingRecord.objects.order_by("id"))
+        self.assert_parity(ProductSerializer, Product.objects.order_by("id"))
+
+    def test_list_uses_fast_path(self):
+        response = self.client.get("/api/shopping-records/")
+        expected = ShoppingRecordSerializer(ShoppingRecord.objects.order_by("purchase_date", "id"), many=True).data
+        self.assertEqual(JSONRenderer().render(response.data["results"]), JSONRenderer().render(expected))
+        self.assertIsNone(response.data["next"])
+
+    def test_fast_path_pagination(self):
+        ids = []
+        url = "/api/shopping-records/?page_size=3"
+        while url:
+            response = self.client.get(url)
+            ids.extend(record["id"] for record in response.data["results"])
+            url = response.data["next"]
+        self.assertEqual(
+            ids, list(ShoppingRecord.objects.order_by("purchase_date", "id").values_list("id", flat=True))
+        )
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command("benchmark_read_path", "--rows", "50", "--repeat", "1", stdout=out)
+        self.assertIn("us/row", out.getvalue())
+        self.assertEqual(ShoppingRecord.objects.count(), 4)
+
+
+class ShoppingRecordFilterAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        self.meat = Category.objects.create(name="Meat")
+        snacks = Category.objects.create(name="Snacks")
+        self.glico = Manufacturer.objects.create(name="Glico")
+        self.stores = [
+            Store.objects.create(name="Supermarket", location="Kyoto"),
+            Store.objects.create(name="Drugstore", location="Osaka"),
+        ]
+        self.products = [
+            Product.objects.create(name="Beef", category=self.meat, unit=unit),
+            Product.objects.create(name="Pocky", category=snacks, unit=unit, manufacturer=self.glico),
+        ]
+        for i in range(8):
+            ShoppingRecord.objects.create(
+                price=(i * 3) % 8 * 100,
+                purchase_date=date(2025, 1, i + 1),
+                store=self.stores[i % 2],
+                quantity=1,
+                product=self.products[i // 4],
+            )
+
+    def list_ids(self, query):
+        ids = []
+        url = f"/api/shopping-records/?page_size=3&{query}"
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+            ids.extend(record["id"] for record in response.data["results"])
+            url = response.data["next"]
+        return ids
+
+    def expected_ids(self, *order, **lookups):
+        queryset = ShoppingRecord.objects.filter(**lookups).order_by(*(order or ("purchase_date", "id")))
+        return list(queryset.values_list("id", flat=True))
+
+    def test_filters(self):
+        cases = [
+            (
+                "start_date=2025-01-03&end_date=2025-01-06",
+                {"purchase_date__range": (date(2025, 1, 3), date(2025, 1, 6))},
+            ),
+            (f"store={self.stores[1].pk}", {"store": self.stores[1]}),
+            (f"product={self.products[0].pk},{self.products[1].pk}", {}),
+            (f"category={self.meat.pk}", {"product__category": self.meat}),
+            (f"manufacturer={self.glico.pk}", {"product__manufacturer": self.glico}),
+            ("min_price=200&max_price=500", {"price__range": (200, 500)}),
+            (
+                f"store={self.stores[0].pk}&category={self.meat.pk}&start_date=2025-01-02",
+                {"store": self.stores[0], "product__category": self.meat, "purchase_date__gte": date(2025, 1, 2)},
+            ),
+        ]
+        for query, lookups in cases:
+            with self.subTest(query=query):
+                self.assertEqual(self.list_ids(query), self.expected_ids(**lookups))
+
+    def test_ordering(self):
+        self.assertEqual(self.list_ids("ordering=-price"), self.expected_ids("-price", "-id"))
+        self.assertEqual(
+            self.list_ids(f"ordering=price&store={self.stores[0].pk}"),
+            self.expected_ids("price", "id", store=self.stores[0]),
+        )
+
+    def test_filters_apply_to_export(self):
+        response = self.client.get(f"/api/shopping-records/export/?file_type=ndjson&category={self.meat.pk}")
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([row["id"] for row in rows], self.expected_ids(product__category=self.meat))
+
+    def test_invalid_params(self):
+        for query in (
+            "store=abc",
+            "product=1,x",
+            "category=0",
+            "min_price=-1",
+            "end_date=2025-02-30",
+            "ordering=store",
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f"/api/shopping-records/?{query}")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class ProductSearchAPITest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        unit = Unit.objects.create(name="g")
+        snacks = Category.objects.create(name="Snacks")
+        dairy = Category.objects.create(name="Dairy")
+        glico = Manufacturer.objects.create(name="Glico")
+        self.products = {
+            name: Product.objects.create(name=name, category=category, unit=unit, manufacturer=manufacturer)
+            for name, category, manufacturer in [
+                ("Pocky", snacks, glico),
+                ("Pretz", snacks, glico),
+                ("Milk", dairy, None),
+                ("Chocolate Milk", dairy, glico),
+                ("Milky Way", snacks, None),
+            ]
+        }
+
+    def search(self, query):
+        response = self.client.get("/api/products/search/", {"q": query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [product["name"] for product in response.data]
+
+    def test_ranking(self):
+        # 前方一致 → 部分一致 の順
+        self.assertEqual(self.search("milk"), ["Milk", "Milky Way", "Chocolate Milk"])
+
+    def test_manufacturer_and_category_matches(self):
+        self.assertEqual(self.search("glico"), ["Chocolate Milk", "Pocky", "Pretz"])
+        self.assertEqual(self.search("dair"), ["Chocolate Milk", "Milk"])
+        self.assertEqual(self.search("snack"), ["Milky Way", "Pocky", "Pretz"])
+
+    def test_short_query_is_prefix_only(self):
+        self.assertEqual(self.search("p"), ["Pocky", "Pretz"])
+        self.assertEqual(self.search("lk"), [])
+
+    def test_limit_and_shape(self):
+        response = self.client.get("/api/products/search/", {"q": "milk", "limit": 1})
+        expected = ProductSerializer(self.products["Milk"]).data
+        self.assertEqual(JSONRenderer().render(response.data), JSONRenderer().render([expected]))
+
+    def test_query_count(self):
+        for query, expected in (("p", 1), ("pocky", 3)):
+            with CaptureQueriesContext(connection) as ctx:
+                self.search(query)
+            self.assertEqual(len(ctx.captured_queries), expected)
+
+    def test_invalid_params(self):
+        for params in ({}, {"q": "  "}, {"q": "milk", "limit": 0}, {"q": "milk", "limit": "x"}):
+            with self.subTest(params=params):
+                response = self.client.get("/api/products/search/", params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+def load_urls(server_mode):
+    """
+    Reloads the URLconf, whose `as_view()` calls read SERVER_MODE (see AsyncDispatchMixin).
+    """
+    with override_settings(SERVER_MODE=server_mode):
+        importlib.reload(records_urls)
+    # include() した URLResolver は読み込んだパターンを保持しているため、プロジェクトの URLconf も読み込み直す
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+class AsyncServingTest(TestCase):
+    """
+    Runs the async views through Django's ASGI request path, with SERVER_MODE "asgi".
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        load_urls("asgi")
+        cls.addClassCleanup(load_urls, settings.SERVER_MODE)
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        self.async_client = AsyncClient()
+        self.auth = {"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        product = Product.objects.create(
+            name="Beef", category=Category.objects.create(name="Meat"), unit=Unit.objects.create(name="g")
+        )
+        for day in range(1, 6):
+            ShoppingRecord.objects.create(
+                price=100 * day, purchase_date=date(2025, 1, day), store=store, quantity=1, product=product
+            )
+
+    async def test_async_views_match_sync(self):
+        for url in (
+            "/api/shopping-records/?page_size=2&ordering=-price",
+            "/api/shopping-records/?fields=id,price",
+            "/api/products/",
+            "/api/analytics/spend/?group_by=category,store",
+        ):
+            with self.subTest(url=url):
+                response = await self.async_client.get(url, headers=self.auth)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                expected = await sync_to_async(self.client.get)(url)
+                self.assertEqual(response.json(), expected.json())
+
+    async def test_async_errors_and_auth(self):
+        response = await self.async_client.get("/api/shopping-records/?store=abc", headers=self.auth)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = await AsyncClient().get("/api/analytics/spend/")
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_sync_handlers_still_work(self):
+        records = await self.async_client.get("/api/shopping-records/", headers=self.auth)
+        record = records.json()["results"][0]
+        response = await self.async_client.patch(
+            f"/api/shopping-records/{record['id']}/", {"price": 1}, content_type="application/json", headers=self.auth
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((await ShoppingRecord.objects.aget(pk=record["id"])).price, 1)
+
+    async def test_values_list_aiterator_runs_sql_in_async_context(self):
+        # aexport_rows() が aiterator() を使わない理由。Django で直れば aiterator() に置き換えられる
+        with self.assertRaises(SynchronousOnlyOperation):
+            [row async for row in ShoppingRecord.objects.values_list("id").aiterator()]
+
+    def test_views_are_async_only_under_asgi(self):
+        for url in ("/api/shopping-records/", "/api/shopping-records/export/", "/api/analytics/spend/"):
+            with self.subTest(url=url):
+                self.assertTrue(iscoroutinefunction(resolve(url).func))
+                load_urls("wsgi")
+                try:
+                    self.assertFalse(iscoroutinefunction(resolve(url).func))
+                finally:
+                    load_urls("asgi")
+
+    async def test_export_streams_asynchronously(self):
+        response = await self.async_client.get(
+            "/api/shopping-records/export/?file_type=ndjson&min_price=300", headers=self.auth
+        )
+        self.assertTrue(response.is_async)
+        lines = [line async for line in response.streaming_content]
+        self.assertEqual([json.loads(line)["price"] for line in lines], [300, 400, 500])
+
+
+class EntrypointTest(TestCase):
+    """
+    Runs entrypoint.sh with stub `python` and `gunicorn` commands that print their arguments.
+    """
+
+    def run_entrypoint(self, **env):
+        with tempfile.TemporaryDirectory() as bin_dir:
+            for command in ("python", "gunicorn"):
+                path = os.path.join(bin_dir, command)
+                with open(path, "w") as f:
+                    f.write(f'#!/bin/sh\necho "{command} $*"\n')
+                os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+            return subprocess.run(
+                ["sh", str(settings.BASE_DIR / "entrypoint.sh")],
+                env={
+                    **os.environ,
+                    "PATH": f"{bin_dir}:/usr/bin:/bin",
+                    "PROMETHEUS_MULTIPROC_DIR": os.path.join(bin_dir, "metrics"),
+                    **env,
+                },
+                capture_output=True,
+                text=True,
+            )
+
+    def test_server_modes(self):
+        wsgi = self.run_entrypoint()
+        self.assertEqual(wsgi.returncode, 0, wsgi.stderr)
+        self.assertIn("python manage.py migrate --noinput", wsgi.stdout)
+        self.assertIn("python manage.py partition_records create", wsgi.stdout)
+        self.assertIn("gunicorn --bind 0.0.0.0:8000 --workers 2 shoptrack.wsgi:application", wsgi.stdout)
+
+        asgi = self.run_entrypoint(SERVER_MODE="asgi")
+        self.assertEqual(asgi.returncode, 0, asgi.stderr)
+        self.assertIn("--worker-class uvicorn_worker.UvicornWorker shoptrack.asgi:application", asgi.stdout)
+
+    def test_unknown_mode(self):
+        result = self.run_entrypoint(SERVER_MODE="fastcgi")
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn("SERVER_MODE", result.stderr)
+        self.assertNotIn("migrate", result.stdout)
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def get(self):
+        return self.client.get("/api/analytics/spend/")
+
+    def test_warm_requests_skip_user_query(self):
+        counts = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+            counts.append(len(ctx.captured_queries))
+        # 1回目: ユーザー + 集計, 2回目: 集計のみ
+        self.assertEqual(counts, [2, 1])
+        self.assertEqual(self.client.get("/api/auth/user/").data["username"], "testuser")
+
+    def test_deactivation_invalidates(self):
+        self.get()
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deleted_user(self):
+        self.get()
+        self.user.delete()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIMPLE_JWT={"CHECK_REVOKE_TOKEN": True})
+    def test_password_change_revokes_tokens(self):
+        token = AccessToken.for_user(self.user)
+        token["hash_password"] = get_md5_hash_password(self.user.password)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        self.user.set_password("changed-password")
+        self.user.save()
+        self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_other_worker_changes_expire(self):
+        self.get()
+        # 他のワーカーでの無効化 (シグナルが届かない) を再現
+        get_user_model().objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get().status_code, status.HTTP_200_OK)
+        with override_settings(AUTH_USER_CACHE_TTL=0):
+            self.assertEqual(self.get().status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@override_settings(PERFORMANCE_SAMPLE_RATE=1, METRICS_TOKEN="metrics-secret")
+class PerformanceMiddlewareTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        product = Product.objects.create(
+            name="Beef", category=Category.objects.create(name="Meat"), unit=Unit.objects.create(name="g")
+        )
+        ShoppingRecord.objects.create(
+            price=100, purchase_date=date(2025, 1, 1), store=store, quantity=1, product=product
+        )
+        registry.clear()
+
+    def metrics(self):
+        response = self.client.get("/api/metrics/", headers={"Authorization": "Bearer metrics-secret"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.content.decode()
+
+    def test_server_timing_and_log(self):
+        with self.assertLogs("records.performance", "INFO") as logs:
+            response = self.client.get("/api/shopping-records/")
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^db;dur=[\d.]+;desc="1 queries", serialize;dur=[\d.]+, render;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(
+            {key: record[key] for key in ("method", "path", "view", "status", "queries")},
+            {
+                "method": "GET",
+                "path": "/api/shopping-records/",
+                "view": "shoppingrecord-list",
+                "status": 200,
+                "queries": 1,
+            },
+        )
+        self.assertGreater(record["serialize_ms"], 0)
+        self.assertGreater(record["render_ms"], 0)
+
+    def test_serialization_is_timed_once(self):
+        for url in ["/api/shopping-records/", "/api/shopping-records/?fields=id,product"]:
+            with self.subTest(url=url):
+                with self.assertLogs("records.performance", "INFO") as logs:
+                    self.client.get(url)
+                record = json.loads(logs.records[0].getMessage())
+                # 入れ子のシリアライザの時間は外側に含まれ、二重に数えない
+                self.assertGreater(record["serialize_ms"], 0)
+                self.assertLessEqual(record["serialize_ms"], record["duration_ms"])
+
+    async def test_async_queries_are_counted(self):
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        # 1回目はユーザーの読み込みを含む
+        for expected in (2, 1):
+            response = await AsyncClient().get("/api/analytics/spend/", headers={"Authorization": f"Bearer {token}"})
+            self.assertIn(f'desc="{expected} queries"', response["Server-Timing"])
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_requests_only_feed_histograms(self):
+        for _ in range(2):
+            response = self.client.get("/api/shopping-records/")
+            self.assertNotIn("Server-Timing", response)
+        metrics = self.metrics()
+        labels = 'method="GET",view="shoppingrecord-list"'
+        self.assertIn(f"shoptrack_request_duration_seconds_count{{{labels}}} 2.0", metrics)
+        self.assertIn(f'shoptrack_request_duration_seconds_bucket{{le="+Inf",{labels}}} 2.0', metrics)
+        self.assertIn(f"shoptrack_sampled_requests_total{{{labels}}} 0.0", metrics)
+
+    def test_metrics_endpoint(self):
+        self.client.get("/api/shopping-records/")
+        self.client.get("/api/does-not-exist/")
+        metrics = self.metrics()
+        self.assertIn("# TYPE shoptrack_request_duration_seconds histogram", metrics)
+        labels = 'method="GET",view="shoppingrecord-list"'
+        self.assertIn(f"shoptrack_sampled_db_queries_total{{{labels}}} 1.0", metrics)
+        self.assertIn("# TYPE shoptrack_sampled_serialize_seconds_total counter", metrics)
+        self.assertIn(f"shoptrack_sampled_render_seconds_total{{{labels}}} ", metrics)
+        self.assertIn('view="<unresolved>"', metrics)
+
+        self.assertEqual(self.client.get("/api/metrics/").status_code, status.HTTP_403_FORBIDDEN)
+        with override_settings(METRICS_TOKEN=""):
+            self.assertEqual(self.client.get("/api/metrics/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_workers_are_summed(self):
+        script = (
+            "import django; django.setup(); from records.metrics import registry; "
+            "registry.observe('shoppingrecord-list', 'GET', 0.01)"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, "DJANGO_SETTINGS_MODULE": "shoptrack.settings", "PROMETHEUS_MULTIPROC_DIR": directory}
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", script], env=env, cwd=settings.BASE_DIR, check=True)
+            with mock.patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                metrics = self.metrics()
+        self.assertIn('shoptrack_request_duration_seconds_count{method="GET",view="shoppingrecord-list"} 2.0', metrics)
+        self.assertNotIn("worker", metrics)
+
+
+class FastJSONTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        store = Store.objects.create(name="Supermarket", location="Kyoto\u2028")
+        self.product = Product.objects.create(
+            name='Bœuf 牛肉 "A5"', category=Category.objects.create(name="Meat"), unit=Unit.objects.create(name="g")
+        )
+        for day, price, quantity in [(1, 1000, "500.5"), (2, 1200, "0.001"), (40, 980, "1")]:
+            ShoppingRecord.objects.create(
+                price=price,
+                purchase_date=date(2025, 1, 1) + timedelta(days=day),
+                store=store,
+                quantity=Decimal(quantity),
+                product=self.product,
+            )
+
+    def test_responses_match_json_renderer(self):
+        for url in [
+            "/api/shopping-records/",
+            "/api/products/",
+            f"/api/products/{self.product.id}/price-history/",
+            "/api/analytics/spend/?group_by=month,category",
+            "/api/shopping-records/?min_price=abc",
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_render_types(self):
+        data = {
+            "decimal": Decimal("1.50"),
+            "date": date(2025, 1, 2),
+            "datetime": datetime(2025, 1, 2, 3, 4, 5, 6000, tzinfo=dt_timezone.utc),
+            "naive": datetime(2025, 1, 2, 3, 4, 5),
+            "lazy": gettext_lazy("This field is required."),
+            "text": 'line separator \u2028 paragraph \u2029 \x1f "é" 😀',
+            "big": 2**70,
+            "nested": [(1, None, True), {"x": 0.1}],
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(None), b"")
+        indented = FastJSONRenderer().render(data, "application/json; indent=2")
+        self.assertEqual(indented, JSONRenderer().render(data, "application/json; indent=2"))
+
+    @skipIf(orjson is None, "orjson is not installed")
+    def test_float_differences(self):
+        # 値は同じだが、指数の書き方は json.dumps と異なることがある
+        for value in [1e16, -1.5e300, 1e-7, 0.1 + 0.2, Decimal("1E+16")]:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    json.loads(FastJSONRenderer().render([value])), json.loads(JSONRenderer().render([value]))
+                )
+        self.assertEqual(FastJSONRenderer().render([1e-7]), b"[1e-7]")
+        self.assertEqual(JSONRenderer().render([1e-7]), b"[1e-07]")
+        # JSON にない値は、JSONRenderer ではエラーになるが null として出力される
+        for value in [float("nan"), float("inf"), float("-inf")]:
+            with self.subTest(value=value):
+                self.assertEqual(FastJSONRenderer().render({"x": value}), b'{"x":null}')
+                with self.assertRaises(ValueError):
+                    JSONRenderer().render({"x": value})
+
+    def test_parser(self):
+        response = self.client.post("/api/categories/", '{"name": "Fish \\u2028 魚"}', content_type="application/json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["name"], "Fish \u2028 魚")
+
+        for body in ['{"name": ', '{"name": NaN}', "\ufeff{}"]:
+            with self.subTest(body=body):
+                expected = None
+                try:
+                    JSONParser().parse(io.BytesIO(body.encode()))
+                except ParseError as e:
+                    expected = str(e.detail)
+                response = self.client.post("/api/categories/", body, content_type="application/json")
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data["detail"], expected)
+
+
+@override_settings(RESPONSE_COMPRESSION_MIN_SIZE=200)
+class CompressionMiddlewareTest(APITestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        Category.objects.bulk_create([Category(name=f"Category {i}") for i in range(30)])
+        versioning.bump(Category)
+
+    def create_records(self, count):
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        product = Product.objects.create(
+            name="Beef", category=Category.objects.first(), unit=Unit.objects.create(name="g")
+        )
+        for day in range(count):
+            ShoppingRecord.objects.create(
+                price=100, purchase_date=date(2025, 1, 1 + day), store=store, quantity=1, product=product
+            )
+
+    def get(self, accept_encoding, **extra):
+        return self.client.get("/api/categories/", HTTP_ACCEPT_ENCODING=accept_encoding, **extra)
+
+    def test_gzip(self):
+        plain = self.get("")
+        self.assertNotIn("Content-Encoding", plain)
+        self.assertIn("Accept-Encoding", plain["Vary"])
+
+        response = self.get("gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Content-Length"], str(len(response.content)))
+        self.assertLess(len(response.content), len(plain.content))
+        self.assertEqual(gzip.decompress(response.content), plain.content)
+        self.assertIn("Accept-Encoding", response["Vary"])
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_brotli(self):
+        plain = self.get("")
+        response = self.get("gzip, br")
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(brotli.decompress(response.content), plain.content)
+        self.assertEqual(self.get("gzip;q=1, br;q=0.5")["Content-Encoding"], "gzip")
+        self.assertEqual(self.get("br;q=0, *")["Content-Encoding"], "gzip")
+
+    def test_not_compressed(self):
+        self.assertNotIn("Content-Encoding", self.get("identity"))
+        self.assertNotIn("Content-Encoding", self.get("gzip;q=0"))
+        with override_settings(RESPONSE_COMPRESSION_MIN_SIZE=100_000):
+            response = self.get("gzip")
+            self.assertNotIn("Content-Encoding", response)
+            self.assertNotIn("Accept-Encoding", response.get("Vary", ""))
+        # HTML (管理画面など) は圧縮しない
+        self.assertNotIn("Content-Encoding", self.client.get("/api/categories/", HTTP_ACCEPT="text/html"))
+
+    def test_conditional_get_with_weakened_etag(self):
+        plain_etag = self.get("")["ETag"]
+        response = self.get("gzip")
+        self.assertEqual(response["ETag"], f"W/{plain_etag}")
+        response = self.get("gzip", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    async def test_async_view(self):
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        await sync_to_async(self.create_records)(20)
+        response = await AsyncClient().get(
+            "/api/shopping-records/", headers={"Authorization": f"Bearer {token}", "Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(len(json.loads(gzip.decompress(response.content))["results"]), 20)
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(
+            parse_accept_encoding("GZIP;q=0.5, br ; q=1.0, identity;q=x,,"),
+            {"gzip": 0.5, "br": 1.0, "identity": 0.0},
+        )
+
+
+class DatabasePoolTest(TestCase):
+    def test_pool_options_from_environment(self):
+        self.assertEqual(
+            database_pool_options({"DATABASE_POOL_MAX_SIZE": "4", "DATABASE_POOL_TIMEOUT": "2.5"}),
+            {"min_size": 1, "max_size": 4, "timeout": 2.5, "max_idle": 300.0, "max_lifetime": 3600.0},
+        )
+
+    def setUp(self):
+        registry.clear()
+
+    def test_no_pool_metrics_without_pooling(self):
+        self.assertEqual(database_pools(), {})
+        registry.observe_pools({})
+        self.assertNotIn("shoptrack_db_pool_size{", registry.render())
+
+    @skipIf(psycopg_pool is None, "psycopg_pool is not installed")
+    def test_pool_metrics(self):
+        pool = psycopg_pool.ConnectionPool("", open=False, **database_pool_options({}))
+        registry.observe_pools({"default": pool})
+        metrics = registry.render()
+        self.assertIn("# TYPE shoptrack_db_pool_size gauge", metrics)
+        self.assertIn('shoptrack_db_pool_max_size{database="default"} 10.0', metrics)
+        self.assertIn('shoptrack_db_pool_requests_errors_total{database="default"} 0.0', metrics)
+        self.assertIn('shoptrack_db_pool_wait_seconds_total{database="default"} 0.0', metrics)
+
+    @skipUnless(os.environ.get("TEST_POSTGRES_URL"), "TEST_POSTGRES_URL is not set")
+    def test_pool_against_postgresql(self):
+        options = database_pool_options({"DATABASE_POOL_MIN_SIZE": "1", "DATABASE_POOL_MAX_SIZE": "2"})
+        pool = psycopg_pool.ConnectionPool(
+            os.environ["TEST_POSTGRES_URL"], open=True, check=psycopg_pool.ConnectionPool.check_connection, **options
+        )
+        self.addCleanup(pool.close)
+
+        def query():
+            with pool.connection() as conn:
+                conn.execute("SELECT pg_sleep(0.1)")
+
+        threads = [threading.Thread(target=query) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = pool.get_stats()
+        self.assertEqual(stats["requests_num"], 3)
+        self.assertGreaterEqual(stats["requests_queued"], 1)
+        self.assertLessEqual(stats["pool_size"], 2)
+
+        # サーバー側で切断された接続は、貸し出し時のヘルスチェックで捨てられる
+        with pool.connection() as conn:
+            pid = conn.info.backend_pid
+        with psycopg.connect(os.environ["TEST_POSTGRES_URL"], autocommit=True) as admin:
+            admin.execute("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE pid = %s", [pid])
+        # 死んだ接続が貸し出されていればここで OperationalError になる
+        for _ in range(3):
+            with pool.connection() as conn:
+                self.assertEqual(conn.execute("SELECT 1").fetchone(), (1,))
+
+
+@override_settings(REPLICA_DATABASE="replica")
+class ReplicaRoutingTest(APITestCase):
+    """
+    Uses the local "replica" SQLite alias as a replica that has not caught up with the primary.
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        Category.objects.create(name="Primary")
+        Category.objects.using("replica").create(name="Replica")
+
+        store = Store.objects.create(name="Supermarket", location="Kyoto")
+        product = Product.objects.create(
+            name="Beef", category=Category.objects.get(name="Primary"), unit=Unit.objects.create(name="g")
+        )
+        ShoppingRecord.objects.create(
+            price=100, purchase_date=date(2025, 1, 5), store=store, quantity=1, product=product
+        )
+        reference_cache.clear_all()
+
+    def category_names(self, response):
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [row["name"] for row in response.data["results"]]
+
+    def test_safe_reads_use_replica(self):
+        self.assertEqual(self.category_names(self.client.get("/api/categories/")), ["Replica"])
+        self.assertEqual(self.client.get("/api/shopping-records/").data["results"], [])
+        self.assertEqual(self.client.get("/api/analytics/spend/").data, [])
+
+    def test_reads_use_primary_without_replica(self):
+        with override_settings(REPLICA_DATABASE=None):
+            response = self.client.get("/api/categories/")
+        self.assertEqual(self.category_names(response), ["Primary"])
+        self.assertNotIn(PRIMARY_PIN_COOKIE, response.cookies)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post("/api/categories/", {"name": "Fish"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertTrue(Category.objects.filter(name="Fish").exists())
+        self.assertFalse(Category.objects.using("replica").filter(name="Fish").exists())
+        cookie = response.cookies[PRIMARY_PIN_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.REPLICA_PIN_SECONDS)
+        self.assertTrue(cookie["httponly"])
+
+        # 書き込んだクライアントは自分の書き込みを読める
+        self.assertCountEqual(self.category_names(self.client.get("/api/categories/")), ["Fish", "Primary"])
+        self.assertEqual(len(self.client.get("/api/shopping-records/").data["results"]), 1)
+        self.assertEqual(len(self.client.get("/api/analytics/spend/").data), 1)
+
+    def test_reads_after_write_in_request_use_primary(self):
+        state = RoutingState()
+        state.use_replica = True
+        token = current_routing.set(state)
+        try:
+            self.assertEqual(ReplicaRouter().db_for_read(Category), "replica")
+            ReplicaRouter().db_for_write(Category)
+            self.assertIsNone(ReplicaRouter().db_for_read(Category))
+        finally:
+            current_routing.reset(token)
+
+    async def test_async_views_use_replica(self):
+        await sync_to_async(self.create_replica_user)()
+        response = await AsyncClient().get(
+            "/api/shopping-records/", headers={"Authorization": f"Bearer {AccessToken.for_user(self.user)}"}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["results"], [])
+
+    def create_replica_user(self):
+        get_user_model().objects.using("replica").bulk_create(
+            [get_user_model()(pk=self.user.pk, username=self.user.username, password=self.user.password)]
+        )
+
+
+class PartitioningTest(TestCase):
+    def test_periods(self):
+        self.assertEqual(
+            partitioning.periods(date(2024, 11, 15), date(2025, 2, 1), "month"),
+            [date(2024, 11, 1), date(2024, 12, 1), date(2025, 1, 1), date(2025, 2, 1)],
+        )
+        self.assertEqual(
+            partitioning.periods(date(2024, 5, 1), date(2025, 1, 1), "year"), [date(2024, 1, 1), date(2025, 1, 1)]
+        )
+        self.assertEqual(partitioning.next_period(date(2024, 12, 1), "month"), date(2025, 1, 1))
+        self.assertEqual(partitioning.partition_name(date(2024, 3, 1), "month"), "records_shoppingrecord_m202403")
+        self.assertEqual(partitioning.partition_name(date(2024, 1, 1), "year"), "records_shoppingrecord_y2024")
+
+    def test_partition_interval(self):
+        self.assertIsNone(partitioning.partition_interval([]))
+        self.assertEqual(partitioning.partition_interval([("p", date(2024, 2, 1), date(2024, 3, 1))]), "month")
+        self.assertEqual(partitioning.partition_interval([("p", date(2024, 1, 1), date(2025, 1, 1))]), "year")
+
+    @skipIf(connection.vendor == "postgresql", "runs against SQLite")
+    def test_sqlite_is_left_alone(self):
+        out = io.StringIO()
+        call_command("partition_records", "create", stdout=out)
+        self.assertIn("not partitioned", out.getvalue())
+        with self.assertRaisesMessage(CommandError, "requires PostgreSQL"):
+            call_command("partition_records", "convert", "--interval", "month")
+        with self.assertRaisesMessage(CommandError, "requires PostgreSQL"):
+            call_command("partition_records", "detach", "--before", "2020-01-01")
+
+    @skipUnless(os.environ.get("TEST_POSTGRES_URL"), "TEST_POSTGRES_URL is not set")
+    def test_partitioning_against_postgresql(self):
+        table = "partition_test_record"
+        conn = psycopg.connect(os.environ["TEST_POSTGRES_URL"], autocommit=True, cursor_factory=psycopg.ClientCursor)
+        self.addCleanup(conn.close)
+        cursor = conn.cursor()
+
+        def drop_tables():
+            for name in [table, f"{table}_y2023", "partition_test_store"]:
+                cursor.execute(f"DROP TABLE IF EXISTS {name}")
+
+        drop_tables()
+        self.addCleanup(drop_tables)
+        cursor.execute("CREATE TABLE partition_test_store (id bigint PRIMARY KEY)")
+        cursor.execute(
+            f"CREATE TABLE {table} (id bigint GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY, price integer NOT NULL, "
+            "purchase_date date NOT NULL, store_id bigint NOT NULL REFERENCES partition_test_store (id))"
+        )
+        cursor.execute(f"CREATE INDEX {table}_date_idx ON {table} (purchase_date, id)")
+        cursor.execute("INSERT INTO partition_test_store VALUES (1)")
+        cursor.execute(
+            f"INSERT INTO {table} (price, purchase_date, store_id) "
+            "VALUES (100, '2023-05-01', 1), (200, '2024-03-10', 1), (300, '2024-12-31', 1)"
+        )
+
+        with conn.transaction():
+            partitioning.convert_table(cursor, "year", date(2025, 6, 1), 1, table=table)
+        self.assertTrue(partitioning.is_partitioned(cursor, table))
+        self.assertEqual(
+            [name for name, _, _ in partitioning.list_partitions(cursor, table)],
+            [f"{table}_y2023", f"{table}_y2024", f"{table}_y2025", f"{table}_y2026"],
+        )
+        cursor.execute(
+            f"INSERT INTO {table} (price, purchase_date, store_id) VALUES (400, '2025-01-01', 1) RETURNING id"
+        )
+        self.assertEqual(cursor.fetchone()[0], 4)
+        cursor.execute(f"SELECT indexname FROM pg_indexes WHERE tablename = '{table}' ORDER BY indexname")
+        self.assertEqual([row[0] for row in cursor.fetchall()], [f"{table}_date_idx", f"{table}_pkey"])
+        with self.assertRaises(psycopg.errors.ForeignKeyViolation):
+            cursor.execute(f"INSERT INTO {table} (price, purchase_date, store_id) VALUES (1, '2025-01-01', 99)")
+
+        # 日付で絞り込んだクエリは範囲外のパーティションを読まない
+        cursor.execute(
+            f"EXPLAIN SELECT * FROM {table} WHERE purchase_date >= %s AND purchase_date <= %s",
+            ["2024-01-01", "2024-12-31"],
+        )
+        plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn(f"{table}_y2024", plan)
+        self.assertNotIn(f"{table}_y2023", plan)
+
+        # 範囲外の行は既定パーティションに入り、そのパーティションを作ると移される
+        cursor.execute(f"INSERT INTO {table} (price, purchase_date, store_id) VALUES (500, '2028-02-01', 1)")
+        with conn.transaction():
+            created = partitioning.create_future_partitions(cursor, date(2028, 1, 1), 0, table=table)
+        self.assertEqual(created, [f"{table}_y2027", f"{table}_y2028"])
+        cursor.execute(f"SELECT tableoid::regclass::text FROM {table} WHERE price = 500")
+        self.assertEqual(cursor.fetchone()[0], f"{table}_y2028")
+
+        with conn.transaction():
+            detached = partitioning.detach_partitions(cursor, date(2024, 1, 1), table=table)
+        self.assertEqual(detached, [(f"{table}_y2023", date(2023, 1, 1), date(2024, 1, 1))])
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        self.assertEqual(cursor.fetchone()[0], 4)
+        cursor.execute(f"SELECT price FROM {table}_y2023")
+        self.assertEqual(cursor.fetchall(), [(100,)])
+
+
+@skipIf(columnar.np is None, "NumPy is not installed")
+class ColumnarEngineTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+        columnar.engine.reset()
+        self.addCleanup(columnar.engine.reset)
+
+        rng = random.Random(0)
+        unit = Unit.objects.create(name="g")
+        categories = [Category.objects.create(name=name) for name in ("Meat", "Snacks", "Drinks")]
+        manufacturers = [Manufacturer.objects.create(name=name) for name in ("Glico", "Meiji")] + [None]
+        self.stores = [Store.objects.create(name=f"Store {i}", location="Kyoto") for i in range(3)]
+        self.products = [
+            Product.objects.create(
+                name=f"Product {i}", category=categories[i % 3], unit=unit, manufacturer=manufacturers[i % 3]
+            )
+            for i in range(7)
+        ]
+        for _ in range(200):
+            ShoppingRecord.objects.create(
+                price=rng.randrange(50, 3000),
+                purchase_date=date(2024, 1, 1) + timedelta(days=rng.randrange(500)),
+                store=rng.choice(self.stores),
+                quantity=Decimal(rng.choice([0, 1, 2, 250, 333])) / rng.choice([1, 1000]),
+                product=rng.choice(self.products),
+            )
+
+    def assert_matches_sql(self, group_by, start_date=None, end_date=None):
+        expected = spend_summary(group_by, start_date, end_date)
+        actual = columnar.engine.spend_summary(group_by, start_date, end_date)
+        if "manufacturer" in group_by:
+            # NULL の並び順はデータベースによって異なる
+            self.assertCountEqual(actual, expected)
+        else:
+            self.assertEqual(actual, expected)
+
+    def test_matches_sql(self):
+        for group_by in [
+            [],
+            ["month"],
+            ["category"],
+            ["store"],
+            ["manufacturer"],
+            ["month", "category"],
+            ["category", "store"],
+            ["store", "manufacturer", "month"],
+        ]:
+            for start_date, end_date in [
+                (None, None),
+                (date(2024, 3, 1), date(2024, 8, 31)),
+                (date(2024, 3, 15), date(2025, 2, 3)),
+                (date(2030, 1, 1), None),
+            ]:
+                with self.subTest(group_by=group_by, start_date=start_date, end_date=end_date):
+                    self.assert_matches_sql(group_by, start_date, end_date)
+
+    def test_refreshes_after_writes(self):
+        self.assert_matches_sql(["category", "store"])
+        loaded = columnar.engine.snapshot
+
+        ShoppingRecord.objects.create(
+            price=500, purchase_date=date(2025, 6, 1), store=self.stores[0], quantity=1, product=self.products[0]
+        )
+        self.assert_matches_sql(["category", "store"])
+        # 追加だけならスナップショットを読み直さず、新しい行を足す
+        self.assertEqual(len(columnar.engine.snapshot), len(loaded) + 1)
+        self.assertEqual(columnar.engine.snapshot.loaded_at, loaded.loaded_at)
+
+        record = ShoppingRecord.objects.order_by("id").first()
+        record.price += 1000
+        record.save()
+        self.assert_matches_sql(["month", "store"])
+        ShoppingRecord.objects.order_by("id").last().delete()
+        self.assert_matches_sql(["month", "store"])
+
+        product = self.products[1]
+        product.category = Category.objects.create(name="Frozen")
+        product.save()
+        self.assert_matches_sql(["category"])
+
+    def test_percentiles(self):
+        summary = columnar.engine.spend_summary(["store"], percentiles=[0, 50, 90])
+        for row in summary:
+            unit_prices = [
+                record.price / float(record.quantity)
+                for record in ShoppingRecord.objects.filter(store_id=row["store_id"], quantity__gt=0)
+            ]
+            quantiles = statistics.quantiles(unit_prices, n=10, method="inclusive")
+            self.assertAlmostEqual(float(row["unit_price_p0"]), min(unit_prices), delta=0.006)
+            self.assertAlmostEqual(float(row["unit_price_p50"]), quantiles[4], delta=0.006)
+            self.assertAlmostEqual(float(row["unit_price_p90"]), quantiles[8], delta=0.006)
+
+    def test_memory_budget(self):
+        self.assertIsNotNone(columnar.engine.spend_summary(["month"]))
+        self.assertEqual(columnar.engine.snapshot.nbytes, 200 * columnar.BYTES_PER_ROW)
+
+        columnar.engine.reset()
+        with override_settings(ANALYTICS_SNAPSHOT_MAX_BYTES=199 * columnar.BYTES_PER_ROW):
+            self.assertIsNone(columnar.engine.spend_summary(["month"]))
+            response = self.client.get("/api/analytics/spend/", {"engine": "columnar"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response["Analytics-Engine"], "sql")
+            response = self.client.get("/api/analytics/spend/", {"engine": "columnar", "percentiles": "50"})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_api(self):
+        params = {"group_by": "category,store", "start_date": "2024-02-10"}
+        sql = self.client.get("/api/analytics/spend/", params)
+        self.assertEqual(sql["Analytics-Engine"], "sql")
+        response = self.client.get("/api/analytics/spend/", {**params, "engine": "columnar"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["Analytics-Engine"], "columnar")
+        self.assertEqual(response.content, sql.content)
+
+        response = self.client.get("/api/analytics/spend/", {**params, "engine": "columnar", "percentiles": "25,75"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn("unit_price_p25", response.data[0])
+        self.assertIn("unit_price_p75", response.data[0])
+
+        for params in [{"engine": "duckdb"}, {"percentiles": "50"}, {"engine": "columnar", "percentiles": "101"}]:
+            with self.subTest(params=params):
+                response = self.client.get("/api/analytics/spend/", params)
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class PriceIndexTest(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(username="testuser", password="testpassword")
+        self.client.force_authenticate(user=self.user)
+
+        grams = Unit.objects.create(name="g")
+        pieces = Unit.objects.create(name="pc")
+        self.meat = Category.objects.create(name="Meat")
+        self.snacks = Category.objects.create(name="Snacks")
+        self.store = Store.objects.create(name="Supermarket", location="Kyoto")
+        self.beef = Product.objects.create(name="Beef", category=self.meat, unit=grams)
+        pork = Product.objects.create(name="Pork", category=self.meat, unit=grams)
+        pocky = Product.objects.create(name="Pocky", category=self.snacks, unit=pieces)
+        for purchase_date, product, price, quantity in [
+            (date(2025, 1, 5), self.beef, 1000, 500),
+            (date(2025, 1, 9), pork, 600, 300),
+            (date(2025, 1, 9), pocky, 150, 1),
+            (date(2025, 1, 20), pocky, 0, 0),
+            (date(2025, 2, 3), self.beef, 1100, 500),
+            (date(2025, 2, 3), pork, 600, 300),
+            (date(2025, 2, 14), pocky, 160, 1),
+            (date(2025, 3, 1), self.beef, 1210, 500),
+        ]:
+            self.record(purchase_date, product, price, quantity)
+
+    def record(self, purchase_date, product, price, quantity):
+        return ShoppingRecord.objects.create(
+            price=price, purchase_date=purchase_date, store=self.store, quantity=quantity, product=product
+        )
+
+    def index_values(self):
+        return list(PriceIndex.objects.order_by("category_id", "month").values_list("category_id", "month", "index"))
+
+    def test_chained_index(self):
+        price_index.refresh()
+        response = self.client.get("/api/analytics/price-index/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            set(response.data[0]), {"category_id", "category", "month", "index", "change", "matched_products"}
+        )
+        self.assertEqual(
+            [
+                (row["category"], row["month"], row["index"], row["change"], row["matched_products"])
+                for row in response.data
+            ],
+            [
+                ("Meat", date(2025, 1, 1), "100.0000", None, 0),
+                # (2.2 * 500 + 2.0 * 300) / (1000 + 600)
+                ("Meat", date(2025, 2, 1), "106.2500", "6.25", 2),
+                # 豚肉は3月に買っていないので牛肉だけで比べる
+                ("Meat", date(2025, 3, 1), "116.8750", "10.00", 1),
+                ("Snacks", date(2025, 1, 1), "100.0000", None, 0),
+                ("Snacks", date(2025, 2, 1), "106.6667", "6.67", 1),
+            ],
+        )
+
+        response = self.client.get(
+            "/api/analytics/price-index/",
+            {"category": self.meat.id, "start_date": "2025-02-15", "end_date": "2025-03-31"},
+        )
+        self.assertEqual([row["month"] for row in response.data], [date(2025, 2, 1), date(2025, 3, 1)])
+        response = self.client.get("/api/analytics/price-index/", {"category": "meat"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_recomputes_changed_months_only(self):
+        self.assertEqual(price_index.refresh(), 5)
+        kept = set(PriceIndex.objects.exclude(category=self.meat, month=date(2025, 3, 1)).values_list("id", flat=True))
+        self.assertEqual(price_index.refresh(), 0)
+
+        self.record(date(2025, 3, 20), self.beef, 1300, 500)
+        self.assertEqual(price_index.refresh(), 1)
+        self.assertTrue(kept <= set(PriceIndex.objects.values_list("id", flat=True)))
+        incremental = self.index_values()
+        price_index.refresh(rebuild=True)
+        self.assertEqual(self.index_values(), incremental)
+
+        # 過去の月の記録が変わると、その分類のその月以降を計算し直す
+        ShoppingRecord.objects.filter(product=self.beef, purchase_date=date(2025, 2, 3)).delete()
+        self.assertEqual(price_index.refresh(), 2)
+        self.assertEqual(PriceIndex.objects.get(category=self.meat, month=date(2025, 2, 1)).matched_products, 1)
+        incremental = self.index_values()
+        price_index.refresh(rebuild=True)
+        self.assertEqual(self.index_values(), incremental)
+
+    def test_recomputes_edits_with_equal_totals(self):
+        price_index.refresh()
+        # 同じ分類の別の商品への付け替えは月次集計を変えない (3月の比較が牛肉から豚肉になる)
+        record = ShoppingRecord.objects.get(product=self.beef, purchase_date=date(2025, 3, 1))
+        record.product = Product.objects.get(name="Pork")
+        record.save()
+        self.assertEqual(price_index.refresh(), 1)
+        self.assertEqual(PriceIndex.objects.get(category=self.meat, month=date(2025, 3, 1)).change, Decimal("21.00"))
+        self.assertEqual(price_index.refresh(), 0)
+
+        # 単位の変更は、その商品の記録がある月 (1月と2月) から計算し直す
+        self.beef.unit = Unit.objects.create(name="kg")
+        self.beef.save()
+        self.assertEqual(price_index.refresh(), 3)
+        self.assertEqual(price_index.refresh(), 0)
+
+        # 一括編集も同じく印を付ける
+        bulk_edit.update_records(ShoppingRecord.objects.filter(pk=record.pk), {"product": self.beef})
+        self.assertEqual(price_index.refresh(), 1)
+        bulk_edit.update_products(Product.objects.filter(pk=self.beef.pk), {"unit": Unit.objects.get(name="g")})
+        self.assertEqual(price_index.refresh(), 3)
+        incremental = self.index_values()
+        price_index.refresh(rebuild=True)
+        self.assertEqual(self.index_values(), incremental)
+
+    def test_requests_only_read(self):
+        price_index.refresh()
+        self.record(date(2025, 3, 20), self.beef, 1300, 500)
+        stored = self.index_values()
+        response = self.client.get("/api/analytics/price-index/")
+        self.assertEqual(len(response.data), 5)
+        self.assertEqual(self.index_values(), stored)
+        self.assertEqual(price_index.refresh(), 1)
+
+    def test_command(self):
+        out = io.StringIO()
+        call_command("compute_price_index", stdout=out)
+        self.assertIn("Wrote 5 price index rows.", out.getvalue())
+        out = io.StringIO()
+        call_command("compute_price_index", "--rebuild", stdout=out)
+        self.assertIn("Wrote 5 price index rows.", out.getvalue())
@@ -10,11 +10,14 @@ from .views import (
     LogoutView,
     ManufacturerViewSet,
     OriginViewSet,
+    PriceIndexView,
     ProductViewSet,
     ShoppingRecordViewSet,
+    SpendAnalyticsView,
     StoreViewSet,
     UnitViewSet,
     UserDetailView,
+    metrics_view,
 )
 
 router = routers.DefaultRouter()
@@ -45,4 +48,7 @@ urlpatterns = [
     path("auth/token/verify/", TokenVerifyView.as_view(), name="token_verify"),
     path("auth/user/", UserDetailView.as_view(), name="user_detail"),
     path("auth/logout/", LogoutView.as_view(), name="logout"),
+    path("analytics/spend/", SpendAnalyticsView.as_view(), name="analytics_spend"),
+    path("analytics/price-index/", PriceIndexView.as_view(), name="analytics_price_index"),
+    path("metrics/", metrics_view, name="metrics"),
 ]
@@ -0,0 +1,31 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import TableVersion
+
+
+def bump(model):
+    """
+    Increments the version stamp of `model`'s table.
+    """
+    table = model._meta.db_table
+    now = timezone.now()
+    if TableVersion.objects.filter(table=table).update(version=F("version") + 1, updated_at=now):
+        return
+    # 最初の書き込みでは version 1 の行を作る。別の接続が先に作っていた場合だけ加算し直す
+    try:
+        with transaction.atomic():
+            TableVersion.objects.create(table=table, version=1, updated_at=now)
+    except IntegrityError:
+        TableVersion.objects.filter(table=table).update(version=F("version") + 1, updated_at=now)
+
+
+def current(model):
+    """
+    Returns (version, updated_at) for `model`'s table, or (0, None) if it was never written.
+    """
+    return TableVersion.objects.filter(table=model._meta.db_table).values_list("version", "updated_at").first() or (
+        0,
+        None,
+    )
@@ -1,17 +1,47 @@
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound, StreamingHttpResponse
+from django.utils.crypto import constant_time_compare
 from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
-from .models import Category, Manufacturer, Origin, Product, ShoppingRecord, Store, Unit
+from . import bulk_edit, columnar
+from .analytics import (
+    ANALYTICS_ENGINES,
+    GROUP_BY_FIELDS,
+    PRICE_HISTORY_BUCKETS,
+    aspend_summary,
+    product_price_history,
+    spend_summary,
+)
+from .export import aexport_rows, aiter_csv, aiter_ndjson, export_rows, iter_csv, iter_ndjson
+from .fast_read import values_reader
+from .filters import AllowListOrderingFilter, ProductFilter, ShoppingRecordFilter, parse_date, parse_id_list
+from .metrics import database_pools, registry
+from .mixins import (
+    AsyncDispatchMixin,
+    ConditionalGetMixin,
+    FastListMixin,
+    ReplicaReadMixin,
+    SparseFieldsetMixin,
+)
+from .models import Category, Manufacturer, Origin, PriceIndex, Product, ShoppingRecord, Store, Unit
+from .pagination import ShoppingRecordCursorPagination
+from .search import search_products
 from .serializers import (
     CategorySerializer,
     ManufacturerSerializer,
     OriginSerializer,
     ProductSerializer,
+    ShoppingRecordBulkItemSerializer,
     ShoppingRecordSerializer,
     StoreSerializer,
     UnitSerializer,
@@ -19,6 +49,69 @@ from .serializers import (
 )
 
 
+def parse_date_param(request, name):
+    """
+    Returns the `name` query parameter as a date, or None if it is absent.
+
+    Raises a ValidationError (400) if the value is not an ISO 8601 date.
+    """
+    return parse_date(request.query_params, name)
+
+
+def stringify_decimals(row):
+    """
+    Returns a copy of `row` with Decimal values as strings, like DRF's DecimalField.
+    """
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in row.items()}
+
+
+def bulk_selection(request, queryset, filter_class):
+    """
+    Filters `queryset` for a bulk write by `?ids=` and the list filters of `filter_class`.
+
+    Raises a ValidationError (400) if neither is given, so a bare request
+    cannot change the whole table.
+    """
+    lookups = filter_class().get_lookups(request.query_params)
+    ids = parse_id_list(request.query_params, "ids")
+    if ids is not None:
+        lookups["pk__in"] = ids
+    if not lookups:
+        raise ValidationError({"ids": "Select the rows with `ids` or at least one filter."})
+    return queryset.filter(**lookups)
+
+
+def bulk_changes(serializer_class, data):
+    """
+    Validates `data` as a partial update with `serializer_class` and returns it as update() arguments.
+
+    Related `<name>_id` fields become `<name>` model instances.
+    """
+    serializer = serializer_class(data=data, partial=True)
+    serializer.is_valid(raise_exception=True)
+    changes = {name.removesuffix("_id"): value for name, value in serializer.validated_data.items()}
+    if not changes:
+        raise ValidationError({"detail": "Expected at least one field to change."})
+    return changes
+
+
+def metrics_view(request):
+    """
+    Serves the request and database pool metrics in the Prometheus text format.
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set;
+    without a token the endpoint is only available with DEBUG.
+    """
+    if settings.METRICS_TOKEN:
+        authorization = request.headers.get("Authorization", "")
+        if not constant_time_compare(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+            return HttpResponseForbidden()
+    elif not settings.DEBUG:
+        return HttpResponseNotFound()
+    registry.observe_pools(database_pools())
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 class CookieTokenObtainPairView(TokenObtainPairView):
     """
     Obtains a token pair and sets the refresh token in a secure, HttpOnly cookie.
@@ -104,9 +197,138 @@ class UserDetailView(APIView):
         return Response(serializer.data)
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class SpendAnalyticsView(ReplicaReadMixin, AsyncDispatchMixin, APIView):
+    """
+    API endpoint that aggregates spending in the database or in memory.
+
+    The `sql` engine reads the daily/monthly rollup tables unless grouping by
+    manufacturer. The `columnar` engine aggregates this worker's in-memory
+    snapshot of the records (see `records.columnar`) and falls back to `sql`
+    when the snapshot is unavailable. The `Analytics-Engine` response header
+    tells which one answered.
+
+    Query parameters:
+        group_by: comma-separated keys out of `month`, `category`, `store`
+            and `manufacturer` (default: `month`). An empty value returns one
+            row with the overall totals.
+        start_date / end_date: inclusive purchase date range (YYYY-MM-DD).
+        engine: `sql` or `columnar` (default: the ANALYTICS_ENGINE setting).
+        percentiles: comma-separated percentiles (0-100) of the purchases'
+            unit prices to add per group as `unit_price_p<value>`; columnar
+            engine only.
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        group_by, start_date, end_date, engine, percentiles = self.parse_params(request)
+        summary = None
+        if engine == "columnar":
+            summary = self.check_columnar(
+                columnar.engine.spend_summary(group_by, start_date, end_date, percentiles), percentiles
+            )
+        if summary is None:
+            engine = "sql"
+            summary = spend_summary(group_by, start_date, end_date)
+        return self.summary_response(summary, engine)
+
+    async def aget(self, request):
+        group_by, start_date, end_date, engine, percentiles = self.parse_params(request)
+        summary = None
+        if engine == "columnar":
+            summary = self.check_columnar(
+                await sync_to_async(columnar.engine.spend_summary)(group_by, start_date, end_date, percentiles),
+                percentiles,
+            )
+        if summary is None:
+            engine = "sql"
+            summary = await aspend_summary(group_by, start_date, end_date)
+        return self.summary_response(summary, engine)
+
+    def parse_params(self, request):
+        """
+        Returns (group_by, start_date, end_date, engine, percentiles) from the query parameters.
+        """
+        group_by = [key.strip() for key in request.query_params.get("group_by", "month").split(",") if key.strip()]
+        unknown = [key for key in group_by if key not in GROUP_BY_FIELDS]
+        if unknown:
+            raise ValidationError({"group_by": f"Unknown keys: {', '.join(unknown)}."})
+        group_by = list(dict.fromkeys(group_by))
+
+        start_date = parse_date_param(request, "start_date")
+        end_date = parse_date_param(request, "end_date")
+        engine = request.query_params.get("engine", settings.ANALYTICS_ENGINE)
+        if engine not in ANALYTICS_ENGINES:
+            raise ValidationError({"engine": f"Must be one of: {', '.join(ANALYTICS_ENGINES)}."})
+        percentiles = self.parse_percentiles(request)
+        if percentiles and engine != "columnar":
+            raise ValidationError({"percentiles": "Only supported with engine=columnar."})
+        return group_by, start_date, end_date, engine, percentiles
+
+    def check_columnar(self, summary, percentiles):
+        # スナップショットがなければ sql で答えるが、百分位数は sql では求められない
+        if summary is None and percentiles:
+            raise ValidationError({"percentiles": "The columnar engine is unavailable on this server."})
+        return summary
+
+    def summary_response(self, summary, engine):
+        response = Response([stringify_decimals(row) for row in summary])
+        response["Analytics-Engine"] = engine
+        return response
+
+    def parse_percentiles(self, request):
+        values = [value.strip() for value in request.query_params.get("percentiles", "").split(",") if value.strip()]
+        try:
+            percentiles = [float(value) for value in values]
+        except ValueError:
+            percentiles = None
+        if percentiles is None or any(not 0 <= percentile <= 100 for percentile in percentiles):
+            raise ValidationError({"percentiles": "Must be comma-separated numbers from 0 to 100."})
+        return list(dict.fromkeys(percentiles))
+
+
+class PriceIndexView(APIView):
+    """
+    API endpoint that returns the monthly chained price index of each category.
+
+    Serves the rows stored by the `compute_price_index` command (see
+    `records.price_index`); the request itself never recomputes them.
+
+    Query parameters:
+        category: comma-separated category ids (default: all categories).
+        start_date / end_date: inclusive range of months (YYYY-MM-DD, any day of the month).
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            category_ids = [
+                int(value) for value in request.query_params.get("category", "").split(",") if value.strip()
+            ]
+        except ValueError:
+            raise ValidationError({"category": "Must be comma-separated category ids."})
+        start_date = parse_date_param(request, "start_date")
+        end_date = parse_date_param(request, "end_date")
+
+        queryset = PriceIndex.objects.order_by("category_id", "month")
+        if category_ids:
+            queryset = queryset.filter(category_id__in=category_ids)
+        if start_date:
+            queryset = queryset.filter(month__gte=start_date.replace(day=1))
+        if end_date:
+            queryset = queryset.filter(month__lte=end_date)
+        rows = list(queryset.values("category_id", "category__name", "month", "index", "change", "matched_products"))
+        for row in rows:
+            # F() で "category" と名付けると外部キーの名前と衝突するため、読んでから付け替える
+            row["category"] = row.pop("category__name")
+        return Response([stringify_decimals(row) for row in rows])
+
+
+class CategoryViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Category instances.
+    GET responses support conditional requests (ETag/Last-Modified).
     """
 
     queryset = Category.objects.all()
@@ -114,9 +336,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class UnitViewSet(viewsets.ModelViewSet):
+class UnitViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Unit instances.
+    GET responses support conditional requests (ETag/Last-Modified).
     """
 
     queryset = Unit.objects.all()
@@ -124,9 +347,10 @@ class UnitViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class ManufacturerViewSet(viewsets.ModelViewSet):
+class ManufacturerViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Manufacturer instances.
+    GET responses support conditional requests (ETag/Last-Modified).
     """
 
     queryset = Manufacturer.objects.all()
@@ -134,9 +358,10 @@ class ManufacturerViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class OriginViewSet(viewsets.ModelViewSet):
+class OriginViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Origin instances.
+    GET responses support conditional requests (ETag/Last-Modified).
     """
 
     queryset = Origin.objects.all()
@@ -144,9 +369,10 @@ class OriginViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class StoreViewSet(viewsets.ModelViewSet):
+class StoreViewSet(ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Store instances.
+    GET responses support conditional requests (ETag/Last-Modified).
     """
 
     queryset = Store.objects.all()
@@ -154,21 +380,197 @@ class StoreViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
 
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing Product instances.
+    Lists are built from `.values()` rows (see FastListMixin) and filtered by `ProductFilter`.
     """
 
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related("category", "unit", "manufacturer", "origin")
     serializer_class = ProductSerializer
     permission_classes = [IsAuthenticated]
-
-
-class ShoppingRecordViewSet(viewsets.ModelViewSet):
+    filter_backends = [ProductFilter]
+    price_history_max_window = 100
+    search_max_limit = 50
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """
+        Returns the best product matches for autocomplete (see `search_products`).
+
+        Query parameters:
+            q: search text, matched against product, manufacturer and category names.
+            limit: number of results (default: 10).
+        """
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        try:
+            limit = int(request.query_params.get("limit", 10))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.search_max_limit:
+            raise ValidationError({"limit": f"Expected an integer from 1 to {self.search_max_limit}."})
+
+        reader = values_reader(self.get_serializer_class())
+        rows = search_products(query).values(*reader.lookups)[:limit]
+        return Response(reader.read(rows))
+
+    @action(detail=True, methods=["get"], url_path="price-history")
+    def price_history(self, request, pk=None):
+        """
+        Returns the unit price (`price / quantity`) history of a product per store.
+
+        Query parameters:
+            bucket: `week` or `month` to downsample into one point per store and bucket.
+            window: number of points in the rolling average/min/max (default: 5).
+            start_date / end_date: inclusive purchase date range (YYYY-MM-DD).
+        """
+        bucket = request.query_params.get("bucket") or None
+        if bucket is not None and bucket not in PRICE_HISTORY_BUCKETS:
+            raise ValidationError({"bucket": f"Expected one of: {', '.join(PRICE_HISTORY_BUCKETS)}."})
+        try:
+            window = int(request.query_params.get("window", 5))
+        except ValueError:
+            window = 0
+        if not 1 <= window <= self.price_history_max_window:
+            raise ValidationError({"window": f"Expected an integer from 1 to {self.price_history_max_window}."})
+
+        product = self.get_object()
+        points = product_price_history(
+            product.id,
+            bucket=bucket,
+            window=window,
+            start_date=parse_date_param(request, "start_date"),
+            end_date=parse_date_param(request, "end_date"),
+        )
+        return Response(
+            {
+                "product_id": product.id,
+                "bucket": bucket,
+                "window": window,
+                "points": [stringify_decimals(point) for point in points],
+            }
+        )
+
+    @action(detail=False, methods=["patch"], url_path="bulk")
+    def bulk_update(self, request):
+        """
+        Applies the same changes to the selected products with a single UPDATE.
+
+        Products are selected with `?ids=` (comma-separated) and/or the list
+        filters; the body holds the fields to change, as for a partial update.
+        Returns {"updated": count}.
+        """
+        products = bulk_selection(request, Product.objects.all(), ProductFilter)
+        changes = bulk_changes(ProductSerializer, request.data)
+        return Response({"updated": bulk_edit.update_products(products, changes)})
+
+    @bulk_update.mapping.delete
+    def bulk_destroy(self, request):
+        """
+        Deletes the selected products (as for `bulk_update`) with a single DELETE.
+
+        Returns {"deleted": count}, or a 409 response listing the `protected`
+        product ids when shopping records still refer to some of them; then
+        nothing is deleted.
+        """
+        products = bulk_selection(request, Product.objects.all(), ProductFilter)
+        deleted, protected = bulk_edit.delete_products(products)
+        if protected:
+            return Response(
+                {"detail": "Some products are referenced by shopping records.", "protected": protected},
+                status=status.HTTP_409_CONFLICT,
+            )
+        return Response({"deleted": deleted})
+
+
+class ShoppingRecordViewSet(ReplicaReadMixin, FastListMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     A viewset for viewing and editing ShoppingRecord instances.
+    Lists are built from `.values()` rows (see FastListMixin).
     """
 
-    queryset = ShoppingRecord.objects.all().order_by("purchase_date")
+    queryset = ShoppingRecord.objects.select_related(
+        "store",
+        "product__category",
+        "product__unit",
+        "product__manufacturer",
+        "product__origin",
+    ).order_by("purchase_date", "id")
     serializer_class = ShoppingRecordSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ShoppingRecordCursorPagination
+    filter_backends = [ShoppingRecordFilter, AllowListOrderingFilter]
+    ordering_fields = ["purchase_date", "price", "quantity", "id"]
+    ordering = ("purchase_date", "id")
+    bulk_max_items = 500
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Streams shopping records as CSV or NDJSON.
+
+        Query parameters:
+            file_type: `csv` (default) or `ndjson`.
+            Filters and `ordering` as for the list (see `ShoppingRecordFilter`).
+        """
+        file_type, queryset = self.export_params(request)
+        lines = (iter_csv if file_type == "csv" else iter_ndjson)(export_rows(queryset))
+        return self.export_response(lines, file_type)
+
+    async def aexport(self, request):
+        # 非同期イテレータで返し、遅いクライアントへの送信中もワーカーを占有しない
+        file_type, queryset = self.export_params(request)
+        lines = (aiter_csv if file_type == "csv" else aiter_ndjson)(aexport_rows(queryset))
+        return self.export_response(lines, file_type)
+
+    def export_params(self, request):
+        file_type = request.query_params.get("file_type", "csv")
+        if file_type not in ("csv", "ndjson"):
+            raise ValidationError({"file_type": "Expected 'csv' or 'ndjson'."})
+        return file_type, self.filter_queryset(ShoppingRecord.objects.order_by(*self.ordering))
+
+    def export_response(self, lines, file_type):
+        content_type = "text/csv" if file_type == "csv" else "application/x-ndjson"
+        response = StreamingHttpResponse(lines, content_type=f"{content_type}; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="shopping-records.{file_type}"'
+        return response
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request):
+        """
+        Creates a list of shopping records (e.g. one receipt) in a single transaction.
+
+        Either every item is created, or a 400 response lists the errors for
+        each item in request order (an empty object for valid items).
+        """
+        serializer = ShoppingRecordBulkItemSerializer(
+            data=request.data, many=True, allow_empty=False, max_length=self.bulk_max_items
+        )
+        serializer.is_valid(raise_exception=True)
+        records = serializer.save()
+        return Response(ShoppingRecordSerializer(records, many=True).data, status=status.HTTP_201_CREATED)
+
+    @bulk.mapping.patch
+    def bulk_update(self, request):
+        """
+        Applies the same changes to the selected shopping records with a single UPDATE.
+
+        Records are selected with `?ids=` (comma-separated) and/or the list
+        filters (see `ShoppingRecordFilter`); the body holds the fields to
+        change, as for a partial update. Returns {"updated": count}.
+        """
+        records = bulk_selection(request, ShoppingRecord.objects.all(), ShoppingRecordFilter)
+        changes = bulk_changes(ShoppingRecordSerializer, request.data)
+        return Response({"updated": bulk_edit.update_records(records, changes)})
+
+    @bulk.mapping.delete
+    def bulk_destroy(self, request):
+        """
+        Deletes the selected shopping records (as for `bulk_update`) with a single DELETE.
+
+        Returns {"deleted": count}.
+        """
+        records = bulk_selection(request, ShoppingRecord.objects.all(), ShoppingRecordFilter)
+        return Response({"deleted": bulk_edit.delete_records(records)})
@@ -49,6 +49,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the rest of the middleware
+    "records.middleware.PerformanceMiddleware",
+    # Before anything that reads or writes the response body
+    "records.middleware.CompressionMiddleware",
+    "records.middleware.ReplicaRoutingMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -79,11 +84,33 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "shoptrack.wsgi.application"
 
+# "wsgi" or "asgi"; selects the server in entrypoint.sh
+SERVER_MODE = os.environ.get("SERVER_MODE", "wsgi")
+
 
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 # https://pypi.org/project/dj-database-url/
 
+# Pool PostgreSQL connections per worker process (psycopg_pool); connections are checked out
+# for each request and health-checked on checkout.
+DATABASE_POOL = os.environ.get("DATABASE_POOL", "True").lower() == "true"
+
+
+def database_pool_options(environ):
+    """
+    Returns the psycopg_pool.ConnectionPool options set by DATABASE_POOL_* variables in `environ`.
+    """
+    return {
+        "min_size": int(environ.get("DATABASE_POOL_MIN_SIZE", "1")),
+        "max_size": int(environ.get("DATABASE_POOL_MAX_SIZE", "10")),
+        # Seconds to wait for a free connection; kept below Gunicorn's 30 second worker timeout
+        "timeout": float(environ.get("DATABASE_POOL_TIMEOUT", "10")),
+        "max_idle": float(environ.get("DATABASE_POOL_MAX_IDLE", "300")),
+        "max_lifetime": float(environ.get("DATABASE_POOL_MAX_LIFETIME", "3600")),
+    }
+
+
 if DEBUG:
     DATABASES = {
         "default": {
@@ -91,14 +118,47 @@ if DEBUG:
             "NAME": BASE_DIR / "db.sqlite3",
         }
     }
+    # Optional PostgreSQL database for development, e.g. to run the PostgreSQL-only tests (COPY import)
+    if os.environ.get("DEV_DATABASE_URL"):
+        DATABASES["default"] = dj_database_url.parse(os.environ["DEV_DATABASE_URL"])
+    # SQLite builds covering indexes without their INCLUDE columns, which is fine for development.
+    SILENCED_SYSTEM_CHECKS = ["models.W040"]
 else:
     DATABASES = {
         "default": dj_database_url.config(
             default=os.environ.get("DATABASE_URL"),
-            conn_max_age=600,
+            # Pooled connections go back to the pool after each request. Without a pool, persistent
+            # connections are kept per thread; under ASGI sync code runs in per-request threads,
+            # so connections would pile up instead of being reused.
+            conn_max_age=0 if DATABASE_POOL or SERVER_MODE == "asgi" else 600,
+            conn_health_checks=True,
             ssl_require=True,
         )
     }
+    if DATABASE_POOL:
+        DATABASES["default"].setdefault("OPTIONS", {})["pool"] = database_pool_options(os.environ)
+
+# Optional read replica. Safe-method reads of the records API go to it (see records.routers).
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+if DATABASE_REPLICA_URL:
+    DATABASES["replica"] = dj_database_url.parse(
+        DATABASE_REPLICA_URL,
+        conn_max_age=DATABASES["default"].get("CONN_MAX_AGE", 0),
+        conn_health_checks=True,
+        ssl_require=not DEBUG,
+    )
+    if DATABASE_POOL and not DEBUG:
+        DATABASES["replica"].setdefault("OPTIONS", {})["pool"] = database_pool_options(os.environ)
+elif DEBUG:
+    # Nothing is routed here unless REPLICA_DATABASE is set; the tests use it as a second SQLite database.
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db-replica.sqlite3",
+    }
+REPLICA_DATABASE = "replica" if DATABASE_REPLICA_URL else None
+# Seconds a client that wrote keeps reading from the primary, covering the replication lag
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+DATABASE_ROUTERS = ["records.routers.ReplicaRouter"]
 
 
 # Password validation
@@ -147,7 +207,50 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
-    "DEFAULT_AUTHENTICATION_CLASSES": ("rest_framework_simplejwt.authentication.JWTAuthentication",),
+    "DEFAULT_AUTHENTICATION_CLASSES": ("records.authentication.CachedJWTAuthentication",),
+    "DEFAULT_PAGINATION_CLASS": "records.pagination.DefaultCursorPagination",
+    "DEFAULT_RENDERER_CLASSES": (
+        "records.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ),
+    "DEFAULT_PARSER_CLASSES": (
+        "records.renderers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ),
+}
+
+# Per-worker cache of reference rows used for related-field validation (see records/reference_cache.py)
+REFERENCE_CACHE_TTL = int(os.environ.get("REFERENCE_CACHE_TTL", "60"))
+REFERENCE_CACHE_MAX_SIZE = int(os.environ.get("REFERENCE_CACHE_MAX_SIZE", "10000"))
+# Per-worker cache of users for JWT authentication; bounds how long other workers accept a deactivated user
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", "10"))
+
+# Request instrumentation (see records/middleware.py). Latency histograms cover every request;
+# this fraction of requests also records query counts, DB/render time and a Server-Timing header.
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get("PERFORMANCE_SAMPLE_RATE", "0.1"))
+# Bearer token for /api/metrics/; without it the endpoint is only served with DEBUG
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+# API responses of at least this many bytes are gzip/brotli compressed (see records/middleware.py)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+# Spend analytics engine: "sql" (rollup tables) or "columnar" (per-worker in-memory snapshot, see records/columnar.py).
+# Requests can pick one with ?engine=.
+ANALYTICS_ENGINE = os.environ.get("ANALYTICS_ENGINE", "sql")
+# Memory budget of the columnar snapshot per worker; above it analytics fall back to SQL
+ANALYTICS_SNAPSHOT_MAX_BYTES = int(os.environ.get("ANALYTICS_SNAPSHOT_MAX_BYTES", str(64 * 1024 * 1024)))
+# Seconds after which the snapshot is reloaded in full (it is otherwise refreshed incrementally)
+ANALYTICS_SNAPSHOT_MAX_AGE = int(os.environ.get("ANALYTICS_SNAPSHOT_MAX_AGE", "300"))
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {
+        "console": {"class": "logging.StreamHandler"},
+    },
+    "loggers": {
+        "records.performance": {"handlers": ["console"], "level": "INFO", "propagate": False},
+    },
 }
 
 # drf-spectacular setings
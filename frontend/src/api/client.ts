@@ -117,14 +117,32 @@ export const fetchUserProfile = async (): Promise<User> => {
     return response.data;
 };
 
+// --- ページネーション ---
+export interface CursorPage<T> {
+    next: string | null;
+    previous: string | null;
+    results: T[];
+}
+
+/** カーソルページネーションの next を辿って全件を取得する (件数の少ないマスタデータ用。購買記録は1ページずつ取得する) */
+const fetchAllPages = async <T>(url: string): Promise<T[]> => {
+    const results: T[] = [];
+    let nextUrl: string | null = url;
+    while (nextUrl) {
+        const response: { data: CursorPage<T> } = await axiosInstance.get<CursorPage<T>>(nextUrl);
+        results.push(...response.data.results);
+        nextUrl = response.data.next;
+    }
+    return results;
+};
+
 // === Category ===
 export interface Category { id: number; name: string; }
 export interface CategoryInput { name: string; }
 export type PatchedCategoryInput = Partial<CategoryInput>;
 
 export const getCategories = async (): Promise<Category[]> => {
-    const response = await axiosInstance.get<Category[]>('/api/categories/');
-    return response.data;
+    return fetchAllPages<Category>('/api/categories/');
 };
 export const getCategoryById = async (id: number): Promise<Category> => {
     const response = await axiosInstance.get<Category>(`/api/categories/${id}/`);
@@ -148,8 +166,7 @@ export interface UnitInput { name: string; }
 export type PatchedUnitInput = Partial<UnitInput>;
 
 export const getUnits = async (): Promise<Unit[]> => {
-    const response = await axiosInstance.get<Unit[]>('/api/units/');
-    return response.data;
+    return fetchAllPages<Unit>('/api/units/');
 };
 export const getUnitById = async (id: number): Promise<Unit> => {
     const response = await axiosInstance.get<Unit>(`/api/units/${id}/`);
@@ -173,8 +190,7 @@ export interface ManufacturerInput { name: string; }
 export type PatchedManufacturerInput = Partial<ManufacturerInput>;
 
 export const getManufacturers = async (): Promise<Manufacturer[]> => {
-    const response = await axiosInstance.get<Manufacturer[]>('/api/manufacturers/');
-    return response.data;
+    return fetchAllPages<Manufacturer>('/api/manufacturers/');
 };
 export const getManufacturerById = async (id: number): Promise<Manufacturer> => {
     const response = await axiosInstance.get<Manufacturer>(`/api/manufacturers/${id}/`);
@@ -198,8 +214,7 @@ export interface OriginInput { name: string; }
 export type PatchedOriginInput = Partial<OriginInput>;
 
 export const getOrigins = async (): Promise<Origin[]> => {
-    const response = await axiosInstance.get<Origin[]>('/api/origins/');
-    return response.data;
+    return fetchAllPages<Origin>('/api/origins/');
 };
 export const getOriginById = async (id: number): Promise<Origin> => {
     const response = await axiosInstance.get<Origin>(`/api/origins/${id}/`);
@@ -223,8 +238,7 @@ export interface StoreInput { name: string; location: string; }
 export type PatchedStoreInput = Partial<StoreInput>;
 
 export const getStores = async (): Promise<Store[]> => {
-    const response = await axiosInstance.get<Store[]>('/api/stores/');
-    return response.data;
+    return fetchAllPages<Store>('/api/stores/');
 };
 export const getStoreById = async (id: number): Promise<Store> => {
     const response = await axiosInstance.get<Store>(`/api/stores/${id}/`);
@@ -251,6 +265,11 @@ export interface Product {
     manufacturer: Manufacturer | null;
     origin: Origin | null;
 }
+/** 商品名・メーカー名・カテゴリー名で検索し、上位 limit 件を取得する (オートコンプリート用) */
+export const searchProducts = async (q: string, limit = 10): Promise<Product[]> => {
+    const response = await axiosInstance.get<Product[]>('/api/products/search/', { params: { q, limit } });
+    return response.data;
+};
 export interface ProductInput {
     name: string;
     category_id: number;
@@ -261,8 +280,7 @@ export interface ProductInput {
 export type PatchedProductInput = Partial<ProductInput>;
 
 export const getProducts = async (): Promise<Product[]> => {
-    const response = await axiosInstance.get<Product[]>('/api/products/');
-    return response.data;
+    return fetchAllPages<Product>('/api/products/');
 };
 export const getProductById = async (id: number): Promise<Product> => {
     const response = await axiosInstance.get<Product>(`/api/products/${id}/`);
@@ -280,6 +298,42 @@ export const deleteProduct = async (id: number): Promise<void> => {
     await axiosInstance.delete(`/api/products/${id}/`);
 };
 
+export interface PriceHistoryPoint {
+    store_id: number;
+    store: string;
+    date: string;
+    unit_price: string;
+    rolling_avg: string;
+    rolling_min: string;
+    rolling_max: string;
+    // bucket 指定なしの場合のみ
+    id?: number;
+    price?: number;
+    quantity?: string;
+    // bucket 指定ありの場合のみ
+    min_unit_price?: string;
+    max_unit_price?: string;
+    count?: number;
+}
+export interface PriceHistory {
+    product_id: number;
+    bucket: 'week' | 'month' | null;
+    window: number;
+    points: PriceHistoryPoint[];
+}
+export interface PriceHistoryParams {
+    bucket?: 'week' | 'month';
+    window?: number;
+    start_date?: string;
+    end_date?: string;
+}
+
+/** 商品の単価推移 (店舗別・移動平均付き) を取得する */
+export const getProductPriceHistory = async (id: number, params: PriceHistoryParams = {}): Promise<PriceHistory> => {
+    const response = await axiosInstance.get<PriceHistory>(`/api/products/${id}/price-history/`, { params });
+    return response.data;
+};
+
 // === ShoppingRecord ===
 export interface ShoppingRecord {
     id: number;
@@ -298,8 +352,42 @@ export interface ShoppingRecordInput {
 }
 export type PatchedShoppingRecordInput = Partial<ShoppingRecordInput>;
 
-export const getShoppingRecords = async (): Promise<ShoppingRecord[]> => {
-    const response = await axiosInstance.get<ShoppingRecord[]>('/api/shopping-records/');
+export type ShoppingRecordOrdering = 'purchase_date' | 'price' | 'quantity' | 'id';
+export interface ShoppingRecordFilters {
+    start_date?: string;
+    end_date?: string;
+    store?: number[];
+    product?: number[];
+    category?: number[];
+    manufacturer?: number[];
+    min_price?: number;
+    max_price?: number;
+    ordering?: ShoppingRecordOrdering | `-${ShoppingRecordOrdering}`;
+    page_size?: number;
+}
+
+/**
+ * 購買記録を1ページ分取得する (cursor は前回レスポンスの next/previous)
+ * 絞り込みはサーバー側で行う。next/previous にはフィルタ条件が含まれるので、2ページ目以降は cursor だけを渡す
+ */
+export const getShoppingRecordsPage = async (
+    cursor?: string | null,
+    filters: ShoppingRecordFilters = {},
+): Promise<CursorPage<ShoppingRecord>> => {
+    if (cursor) {
+        const response = await axiosInstance.get<CursorPage<ShoppingRecord>>(cursor);
+        return response.data;
+    }
+    const { store, product, category, manufacturer, ...rest } = filters;
+    const response = await axiosInstance.get<CursorPage<ShoppingRecord>>('/api/shopping-records/', {
+        params: {
+            ...rest,
+            store: store?.join(','),
+            product: product?.join(','),
+            category: category?.join(','),
+            manufacturer: manufacturer?.join(','),
+        },
+    });
     return response.data;
 };
 export const getShoppingRecordById = async (id: number): Promise<ShoppingRecord> => {
@@ -310,6 +398,11 @@ export const createShoppingRecord = async (data: ShoppingRecordInput): Promise<S
     const response = await axiosInstance.post<ShoppingRecord>('/api/shopping-records/', data);
     return response.data;
 };
+/** レシート1枚分の購買記録をまとめて登録する (1リクエスト・1トランザクション) */
+export const createShoppingRecordsBulk = async (data: ShoppingRecordInput[]): Promise<ShoppingRecord[]> => {
+    const response = await axiosInstance.post<ShoppingRecord[]>('/api/shopping-records/bulk/', data);
+    return response.data;
+};
 export const updateShoppingRecord = async (id: number, data: PatchedShoppingRecordInput): Promise<ShoppingRecord> => {
     const response = await axiosInstance.patch<ShoppingRecord>(`/api/shopping-records/${id}/`, data);
     return response.data;
@@ -317,3 +410,32 @@ export const updateShoppingRecord = async (id: number, data: PatchedShoppingReco
 export const deleteShoppingRecord = async (id: number): Promise<void> => {
     await axiosInstance.delete(`/api/shopping-records/${id}/`);
 };
+
+// === Analytics ===
+export type SpendGroupBy = 'month' | 'category' | 'store' | 'manufacturer';
+export interface SpendSummaryRow {
+    month?: string;
+    category_id?: number;
+    category?: string;
+    store_id?: number;
+    store?: string;
+    manufacturer_id?: number | null;
+    manufacturer?: string | null;
+    total_price: number;
+    total_quantity: string;
+    count: number;
+    avg_unit_price: string | null;
+}
+export interface SpendSummaryParams {
+    group_by?: SpendGroupBy[];
+    start_date?: string;
+    end_date?: string;
+}
+
+/** 集計はDB側で行い、グループごとの合計のみを取得する */
+export const getSpendSummary = async (params: SpendSummaryParams = {}): Promise<SpendSummaryRow[]> => {
+    const response = await axiosInstance.get<SpendSummaryRow[]>('/api/analytics/spend/', {
+        params: { ...params, group_by: params.group_by?.join(',') },
+    });
+    return response.data;
+};
@@ -1,7 +1,8 @@
 import React, { useState, useEffect } from 'react';
+import { useQuery, keepPreviousData } from '@tanstack/react-query';
 import {
     ShoppingRecord, PatchedShoppingRecordInput,
-    Product, Store
+    Product, Store, searchProducts
 } from '../api/client';
 
 // --- Material UI ---
@@ -17,11 +18,13 @@ import Select, { SelectChangeEvent } from '@mui/material/Select';
 import MenuItem from '@mui/material/MenuItem';
 import Typography from '@mui/material/Typography'; // For endAdornment
 import FormHelperText from '@mui/material/FormHelperText';
+import Autocomplete from '@mui/material/Autocomplete';
+
+const SEARCH_DEBOUNCE_MS = 250;
 
 // --- Props の型定義 ---
 interface ShoppingRecordFormProps {
     initialData?: ShoppingRecord;
-    products?: Product[];
     stores?: Store[];
     isLoadingDropdowns?: boolean;
     onSubmit: (data: PatchedShoppingRecordInput) => void;
@@ -32,7 +35,6 @@ interface ShoppingRecordFormProps {
 
 const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
     initialData,
-    products,
     stores,
     isLoadingDropdowns = false,
     onSubmit,
@@ -41,7 +43,9 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
     submitError,
 }) => {
     // --- フォームの内部状態 ---
-    const [productId, setProductId] = useState<number | ''>('');
+    const [product, setProduct] = useState<Product | null>(null);
+    const [productQuery, setProductQuery] = useState<string>('');
+    const [debouncedQuery, setDebouncedQuery] = useState<string>('');
     const [storeId, setStoreId] = useState<number | ''>('');
     const [purchaseDate, setPurchaseDate] = useState<string>('');
     const [price, setPrice] = useState<number | ''>('');
@@ -51,14 +55,14 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
     // --- 初期値の設定 ---
     useEffect(() => {
         if (initialData) {
-            setProductId(initialData.product?.id ?? '');
+            setProduct(initialData.product ?? null);
             setStoreId(initialData.store?.id ?? '');
             setPurchaseDate(initialData.purchase_date ?? '');
             setPrice(initialData.price ?? '');
             setQuantity(initialData.quantity ?? '');
         } else {
             // 作成モード時はリセット
-            setProductId('');
+            setProduct(null);
             setStoreId('');
             setPurchaseDate('');
             setPrice('');
@@ -66,6 +70,19 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
         }
     }, [initialData]);
 
+    // --- 商品検索 (入力が止まってからサーバー側で検索する) ---
+    useEffect(() => {
+        const timer = setTimeout(() => setDebouncedQuery(productQuery.trim()), SEARCH_DEBOUNCE_MS);
+        return () => clearTimeout(timer);
+    }, [productQuery]);
+    const { data: productOptions, isFetching: isSearchingProducts } = useQuery<Product[], Error>({
+        queryKey: ['productSearch', debouncedQuery],
+        queryFn: () => searchProducts(debouncedQuery),
+        enabled: debouncedQuery.length > 0,
+        placeholderData: keepPreviousData,
+        staleTime: 60 * 1000,
+    });
+
     // --- Select 変更ハンドラ ---
     const handleSelectChange = (event: SelectChangeEvent<number | ''>, setter: React.Dispatch<React.SetStateAction<number | ''>>) => {
         setter(event.target.value as (number | ''));
@@ -75,7 +92,7 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
     const handleSubmit = (event: React.FormEvent<HTMLFormElement>) => {
         event.preventDefault();
         setFormError(null);
-        if (!productId || !storeId || !purchaseDate || price === '' || !quantity) {
+        if (!product || !storeId || !purchaseDate || price === '' || !quantity) {
             setFormError('All fields are required (price can be 0).');
             return;
         }
@@ -89,7 +106,7 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
         }
 
         const recordData: PatchedShoppingRecordInput = {
-            product_id: Number(productId),
+            product_id: product.id,
             store_id: Number(storeId),
             purchase_date: purchaseDate,
             price: Number(price),
@@ -99,29 +116,35 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
     };
 
     const disableFormElements = isSubmitting || isLoadingDropdowns;
-    const selectedProduct = products?.find(p => p.id === productId);
 
     // --- JSX ---
     return (
         <Box component="form" onSubmit={handleSubmit} noValidate sx={{ mt: 1 }}>
             <Stack spacing={2}>
-                {/* Product Select */}
-                <FormControl fullWidth margin="normal" required disabled={disableFormElements} error={!!formError && !productId}>
-                    <InputLabel id="product-select-label">Product</InputLabel>
-                    <Select
-                        labelId="product-select-label" id="product-select"
-                        value={productId} label="Product"
-                        onChange={(e) => handleSelectChange(e as SelectChangeEvent<number | ''>, setProductId)}
-                    >
-                        <MenuItem value=""><em>Select Product...</em></MenuItem>
-                        {products?.map(product => (
-                            <MenuItem key={product.id} value={product.id}>
-                                {product.name} {product.unit ? `(${product.unit.name})` : ''}
-                            </MenuItem>
-                        ))}
-                    </Select>
-                    {(!!formError && !productId) && <FormHelperText>Product is required</FormHelperText>}
-                </FormControl>
+                {/* Product Autocomplete */}
+                <Autocomplete
+                    id="product-autocomplete"
+                    value={product}
+                    onChange={(_, value) => setProduct(value)}
+                    inputValue={productQuery}
+                    onInputChange={(_, value) => setProductQuery(value)}
+                    options={debouncedQuery ? productOptions ?? [] : []}
+                    // 絞り込みはサーバー側で行うので、クライアント側のフィルタは無効にする
+                    filterOptions={(options) => options}
+                    getOptionLabel={(option) => `${option.name}${option.unit ? ` (${option.unit.name})` : ''}`}
+                    isOptionEqualToValue={(option, value) => option.id === value.id}
+                    loading={isSearchingProducts}
+                    noOptionsText={debouncedQuery ? 'No matching products' : 'Type to search products'}
+                    disabled={disableFormElements}
+                    renderInput={(params) => (
+                        <TextField
+                            {...params}
+                            label="Product" margin="normal" required
+                            error={!!formError && !product}
+                            helperText={(!!formError && !product) ? "Product is required" : ""}
+                        />
+                    )}
+                />
 
                 {/* Store Select */}
                 <FormControl fullWidth margin="normal" required disabled={disableFormElements} error={!!formError && !storeId}>
@@ -169,7 +192,7 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
                     id="quantity" label="Quantity" type="number"
                     slotProps={{
                         input: {
-                            endAdornment: <Typography variant="caption" sx={{ ml: 0.5 }}>{selectedProduct?.unit?.name ?? ''}</Typography>,
+                            endAdornment: <Typography variant="caption" sx={{ ml: 0.5 }}>{product?.unit?.name ?? ''}</Typography>,
                             inputProps: { min: 0, step: "any" }
                         }
                     }}
@@ -180,7 +203,7 @@ const ShoppingRecordForm: React.FC<ShoppingRecordFormProps> = ({
                 />
 
                 {submitError && ( <Alert severity="error" sx={{ mt: 1 }}>{submitError}</Alert> )}
-                {formError && (productId && storeId && purchaseDate && price !== '' && quantity) && <Alert severity="error" sx={{ mt: 1 }}>{formError}</Alert>}
+                {formError && (product && storeId && purchaseDate && price !== '' && quantity) && <Alert severity="error" sx={{ mt: 1 }}>{formError}</Alert>}
 
                 <Box sx={{ display: 'flex', justifyContent: 'flex-end', gap: 1, mt: 2 }}>
                     <Button variant="outlined" onClick={onCancel} disabled={isSubmitting}>
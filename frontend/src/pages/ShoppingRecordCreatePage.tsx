@@ -2,9 +2,7 @@ import React from 'react';
 import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { useNavigate } from 'react-router';
 import {
-    Product,
     Store,
-    getProducts,
     getStores,
     createShoppingRecord,
     PatchedShoppingRecordInput
@@ -22,11 +20,7 @@ const ShoppingRecordCreatePage: React.FC = () => {
     const navigate = useNavigate();
     const queryClient = useQueryClient();
 
-    // --- データ取得 (ドロップダウン用) ---
-    const { data: products, isLoading: isLoadingProducts } = useQuery<Product[], Error>({
-        queryKey: ['products'],
-        queryFn: getProducts,
-    });
+    // --- データ取得 (店舗ドロップダウン用、商品はフォーム内で検索する) ---
     const { data: stores, isLoading: isLoadingStores } = useQuery<Store[], Error>({
         queryKey: ['stores'],
         queryFn: getStores,
@@ -57,7 +51,7 @@ const ShoppingRecordCreatePage: React.FC = () => {
     };
 
     // ローディングチェック
-    const isLoadingDropdowns = isLoadingProducts || isLoadingStores;
+    const isLoadingDropdowns = isLoadingStores;
     if (isLoadingDropdowns) {
         return (
             <Container maxWidth="sm" sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
@@ -72,7 +66,6 @@ const ShoppingRecordCreatePage: React.FC = () => {
                 Add New Shopping Record
             </Typography>
             <ShoppingRecordForm
-                products={products}
                 stores={stores}
                 isLoadingDropdowns={isLoadingDropdowns}
                 onSubmit={handleFormSubmit}
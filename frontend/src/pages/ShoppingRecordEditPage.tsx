@@ -3,12 +3,10 @@ import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
 import { useNavigate, useParams } from 'react-router';
 import {
     ShoppingRecord,
-    Product,
     Store,
     PatchedShoppingRecordInput,
     getShoppingRecordById,
     updateShoppingRecord,
-    getProducts,
     getStores,
 } from '../api/client';
 import ShoppingRecordForm from '../components/ShoppingRecordForm';
@@ -34,11 +32,7 @@ const ShoppingRecordEditPage: React.FC = () => {
         enabled: !!recordId && !isNaN(recordId),
     });
 
-    // 2. ドロップダウン用の商品・店舗リストを取得
-    const { data: products, isLoading: isLoadingProducts } = useQuery<Product[], Error>({
-        queryKey: ['products'],
-        queryFn: getProducts,
-    });
+    // 2. ドロップダウン用の店舗リストを取得 (商品はフォーム内で検索する)
     const { data: stores, isLoading: isLoadingStores } = useQuery<Store[], Error>({
         queryKey: ['stores'],
         queryFn: getStores,
@@ -65,7 +59,7 @@ const ShoppingRecordEditPage: React.FC = () => {
     };
 
     // --- ローディング / エラー表示 ---
-    const isLoadingAllData = isLoadingRecord || isLoadingProducts || isLoadingStores;
+    const isLoadingAllData = isLoadingRecord || isLoadingStores;
     if (isLoadingAllData) {
         return (
             <Container maxWidth="sm" sx={{ display: 'flex', justifyContent: 'center', mt: 4 }}>
@@ -96,9 +90,8 @@ const ShoppingRecordEditPage: React.FC = () => {
             </Typography>
             <ShoppingRecordForm
                 initialData={recordData}
-                products={products}
                 stores={stores}
-                isLoadingDropdowns={isLoadingProducts || isLoadingStores}
+                isLoadingDropdowns={isLoadingStores}
                 onSubmit={handleFormSubmit}
                 onCancel={handleCancel}
                 isSubmitting={isPending}
@@ -1,7 +1,10 @@
-import React, { useState, useMemo } from 'react';
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import React, { useState, useEffect } from 'react';
+import { useQuery, useMutation, useQueryClient, keepPreviousData } from '@tanstack/react-query';
 import { Link } from 'react-router';
-import { getShoppingRecords, deleteShoppingRecord, ShoppingRecord } from '../api/client';
+import {
+    getShoppingRecordsPage, deleteShoppingRecord, getStores, getCategories, searchProducts,
+    Category, CursorPage, Product, ShoppingRecord, ShoppingRecordFilters, Store,
+} from '../api/client';
 import ConfirmationDialog from '../components/ConfirmationDialog';
 
 // --- Material UI ---
@@ -21,21 +24,27 @@ import Box from '@mui/material/Box';
 import IconButton from '@mui/material/IconButton';
 import EditIcon from '@mui/icons-material/Edit';
 import DeleteIcon from '@mui/icons-material/Delete';
-import TablePagination from '@mui/material/TablePagination';
+import MenuItem from '@mui/material/MenuItem';
 import TextField from '@mui/material/TextField';
 import Stack from '@mui/material/Stack';
 import Grid from '@mui/material/Grid';
+import Autocomplete from '@mui/material/Autocomplete';
+
+const SEARCH_DEBOUNCE_MS = 250;
 
 const ShoppingRecordListPage: React.FC = () => {
     const queryClient = useQueryClient();
 
-    // --- ページネーション用の State ---
-    const [page, setPage] = useState(0);
-    const [rowsPerPage, setRowsPerPage] = useState(10);
+    // --- ページネーション用の State (cursor は表示中ページの URL。null は先頭ページ) ---
+    const [cursor, setCursor] = useState<string | null>(null);
+    const [rowsPerPage, setRowsPerPage] = useState(50);
 
-    // --- フィルタリング用 State ---
-    const [filterProductName, setFilterProductName] = useState('');
-    const [filterStoreName, setFilterStoreName] = useState('');
+    // --- フィルタリング用 State (絞り込みはサーバー側で行う) ---
+    const [filterProduct, setFilterProduct] = useState<Product | null>(null);
+    const [productQuery, setProductQuery] = useState('');
+    const [debouncedQuery, setDebouncedQuery] = useState('');
+    const [filterStoreId, setFilterStoreId] = useState<number | ''>('');
+    const [filterCategoryId, setFilterCategoryId] = useState<number | ''>('');
     const [filterStartDate, setFilterStartDate] = useState('');
     const [filterEndDate, setFilterEndDate] = useState('');
 
@@ -43,12 +52,37 @@ const ShoppingRecordListPage: React.FC = () => {
     const [dialogOpen, setDialogOpen] = useState(false);
     const [recordToDelete, setRecordToDelete] = useState<ShoppingRecord | null>(null);
 
-    // 購買記録一覧データを取得
-    const { data: records, isLoading, isError, error } = useQuery<ShoppingRecord[], Error>({
-        queryKey: ['shoppingRecords'],
-        queryFn: getShoppingRecords,
+    // フィルタの選択肢
+    const { data: stores } = useQuery<Store[], Error>({ queryKey: ['stores'], queryFn: getStores });
+    const { data: categories } = useQuery<Category[], Error>({ queryKey: ['categories'], queryFn: getCategories });
+    useEffect(() => {
+        const timer = setTimeout(() => setDebouncedQuery(productQuery.trim()), SEARCH_DEBOUNCE_MS);
+        return () => clearTimeout(timer);
+    }, [productQuery]);
+    const { data: productOptions, isFetching: isSearchingProducts } = useQuery<Product[], Error>({
+        queryKey: ['productSearch', debouncedQuery],
+        queryFn: () => searchProducts(debouncedQuery),
+        enabled: debouncedQuery.length > 0,
+        placeholderData: keepPreviousData,
+        staleTime: 60 * 1000,
     });
 
+    // 購買記録を1ページ分ずつ、サーバー側で絞り込んで取得 (全件は取得しない)
+    const filters: ShoppingRecordFilters = {
+        page_size: rowsPerPage,
+        product: filterProduct ? [filterProduct.id] : undefined,
+        store: filterStoreId ? [filterStoreId] : undefined,
+        category: filterCategoryId ? [filterCategoryId] : undefined,
+        start_date: filterStartDate || undefined,
+        end_date: filterEndDate || undefined,
+    };
+    const { data, isLoading, isError, error, isFetching } = useQuery<CursorPage<ShoppingRecord>, Error>({
+        queryKey: ['shoppingRecords', filters, cursor],
+        queryFn: () => getShoppingRecordsPage(cursor, filters),
+        placeholderData: keepPreviousData,
+    });
+    const records = data?.results;
+
     // 削除処理 (useMutation)
     const { mutate, isPending: isDeleting } = useMutation({
         mutationFn: deleteShoppingRecord,
@@ -64,30 +98,6 @@ const ShoppingRecordListPage: React.FC = () => {
         },
     });
 
-    // --- フィルタリングされた購買記録リスト (useMemoで計算) ---
-    const filteredRecords = useMemo(() => {
-        if (!records) return [];
-        return records.filter(record => {
-            const productNameMatch = filterProductName
-                ? record.product?.name.toLowerCase().includes(filterProductName.toLowerCase())
-                : true;
-            const storeNameMatch = filterStoreName
-                ? record.store?.name.toLowerCase().includes(filterStoreName.toLowerCase())
-                : true;
-
-            // Purchase Dateの範囲フィルタリング
-            let dateMatch = true;
-            if (filterStartDate && record.purchase_date < filterStartDate) {
-                dateMatch = false;
-            }
-            if (filterEndDate && record.purchase_date > filterEndDate) {
-                dateMatch = false;
-            }
-
-            return productNameMatch && storeNameMatch && dateMatch;
-        });
-    }, [records, filterProductName, filterStoreName, filterStartDate, filterEndDate]);
-
     // --- 削除ボタンクリック時の処理を変更 ---
     const handleDeleteClick = (record: ShoppingRecord) => {
         setRecordToDelete(record);
@@ -108,26 +118,32 @@ const ShoppingRecordListPage: React.FC = () => {
     };
 
     // --- ページネーション用のハンドラ関数 ---
-    const handleChangePage = (_event: unknown, newPage: number) => {
-        setPage(newPage);
-    };
-
     const handleChangeRowsPerPage = (event: React.ChangeEvent<HTMLInputElement | HTMLTextAreaElement>) => {
         setRowsPerPage(parseInt(event.target.value, 10));
-        setPage(0); // 表示行数を変更したら最初のページに戻る
+        setCursor(null); // 表示行数を変更したら最初のページに戻る
     };
 
-    // --- フィルター入力変更ハンドラ ---
+    // --- フィルター入力変更ハンドラ (条件が変わったら最初のページに戻る) ---
     const createFilterHandleChange = (setter: React.Dispatch<React.SetStateAction<string>>) => {
         return (event: React.ChangeEvent<HTMLInputElement>) => {
             setter(event.target.value);
-            setPage(0);
+            setCursor(null);
         }
     };
-    const handleFilterProductNameChange = createFilterHandleChange(setFilterProductName);
-    const handleFilterStoreNameChange = createFilterHandleChange(setFilterStoreName);
+    const createIdFilterHandleChange = (setter: React.Dispatch<React.SetStateAction<number | ''>>) => {
+        return (event: React.ChangeEvent<HTMLInputElement>) => {
+            setter(event.target.value === '' ? '' : Number(event.target.value));
+            setCursor(null);
+        }
+    };
+    const handleFilterStoreChange = createIdFilterHandleChange(setFilterStoreId);
+    const handleFilterCategoryChange = createIdFilterHandleChange(setFilterCategoryId);
     const handleFilterStartDateChange = createFilterHandleChange(setFilterStartDate);
     const handleFilterEndDateChange = createFilterHandleChange(setFilterEndDate);
+    const handleFilterProductChange = (_event: unknown, value: Product | null) => {
+        setFilterProduct(value);
+        setCursor(null);
+    };
 
     if (isLoading) {
         return (
@@ -146,14 +162,6 @@ const ShoppingRecordListPage: React.FC = () => {
         );
     }
 
-    // 表示する購買記録データをスライス
-    const paginatedRecords = filteredRecords
-        ? (rowsPerPage === -1
-            ? filteredRecords
-            : filteredRecords.slice(page * rowsPerPage, page * rowsPerPage + rowsPerPage)
-        )
-        : [];
-
     return (
         <Container maxWidth="lg" sx={{ mt: 2 }}>
             <Typography variant="h4" component="h1" gutterBottom>
@@ -161,16 +169,49 @@ const ShoppingRecordListPage: React.FC = () => {
             </Typography>
             <Box sx={{ display: 'flex', justifyContent: 'space-between', alignItems: 'flex-start', mb: 2, gap: 2 }}>
                 <Stack spacing={1} sx={{ width: 'calc(100% - 220px)'}}>
-                    <TextField
-                        label="Filter by Product Name"
-                        variant="outlined" size="small" fullWidth
-                        value={filterProductName} onChange={handleFilterProductNameChange}
-                    />
-                    <TextField
-                        label="Filter by Store Name"
-                        variant="outlined" size="small" fullWidth
-                        value={filterStoreName} onChange={handleFilterStoreNameChange}
+                    <Autocomplete
+                        value={filterProduct}
+                        onChange={handleFilterProductChange}
+                        inputValue={productQuery}
+                        onInputChange={(_, value) => setProductQuery(value)}
+                        options={debouncedQuery ? productOptions ?? [] : []}
+                        // 絞り込みはサーバー側で行うので、クライアント側のフィルタは無効にする
+                        filterOptions={(options) => options}
+                        getOptionLabel={(option) => `${option.name}${option.unit ? ` (${option.unit.name})` : ''}`}
+                        isOptionEqualToValue={(option, value) => option.id === value.id}
+                        loading={isSearchingProducts}
+                        noOptionsText={debouncedQuery ? 'No matching products' : 'Type to search products'}
+                        size="small"
+                        renderInput={(params) => <TextField {...params} label="Filter by Product" variant="outlined" />}
                     />
+                    <Grid container spacing={2}>
+                        <Grid size={{ xs: 12, sm: 6 }}>
+                            <TextField
+                                select label="Filter by Store"
+                                variant="outlined" size="small" fullWidth
+                                value={filterStoreId} onChange={handleFilterStoreChange}
+                            >
+                                <MenuItem value=""><em>All stores</em></MenuItem>
+                                {stores?.map(store => (
+                                    <MenuItem key={store.id} value={store.id}>
+                                        {store.name} {store.location ? `(${store.location})` : ''}
+                                    </MenuItem>
+                                ))}
+                            </TextField>
+                        </Grid>
+                        <Grid size={{ xs: 12, sm: 6 }}>
+                            <TextField
+                                select label="Filter by Category"
+                                variant="outlined" size="small" fullWidth
+                                value={filterCategoryId} onChange={handleFilterCategoryChange}
+                            >
+                                <MenuItem value=""><em>All categories</em></MenuItem>
+                                {categories?.map(category => (
+                                    <MenuItem key={category.id} value={category.id}>{category.name}</MenuItem>
+                                ))}
+                            </TextField>
+                        </Grid>
+                    </Grid>
                     <Grid container spacing={2}>
                         <Grid size={{ xs: 12, sm: 6 }}>
                             <TextField
@@ -201,7 +242,7 @@ const ShoppingRecordListPage: React.FC = () => {
 
             {(!records) ? (
                 <Typography>Loading data or no records available.</Typography>
-            ) : (!filteredRecords || filteredRecords.length === 0) ? (
+            ) : records.length === 0 ? (
                 <Typography>No records match your filter criteria.</Typography>
             ) : (
                 <Paper sx={{ width: '100%', overflow: 'hidden' }}>
@@ -219,7 +260,7 @@ const ShoppingRecordListPage: React.FC = () => {
                                 </TableRow>
                             </TableHead>
                             <TableBody>
-                                {paginatedRecords.map((record) => (
+                                {records.map((record) => (
                                     <TableRow hover key={record.id} sx={{ '&:last-child td, &:last-child th': { border: 0 } }}>
                                         <TableCell component="th" scope="row">{record.id}</TableCell>
                                         <TableCell>{record.product?.name ?? 'N/A'}</TableCell>
@@ -241,27 +282,29 @@ const ShoppingRecordListPage: React.FC = () => {
                                         </TableCell>
                                     </TableRow>
                                 ))}
-                                {paginatedRecords.length === 0 && page > 0 && (
-                                    <TableRow style={{ height: 53 * (rowsPerPage > 0 ? rowsPerPage : 1) }}>
-                                        <TableCell colSpan={7} align="center">
-                                            No results found on this page.
-                                        </TableCell>
-                                    </TableRow>
-                                )}
                             </TableBody>
                         </Table>
                     </TableContainer>
-                    <TablePagination
-                        rowsPerPageOptions={[5, 10, 25, 50, { label: 'All', value: -1 }]}
-                        component="div"
-                        count={filteredRecords?.length || 0}
-                        rowsPerPage={rowsPerPage}
-                        page={page}
-                        onPageChange={handleChangePage}
-                        onRowsPerPageChange={handleChangeRowsPerPage}
-                    />
                 </Paper>
             )}
+            {/* 件数を数えないカーソルページネーションなので、前後のページへの移動だけを提供する */}
+            <Box sx={{ display: 'flex', justifyContent: 'flex-end', alignItems: 'center', gap: 2, mt: 1 }}>
+                <TextField
+                    select label="Rows per page" size="small"
+                    value={rowsPerPage} onChange={handleChangeRowsPerPage}
+                    sx={{ width: 140 }}
+                >
+                    {[10, 25, 50, 100].map((size) => (
+                        <MenuItem key={size} value={size}>{size}</MenuItem>
+                    ))}
+                </TextField>
+                <Button onClick={() => setCursor(data?.previous ?? null)} disabled={!data?.previous || isFetching}>
+                    Previous
+                </Button>
+                <Button onClick={() => setCursor(data?.next ?? null)} disabled={!data?.next || isFetching}>
+                    Next
+                </Button>
+            </Box>
 
             {/* 確認ダイアログのレンダリング */}
             {recordToDelete && (